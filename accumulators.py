@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Streaming accumulators that summarize Monte Carlo samples chunk by chunk.
+"""
+
+import math
+
+import numpy as np
+
+
+class RunningStats:
+    """
+    Mean and variance of a stream of samples, updated one chunk at a time with the
+    pairwise update of Chan et al. such that partial results can be merged.
+
+    Attributes:
+        count (int): Number of samples seen.
+        mean (float): Mean of the samples.
+        m2 (float): Sum of squared deviations from the mean.
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        """
+        Constructs an (empty) accumulator.
+        """
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, samples):
+        """
+        Adds a chunk of samples.
+
+        Args:
+            samples (np.array): New samples.
+        """
+        samples = np.asarray(samples)
+        n = samples.size
+        if n == 0:
+            return
+        mean = float(np.mean(samples, dtype=np.float64))
+        m2 = float(np.sum((samples - mean) ** 2, dtype=np.float64))
+        self.merge(RunningStats(n, mean, m2))
+
+    def merge(self, other):
+        """
+        Adds the samples summarized by another accumulator.
+
+        Args:
+            other (RunningStats): Accumulator of other samples.
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    def variance(self):
+        """
+        Returns the (population) variance of the samples.
+        """
+        return self.m2 / self.count if self.count else 0.0
+
+    def std_error(self):
+        """
+        Returns the standard error of the mean.
+        """
+        return math.sqrt(self.variance() / self.count) if self.count else 0.0
+
+    def to_dict(self):
+        """
+        Returns the state as a plain dict (for checkpoints and messages).
+        """
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Restores an accumulator from the output of to_dict.
+        """
+        return cls(state["count"], state["mean"], state["m2"])
+
+
+class RunningCovariance:
+    """
+    Means and covariance matrix of a stream of sample vectors, updated one chunk
+    at a time with the pairwise update of Chan et al.
+
+    Attributes:
+        count (int): Number of samples seen.
+        mean (np.array): Mean of every variable.
+        m2 (np.array): Matrix of summed cross deviations from the means.
+    """
+
+    def __init__(self, dims, count=0, mean=None, m2=None):
+        """
+        Constructs an (empty) accumulator of dims variables.
+        """
+        self.count = count
+        self.mean = np.zeros(dims) if mean is None else np.asarray(mean, dtype=float)
+        self.m2 = np.zeros((dims, dims)) if m2 is None else np.asarray(m2, dtype=float)
+
+    def update(self, samples):
+        """
+        Adds a chunk of samples.
+
+        Args:
+            samples (np.array): New samples with shape (n, dims).
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        n = samples.shape[0]
+        if n == 0:
+            return
+        mean = samples.mean(axis=0)
+        deviations = samples - mean
+        self.merge(RunningCovariance(self.mean.size, n, mean, deviations.T @ deviations))
+
+    def merge(self, other):
+        """
+        Adds the samples summarized by another accumulator.
+
+        Args:
+            other (RunningCovariance): Accumulator of other samples.
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + np.outer(delta, delta) * self.count * other.count / count
+        self.count = count
+
+    def covariance(self):
+        """
+        Returns the (population) covariance matrix of the samples.
+        """
+        return self.m2 / self.count if self.count else np.zeros_like(self.m2)
+
+    def control_variate(self, expectations):
+        """
+        Control variate estimate of the mean of the first variable, with the other
+        variables as controls of known expectation. The optimal coefficients follow
+        from regressing the first variable on the controls.
+
+        Args:
+            expectations (np.array): Known expectations of the controls.
+
+        Returns:
+            float: Controlled estimate of the mean.
+            float: Its standard error.
+            np.array: Optimal coefficients (beta) of the controls.
+        """
+        expectations = np.asarray(expectations, dtype=float)
+        assert expectations.size == self.mean.size - 1, "One expectation per control is required"
+        s_xx = self.m2[1:, 1:]
+        s_xy = self.m2[1:, 0]
+
+        # Without controls the estimate is the plain mean
+        if self.mean.size == 1:
+            beta = np.zeros(0)
+        else:
+            beta = np.linalg.lstsq(s_xx, s_xy, rcond=None)[0]
+
+        estimate = self.mean[0] - beta @ (self.mean[1:] - expectations)
+        residual = max(self.m2[0, 0] - s_xy @ beta, 0.0)
+        dof = max(self.count - beta.size - 1, 1)
+        std_error = math.sqrt(residual / dof / self.count)
+
+        return estimate, std_error, beta
+
+    def to_dict(self):
+        """
+        Returns the state as a plain dict (for checkpoints and messages).
+        """
+        return {"count": self.count, "mean": self.mean.tolist(), "m2": self.m2.tolist()}
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Restores an accumulator from the output of to_dict.
+        """
+        return cls(len(state["mean"]), state["count"], state["mean"], state["m2"])
+
+
+class SamplerStats:
+    """
+    Mean and standard error of the estimator of a NormalSampler over independent chunks
+    of draws. Every chunk is estimated with the estimators of the sampler (stratum means,
+    antithetic pairs or scrambled sequences) and the chunks are weighted by their number
+    of samples. Without a sampler the samples are pooled in RunningStats.
+
+    Attributes:
+        sampler (NormalSampler): Sampler that drew the samples of every update (or None).
+        count (int): Number of samples seen.
+    """
+
+    def __init__(self, sampler=None):
+        """
+        Constructs an (empty) accumulator.
+        """
+        self.sampler = sampler
+        self.stats = RunningStats()
+        self.count = 0
+        self.total = 0.0
+        self.variance_total = 0.0
+
+    def update(self, samples):
+        """
+        Adds the samples computed from the last draw of the sampler.
+
+        Args:
+            samples (np.array): New samples, one per draw.
+        """
+        if self.sampler is None:
+            self.stats.update(samples)
+            self.count = self.stats.count
+            return
+
+        n = len(samples)
+        self.count += n
+        self.total += n * float(self.sampler.mean(samples))
+        self.variance_total += (n * self.sampler.std_error(samples)) ** 2
+
+    @property
+    def mean(self):
+        """
+        Estimate of the mean of the samples.
+        """
+        if self.sampler is None:
+            return self.stats.mean
+        return self.total / self.count if self.count else 0.0
+
+    def std_error(self):
+        """
+        Returns the standard error of the estimate.
+        """
+        if self.sampler is None:
+            return self.stats.std_error()
+        return math.sqrt(self.variance_total) / self.count if self.count else 0.0
+
+
+class QuantileSketch:
+    """
+    KLL sketch of the distribution of a stream of samples. Level h holds items of
+    weight 2^h, full levels are sorted and halved into the next level. The offset
+    of the halving alternates per level instead of being random, such that the
+    sketch does not touch the random stream of the simulation.
+
+    Attributes:
+        k (int): Capacity of the top level, the rank error is of order 1 / k.
+        levels (list): Items per level.
+        offsets (list): Offset of the next halving per level.
+        count (int): Number of samples seen.
+        min (float): Smallest sample.
+        max (float): Largest sample.
+    """
+
+    def __init__(self, k=400, levels=None, offsets=None, count=0, min=math.inf, max=-math.inf):
+        """
+        Constructs an (empty) sketch.
+        """
+        self.k = k
+        self.levels = [np.asarray(level, dtype=float) for level in levels] if levels else [np.empty(0)]
+        self.offsets = list(offsets) if offsets else [0] * len(self.levels)
+        self.count = count
+        self.min = min
+        self.max = max
+
+    def capacity(self, h):
+        """
+        Capacity of level h, lower levels are smaller by a factor 2 / 3 per level.
+        """
+        depth = len(self.levels) - 1 - h
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, samples):
+        """
+        Adds a chunk of samples.
+
+        Args:
+            samples (np.array): New samples.
+        """
+        samples = np.asarray(samples, dtype=float).ravel()
+        if samples.size == 0:
+            return
+        self.count += samples.size
+        self.min = min(self.min, float(samples.min()))
+        self.max = max(self.max, float(samples.max()))
+        self.levels[0] = np.concatenate([self.levels[0], samples])
+        self.compress()
+
+    def merge(self, other):
+        """
+        Adds the samples summarized by another sketch.
+
+        Args:
+            other (QuantileSketch): Sketch of other samples.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+            self.offsets.append(0)
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+
+    def compress(self):
+        """
+        Halves the lowest full level until all items fit into the total capacity.
+        """
+        while self.size() > sum(self.capacity(h) for h in range(len(self.levels))):
+            h = next(h for h in range(len(self.levels)) if self.levels[h].size >= self.capacity(h))
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+                self.offsets.append(0)
+
+            # An odd item stays behind, every other item of the rest moves up
+            level = np.sort(self.levels[h])
+            keep = level.size % 2
+            promoted = level[keep + self.offsets[h]::2]
+            self.offsets[h] = 1 - self.offsets[h]
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            self.levels[h] = level[:keep]
+
+    def weighted_items(self):
+        """
+        Returns the sorted items and their weights.
+        """
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], weights[order]
+
+    def quantile(self, q):
+        """
+        Returns the (approximate) q-quantile(s) of the samples.
+        """
+        items, weights = self.weighted_items()
+        ranks = np.cumsum(weights) / weights.sum()
+        index = np.minimum(np.searchsorted(ranks, q, side="left"), items.size - 1)
+        return items[index]
+
+    def cdf(self, x):
+        """
+        Returns the (approximate) fraction of samples smaller than or equal to x.
+        """
+        items, weights = self.weighted_items()
+        cumulative = np.concatenate([[0.0], np.cumsum(weights)])
+        return cumulative[np.searchsorted(items, x, side="right")] / cumulative[-1]
+
+    def tail_mean(self, q, lower=True):
+        """
+        Returns the (approximate) mean of the samples below the q-quantile (lower tail)
+        or above the (1 - q)-quantile (upper tail), e.g. the expected shortfall.
+        """
+        items, weights = self.weighted_items()
+        if not lower:
+            items, weights = -items[::-1], weights[::-1]
+
+        # The item at the quantile only contributes the part of its weight inside the tail
+        tail = q * weights.sum()
+        inside = np.minimum(weights, np.maximum(tail - (np.cumsum(weights) - weights), 0))
+        mean = np.sum(inside * items) / tail
+        return mean if lower else -mean
+
+    def size(self):
+        """
+        Returns the number of stored items.
+        """
+        return sum(level.size for level in self.levels)
+
+    def to_dict(self):
+        """
+        Returns the state as a plain dict (for checkpoints and messages).
+        """
+        return {"k": self.k, "levels": [level.tolist() for level in self.levels], "offsets": self.offsets,
+                "count": self.count, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Restores a sketch from the output of to_dict.
+        """
+        return cls(state["k"], state["levels"], state["offsets"], state["count"], state["min"], state["max"])
+
+
+class Histogram:
+    """
+    Counts of a stream of samples in fixed, equally wide bins between low and high,
+    with separate counts of the samples below and above the range.
+
+    Attributes:
+        low (float): Lower edge of the first bin.
+        high (float): Upper edge of the last bin.
+        counts (np.array): Counts per bin.
+        underflow (int): Number of samples below low.
+        overflow (int): Number of samples above high.
+    """
+
+    def __init__(self, low, high, bins=100, counts=None, underflow=0, overflow=0):
+        """
+        Constructs an (empty) histogram.
+        """
+        self.low = low
+        self.high = high
+        self.counts = np.zeros(bins, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.underflow = underflow
+        self.overflow = overflow
+
+    def edges(self):
+        """
+        Returns the bin edges.
+        """
+        return np.linspace(self.low, self.high, self.counts.size + 1)
+
+    def update(self, samples):
+        """
+        Adds a chunk of samples.
+
+        Args:
+            samples (np.array): New samples.
+        """
+        samples = np.asarray(samples, dtype=float).ravel()
+        bins = self.counts.size
+        index = np.floor((samples - self.low) * (bins / (self.high - self.low))).astype(np.int64)
+        self.underflow += int(np.count_nonzero(index < 0))
+        self.overflow += int(np.count_nonzero(samples > self.high))
+
+        # Samples equal to high belong to the last bin
+        index[samples == self.high] = bins - 1
+        inside = (index >= 0) & (index < bins)
+        self.counts += np.bincount(index[inside], minlength=bins)
+
+    def merge(self, other):
+        """
+        Adds the counts of another histogram with the same bins.
+
+        Args:
+            other (Histogram): Histogram of other samples.
+        """
+        assert (self.low, self.high, self.counts.size) == (other.low, other.high, other.counts.size), \
+            "Histograms with different bins can not be merged"
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+
+    def quantile(self, q):
+        """
+        Returns the q-quantile(s), interpolated linearly within the bins. Quantiles
+        outside the range are clipped to low or high.
+        """
+        total = self.counts.sum() + self.underflow + self.overflow
+        cumulative = self.underflow + np.concatenate([[0], np.cumsum(self.counts)])
+        return np.interp(np.asarray(q) * total, cumulative, self.edges())
+
+    def to_dict(self):
+        """
+        Returns the state as a plain dict (for checkpoints and messages).
+        """
+        return {"low": self.low, "high": self.high, "counts": self.counts.tolist(),
+                "underflow": self.underflow, "overflow": self.overflow}
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Restores a histogram from the output of to_dict.
+        """
+        counts = state["counts"]
+        return cls(state["low"], state["high"], len(counts), counts, state["underflow"], state["overflow"])
+
+
+class PathSum:
+    """
+    Running arithmetic sum of the prices of every path over the time slices.
+
+    Attributes:
+        total (np.array): Sum of the prices per path.
+        count (int): Number of time slices seen.
+    """
+
+    def __init__(self, paths, every=1):
+        """
+        Constructs the accumulator, only every every-th time slice is summed.
+        """
+        self.total = np.zeros(paths)
+        self.every = every
+        self.count = 0
+        self.slices = 0
+
+    def update(self, prices):
+        """
+        Adds a time slice of prices with shape (paths,).
+        """
+        self.slices += 1
+        if self.slices % self.every == 0:
+            self.total += prices
+            self.count += 1
+
+    def mean(self):
+        """
+        Returns the arithmetic average of every path.
+        """
+        return self.total / self.count
+
+
+class PathLogSum(PathSum):
+    """
+    Running sum of the log prices of every path over the time slices.
+    """
+
+    def update(self, prices):
+        """
+        Adds a time slice of prices with shape (paths,).
+        """
+        self.slices += 1
+        if self.slices % self.every == 0:
+            self.total += np.log(prices)
+            self.count += 1
+
+    def mean(self):
+        """
+        Returns the geometric average of every path.
+        """
+        return np.exp(self.total / self.count)
+
+
+class PathMax:
+    """
+    Running maximum of the prices of every path over the time slices.
+
+    Attributes:
+        value (np.array): Maximum per path.
+    """
+
+    def __init__(self, paths, initial=-math.inf):
+        """
+        Constructs the accumulator, initial includes e.g. the spot price.
+        """
+        self.value = np.full(paths, float(initial))
+
+    def update(self, prices):
+        """
+        Adds a time slice of prices with shape (paths,).
+        """
+        np.maximum(self.value, prices, out=self.value)
+
+
+class PathMin(PathMax):
+    """
+    Running minimum of the prices of every path over the time slices.
+    """
+
+    def __init__(self, paths, initial=math.inf):
+        """
+        Constructs the accumulator, initial includes e.g. the spot price.
+        """
+        super().__init__(paths, initial)
+
+    def update(self, prices):
+        """
+        Adds a time slice of prices with shape (paths,).
+        """
+        np.minimum(self.value, prices, out=self.value)
+
+
+class BarrierMonitor:
+    """
+    Barrier flags of every path over the time slices. With a volatility and time
+    step, the survival probability of the Brownian bridge between two slices is
+    accumulated as well, such that the barrier is monitored continuously.
+
+    Attributes:
+        hit (np.array): Whether the path was beyond the barrier at a slice.
+        survival (np.array): Probability that the path did not cross the barrier.
+    """
+
+    def __init__(self, paths, barrier, S0, up=True, sigma=None, dt=None):
+        """
+        Constructs the monitor of paths starting at S0.
+        """
+        self.barrier = barrier
+        self.up = up
+        self.sigma = sigma
+        self.dt = dt
+        self.previous = np.full(paths, math.log(S0 / barrier))
+        self.hit = np.full(paths, (S0 >= barrier) if up else (S0 <= barrier))
+        self.survival = (~self.hit).astype(float)
+
+    def update(self, prices):
+        """
+        Adds a time slice of prices with shape (paths,).
+        """
+        log_dist = np.log(prices / self.barrier)
+        beyond = log_dist >= 0 if self.up else log_dist <= 0
+        self.hit |= beyond
+
+        # Crossing probability of the Brownian bridge between the two slices
+        if self.sigma is not None:
+            crossing = np.exp(-2 * self.previous * log_dist / (self.sigma ** 2 * self.dt))
+            self.survival *= np.where(self.hit, 0.0, 1 - crossing)
+        else:
+            self.survival *= ~beyond
+        self.previous = log_dist
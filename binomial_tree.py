@@ -10,21 +10,152 @@ Final Project
 
 # Import built-in libs
 import math
+import threading
+from collections import OrderedDict
 
 # Import 3th parties libraries
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy.stats as st
 
-class BinTreeOption:
+# Import own modules
+from memory_planner import check_memory, tree_bytes
+
+# Price trees are shared through a least recently used cache bounded in bytes
+LATTICE_CACHE_BYTES = 2 ** 27
+_lattice_cache = OrderedDict()
+_lattice_lock = threading.RLock()
+
+def price_lattice(N, S0, u, d, trinomial=False, dtype=np.float64):
+    """
+    Stock prices of a binomial (or trinomial) tree, cached by the tree parameters
+    with least recently used eviction. The cache holds at most LATTICE_CACHE_BYTES
+    of trees, larger trees are not cached. The returned tree is read-only since it
+    is shared between options.
+    Input:
+        N = total time steps (integer)
+        S0 = initial stock price (numeric)
+        u, d = up and down movements (numeric)
+        trinomial = trinomial tree with a middle node equal to the previous price
+        dtype = precision of the stored prices (float64 or float32)
+    Output:
+        price tree with layer i in column i
+    """
+    key = (N, S0, u, d, trinomial, np.dtype(dtype).str)
+    with _lattice_lock:
+        if key in _lattice_cache:
+            _lattice_cache.move_to_end(key)
+            return _lattice_cache[key]
+
+    layers = np.arange(N + 1)
+    if trinomial:
+        j = np.arange(2 * N + 1)[:, None]
+        tree = np.where(j <= 2 * layers, S0 * u ** (layers - j), 0.0)
+    else:
+        j = np.arange(N + 1)[:, None]
+        tree = np.where(j <= layers, S0 * (u ** (layers - j)) * (d ** j), 0.0)
+
+    tree = tree.astype(dtype, copy=False)
+    tree.flags.writeable = False
+
+    # Evicts the least recently used trees until the new tree fits the cache
+    if tree.nbytes <= LATTICE_CACHE_BYTES:
+        with _lattice_lock:
+            _lattice_cache[key] = tree
+            while lattice_cache_bytes() > LATTICE_CACHE_BYTES:
+                _lattice_cache.popitem(last=False)
+
+    return tree
+
+
+def lattice_cache_bytes():
+    """
+    Bytes of the price trees kept alive by the lattice cache.
+    """
+    with _lattice_lock:
+        return sum(tree.nbytes for tree in _lattice_cache.values())
+
+
+class TreeLattice:
+    """
+    Lattice setup shared by BinTreeOption and BinTreeChain: the movements and
+    probabilities of the chosen construction and the (cached) price tree.
+    """
+
+    def set_lattice_parameters(self):
+        """
+        Determines the up and down movements and their probabilities
+        for the chosen lattice construction.
+        """
+        growth = np.exp(self.r * self.dt)
+
+        # Cox-Ross-Rubinstein
+        if self.lattice == "crr":
+            self.u = np.exp(self.sigma * np.sqrt(self.dt))
+            self.d = 1 / self.u
+
+        # Leisen-Reimer with the Peizer-Pratt inversion (method 2),
+        # which converges smoothly for an odd number of steps
+        elif self.lattice == "lr":
+            d1 = ((np.log(self.S0 / self.K) + (self.r + 0.5 * self.sigma ** 2) * self.T)
+                  / (self.sigma * np.sqrt(self.T)))
+            d2 = d1 - self.sigma * np.sqrt(self.T)
+            p_star = self.peizer_pratt(d1)
+            self.p = self.peizer_pratt(d2)
+            self.u = growth * p_star / self.p
+            self.d = (growth - self.p * self.u) / (1 - self.p)
+            return
+
+        # Tian, which matches the first three moments
+        elif self.lattice == "tian":
+            v = np.exp(self.sigma ** 2 * self.dt)
+            root = np.sqrt(v ** 2 + 2 * v - 3)
+            self.u = 0.5 * growth * v * (v + 1 + root)
+            self.d = 0.5 * growth * v * (v + 1 - root)
+
+        # Trinomial tree (Boyle) with a middle node equal to the previous price
+        elif self.lattice == "trinomial":
+            self.u = np.exp(self.sigma * np.sqrt(2 * self.dt))
+            self.d = 1 / self.u
+            half_up = np.exp(self.sigma * np.sqrt(0.5 * self.dt))
+            half_growth = np.exp(0.5 * self.r * self.dt)
+            self.pu = ((half_growth - 1 / half_up) / (half_up - 1 / half_up)) ** 2
+            self.pd = ((half_up - half_growth) / (half_up - 1 / half_up)) ** 2
+            self.pm = 1 - self.pu - self.pd
+            return
+
+        self.p = (growth - self.d) / (self.u - self.d)
+
+    def peizer_pratt(self, z):
+        """
+        Peizer-Pratt inversion of the normal distribution for N steps.
+        """
+        n = self.N
+        ratio = z / (n + 1 / 3 + 0.1 / (n + 1))
+        return 0.5 + np.sign(z) * np.sqrt(0.25 - 0.25 * np.exp(-ratio ** 2 * (n + 1 / 6)))
+
+    def create_price_tree(self):
+        """
+        Determines stock price at every time step. The tree only depends on the
+        movements and the spot price, so it is shared through the lattice cache.
+        """
+        self.price_tree = price_lattice(
+            self.N, self.S0, self.u, self.d, self.lattice == "trinomial", self.dtype
+        )
+
+
+class BinTreeOption(TreeLattice):
     def __init__(
         self, N, T, S0, sigma, r, K,
-        market="EU", option_type="call", array_out=False
+        market="EU", option_type="call", array_out=False,
+        lattice="crr", richardson=False, theoretical_delta=True,
+        dtype=np.float64
     ):
         """
         OOP representation of a binomial option tree.
         Input:
-            N = total time steps (integer)
+            N = total time steps (integer, rounded up to an odd number
+                for Leisen-Reimer trees)
             T =  maturity option in years (numeric)
             S0 = initial stock price (numeric)
             r = risk-free rate (numeric)
@@ -32,12 +163,21 @@ class BinTreeOption:
             market = market type (EU or USA)
             option_type = determines option type (call or put)
             array_out = False gives only resulting values, True gives full trees
+            lattice = tree construction (crr, lr, tian or trinomial)
+            richardson = extrapolates price and delta from N and N / 2 steps
+            theoretical_delta = False skips the theoretical hedging tree
+            dtype = precision of the stored trees (float32 halves their memory,
+                    every layer is still computed in float64)
         Output:
             returns an object representation with an already created price 
             tree. It also contains methods to determine option price 
             development and the hedging strategy
         """
 
+        # Leisen-Reimer trees only converge smoothly for an odd number of steps
+        if lattice.lower() == "lr" and N % 2 == 0:
+            N += 1
+
         # Init
         self.N = N
         self.T = T
@@ -48,35 +188,40 @@ class BinTreeOption:
         self.market = market.upper()
         self.option_type = option_type.lower()
         self.array_out = array_out
+        self.lattice = lattice.lower()
+        self.richardson = richardson
+        self.theoretical_delta = theoretical_delta
+        self.dtype = np.dtype(dtype)
 
-        # Checks if market type and option type are valid
+        # Checks if market type, option type and lattice are valid
         assert self.market in ["EU", "USA"], "Market not found. Choose EU or USA"
         assert self.option_type in ["call", "put"], "Non-existing option type."
+        assert self.lattice in ["crr", "lr", "tian", "trinomial"], \
+            "Lattice not found. Choose crr, lr, tian or trinomial"
 
         # Setup parameters for movements binomial tree
         self.dt = T / N
-        self.u = np.exp(sigma * np.sqrt(self.dt))
-        self.d = 1 / self.u
-        self.p = (np.exp(r * self.dt) - self.d) / (self.u - self.d)
         self.discount = np.exp(-r * self.dt)
+        self.set_lattice_parameters()
 
-        # Create price tree and initialize option tree
-        self.price_tree = np.zeros((N + 1, N + 1))
+        # A trinomial tree has 2 * i + 1 nodes in layer i
+        nodes = 2 * N + 1 if self.lattice == "trinomial" else N + 1
+
+        # Refuse trees that do not fit the memory budget (next to the cached price
+        # trees) before allocating them
+        check_memory(
+            tree_bytes(N, self.lattice, self.dtype) + lattice_cache_bytes(),
+            f"BinTreeOption with N = {N} steps"
+        )
+
+        # Create (or reuse a cached) price tree and initialize option tree
         self.create_price_tree()
-        self.option = np.zeros((N + 1, N + 1))
+        self.option = np.zeros((nodes, N + 1), dtype=self.dtype)
+        self.priced = False
 
         # Create hedging tree and theoretical hedging tree
-        self.delta = np.zeros((N, N))
-        self.t_delta = np.zeros((N, N))
-
-    def create_price_tree(self):
-        """
-        Determines stock price at every time step.
-        """
-        for i in range(self.N + 1):
-            for j in range(i + 1):
-                self.price_tree[j, i] = self.S0 * \
-                    (self.u ** (i - j)) * (self.d ** j)
+        self.delta = np.zeros((nodes - 1, N), dtype=self.dtype)
+        self.t_delta = np.zeros((nodes - 1, N), dtype=self.dtype)
 
     def determine_price(self):
         """
@@ -84,9 +229,14 @@ class BinTreeOption:
         depending on the option type and market.
         """
 
+        # Sets option price at maturity and apply the vectorized scheme
+        # for every option of a trinomial tree
+        if self.lattice == "trinomial":
+            self.recursive_trinomial()
+
         # Sets option price at maturity and apply recursive scheme 
         # for European call option
-        if self.market == "EU" and self.option_type == "call":
+        elif self.market == "EU" and self.option_type == "call":
             self.option[:, self.N] = np.maximum(
                 np.zeros(self.N + 1), self.price_tree[:, self.N] - self.K
             )
@@ -115,18 +265,87 @@ class BinTreeOption:
                 np.zeros(self.N + 1), self.K - self.price_tree[:, self.N])
             self.recursive_usa_put()
 
+        self.priced = True
+        price, delta = self.option[0, 0], self.delta[0, 0]
+        if self.richardson:
+            price, delta = self.extrapolate(price, delta)
+
         # Ensures full output is given if asked by user. 
         # Otherwise it only returns the variables of interest at the spot time.
         if self.array_out and self.market == "EU":
-            return [self.option[0, 0], self.delta[0, 0], self.t_delta[0, 0],
+            return [price, delta, self.t_delta[0, 0],
                     self.price_tree, self.option, self.delta, self.t_delta]
         elif self.array_out and self.market == "USA":
-            return [self.option[0, 0], self.delta[0, 0], 
+            return [price, delta, 
                     self.price_tree, self.option, self.delta]
         elif not self.array_out and self.market == "EU":
-            return self.option[0, 0], self.delta[0, 0], self.t_delta[0, 0]
+            return price, delta, self.t_delta[0, 0]
         
-        return self.option[0, 0], self.delta[0, 0]
+        return price, delta
+
+    def greeks(self):
+        """
+        Determines delta, gamma and theta from the first layers of a single
+        backward induction (the option price is determined if not done yet).
+        Output:
+            delta, gamma and theta at spot time
+        """
+        assert self.N >= 2, "At least two time steps are required"
+        if not self.priced:
+            self.determine_price()
+
+        S, V = self.price_tree, self.option
+
+        # A trinomial tree has all required nodes in its first layer
+        if self.lattice == "trinomial":
+            delta = (V[0, 1] - V[2, 1]) / (S[0, 1] - S[2, 1])
+            delta_up = (V[0, 1] - V[1, 1]) / (S[0, 1] - S[1, 1])
+            delta_down = (V[1, 1] - V[2, 1]) / (S[1, 1] - S[2, 1])
+            gamma = (delta_up - delta_down) / (0.5 * (S[0, 1] - S[2, 1]))
+            theta = (V[1, 1] - V[0, 0]) / self.dt
+
+            return delta, gamma, theta
+
+        delta = (V[0, 1] - V[1, 1]) / (S[0, 1] - S[1, 1])
+        delta_up = (V[0, 2] - V[1, 2]) / (S[0, 2] - S[1, 2])
+        delta_down = (V[1, 2] - V[2, 2]) / (S[1, 2] - S[2, 2])
+        gamma = (delta_up - delta_down) / (0.5 * (S[0, 2] - S[2, 2]))
+
+        # The middle node of the second layer only equals the spot price for
+        # CRR trees, so correct for the price move with delta and gamma
+        move = S[1, 2] - self.S0
+        theta = (V[1, 2] - V[0, 0] - delta * move - 0.5 * gamma * move ** 2) / (2 * self.dt)
+
+        return delta, gamma, theta
+
+    def extrapolate(self, price, delta):
+        """
+        Two-point Richardson extrapolation of price and delta with a tree
+        of (about) half the number of steps. European Leisen-Reimer trees
+        converge with order 2, American options and the other lattices with
+        order 1 (the oscillations of CRR trees limit the gain).
+        """
+        order = 2 if self.lattice == "lr" and self.market == "EU" else 1
+        N_coarse = self.N // 2
+
+        # Leisen-Reimer trees require an odd number of steps
+        if self.lattice == "lr" and N_coarse % 2 == 0:
+            N_coarse += 1
+
+        coarse = BinTreeOption(
+            N_coarse, self.T, self.S0, self.sigma, self.r, self.K,
+            self.market, self.option_type, lattice=self.lattice,
+            theoretical_delta=False, dtype=self.dtype
+        )
+        coarse.determine_price()
+
+        weight_fine, weight_coarse = self.N ** order, N_coarse ** order
+        price = ((weight_fine * price - weight_coarse * coarse.option[0, 0])
+                 / (weight_fine - weight_coarse))
+        delta = ((weight_fine * delta - weight_coarse * coarse.delta[0, 0])
+                 / (weight_fine - weight_coarse))
+
+        return price, delta
 
     def recursive_eu_call(self):
         """
@@ -141,18 +360,20 @@ class BinTreeOption:
             t -= self.dt
 
             # Determines option price, hedging strategy and theoretical hedging 
-            # strartegy for each node in current layer
-            for j in np.arange(0, i + 1):
-                self.option[j, i] = (self.discount * (self.p *
-                                                      self.option[j, i + 1] + (1 - self.p) *
-                                                      self.option[j + 1, i + 1]))
-
-                self.delta[j, i] = ((self.option[j, i + 1] -
-                                     self.option[j + 1, i + 1]) /
-                                    (self.price_tree[j, i + 1] -
-                                     self.price_tree[j + 1, i + 1]))
+            # strartegy for all nodes in current layer at once
+            self.option[:i + 1, i] = (self.discount * (self.p *
+                                                       self.option[:i + 1, i + 1] + (1 - self.p) *
+                                                       self.option[1:i + 2, i + 1]))
+
+            self.delta[:i + 1, i] = ((self.option[:i + 1, i + 1] -
+                                      self.option[1:i + 2, i + 1]) /
+                                     (self.price_tree[:i + 1, i + 1] -
+                                      self.price_tree[1:i + 2, i + 1]))
+
+            # The theoretical delta only depends on the time of the layer
+            if self.theoretical_delta:
                 d1 = (np.log(self.S0 / self.K) + (self.r + 0.5 * self.sigma ** 2) * (self.T - t)) / (self.sigma * np.sqrt(self.T - t))
-                self.t_delta[j, i] = st.norm.cdf(d1, 0.0, 1.0)
+                self.t_delta[:i + 1, i] = st.norm.cdf(d1, 0.0, 1.0)
                 
     def recursive_eu_put(self):
         """
@@ -167,19 +388,20 @@ class BinTreeOption:
             t -= self.dt
 
             # Determines option price, hedging strategy and theoretical hedging
-            # strartegy for each node in current layer
-            for j in np.arange(0, i + 1):
-                self.option[j, i] = (self.discount * (self.p *
-                                                      self.option[j, i + 1] + (1 - self.p) *
-                                                      self.option[j + 1, i + 1]))
-
-                self.delta[j, i] = ((self.option[j, i + 1] -
-                                     self.option[j + 1, i + 1]) /
-                                    (self.price_tree[j, i + 1] -
-                                     self.price_tree[j + 1, i + 1]))
-                
+            # strartegy for all nodes in current layer at once
+            self.option[:i + 1, i] = (self.discount * (self.p *
+                                                       self.option[:i + 1, i + 1] + (1 - self.p) *
+                                                       self.option[1:i + 2, i + 1]))
+
+            self.delta[:i + 1, i] = ((self.option[:i + 1, i + 1] -
+                                      self.option[1:i + 2, i + 1]) /
+                                     (self.price_tree[:i + 1, i + 1] -
+                                      self.price_tree[1:i + 2, i + 1]))
+
+            # The theoretical delta only depends on the time of the layer
+            if self.theoretical_delta:
                 d1 = (np.log(self.S0 / self.K) + (self.r + 0.5 * self.sigma ** 2) * (self.T - t)) / (self.sigma * np.sqrt(self.T - t))
-                self.t_delta[j, i] = -st.norm.cdf(-d1, 0.0, 1.0)
+                self.t_delta[:i + 1, i] = -st.norm.cdf(-d1, 0.0, 1.0)
 
     def recursive_usa_call(self):
         """
@@ -190,17 +412,17 @@ class BinTreeOption:
         for i in np.arange(self.N - 1, -1, -1):
 
             # Determines option price and hedging strategy
-            # for each node in current layer
-            for j in np.arange(0, i + 1):
-                self.option[j, i] = max([0, self.price_tree[j, i] - self.K,
-                                         self.discount *
-                                         (self.p * self.option[j, i + 1] +
-                                          (1 - self.p) * self.option[j + 1, i + 1])])
-
-                self.delta[j, i] = ((self.option[j, i + 1] -
-                                     self.option[j + 1, i + 1]) /
-                                    (self.price_tree[j, i + 1] -
-                                     self.price_tree[j + 1, i + 1]))
+            # for all nodes in current layer at once
+            self.option[:i + 1, i] = np.maximum(
+                np.maximum(0, self.price_tree[:i + 1, i] - self.K),
+                self.discount *
+                (self.p * self.option[:i + 1, i + 1] +
+                 (1 - self.p) * self.option[1:i + 2, i + 1]))
+
+            self.delta[:i + 1, i] = ((self.option[:i + 1, i + 1] -
+                                      self.option[1:i + 2, i + 1]) /
+                                     (self.price_tree[:i + 1, i + 1] -
+                                      self.price_tree[1:i + 2, i + 1]))
 
     def recursive_usa_put(self):
         """
@@ -211,17 +433,164 @@ class BinTreeOption:
         for i in np.arange(self.N - 1, -1, -1):
 
             # Determines option price and hedging strategy
-            # for each node in current layer
-            for j in np.arange(0, i + 1):
-                self.option[j, i] = max([0, self.K - self.price_tree[j, i],
-                                         self.discount *
-                                         (self.p * self.option[j, i + 1] +
-                                          (1 - self.p) * self.option[j + 1, i + 1])])
-                self.delta[j, i] = ((self.option[j, i + 1] -
-                                     self.option[j + 1, i + 1]) /
-                                    (self.price_tree[j, i + 1] -
-                                     self.price_tree[j + 1, i + 1]))
-                                     
+            # for all nodes in current layer at once
+            self.option[:i + 1, i] = np.maximum(
+                np.maximum(0, self.K - self.price_tree[:i + 1, i]),
+                self.discount *
+                (self.p * self.option[:i + 1, i + 1] +
+                 (1 - self.p) * self.option[1:i + 2, i + 1]))
+            self.delta[:i + 1, i] = ((self.option[:i + 1, i + 1] -
+                                      self.option[1:i + 2, i + 1]) /
+                                     (self.price_tree[:i + 1, i + 1] -
+                                      self.price_tree[1:i + 2, i + 1]))
+
+    def recursive_trinomial(self):
+        """
+        Vectorized recursive scheme of a trinomial tree for European and
+        American calls and puts.
+        """
+
+        # Sign turns the exercise value of a call into the one of a put
+        sign = 1 if self.option_type == "call" else -1
+        self.option[:, self.N] = np.maximum(
+            0, sign * (self.price_tree[:, self.N] - self.K)
+        )
+
+        # Time starts at maturity (only necessary for theoretical hedging)
+        t = self.T
+
+        # Start scheme
+        for i in np.arange(self.N - 1, -1, -1):
+            t -= self.dt
+            nodes = 2 * i + 1
+            option_next = self.option[:nodes + 2, i + 1]
+            price_next = self.price_tree[:nodes + 2, i + 1]
+
+            # Determines option price and hedging strategy for the whole layer
+            self.option[:nodes, i] = self.discount * (
+                self.pu * option_next[:-2] + self.pm * option_next[1:-1] +
+                self.pd * option_next[2:]
+            )
+            if self.market == "USA":
+                self.option[:nodes, i] = np.maximum(
+                    self.option[:nodes, i],
+                    sign * (self.price_tree[:nodes, i] - self.K)
+                )
+
+            self.delta[:nodes, i] = ((option_next[:-2] - option_next[2:]) /
+                                     (price_next[:-2] - price_next[2:]))
+
+            # Theoretical hedging strategy
+            if self.market == "EU" and self.theoretical_delta:
+                d1 = (np.log(self.S0 / self.K) + (self.r + 0.5 * self.sigma ** 2) * (self.T - t)) / (self.sigma * np.sqrt(self.T - t))
+                self.t_delta[:nodes, i] = sign * st.norm.cdf(sign * d1, 0.0, 1.0)
+
+
+class BinTreeChain(TreeLattice):
+    def __init__(
+        self, N, T, S0, sigma, r, strikes,
+        market="EU", option_types="call", lattice="crr", dtype=np.float64
+    ):
+        """
+        Batched representation of a chain of options on the same underlying,
+        priced in a single backward induction over a (options, nodes) array.
+        Input:
+            N = total time steps (integer, rounded up to an odd number
+                for Leisen-Reimer trees)
+            T =  maturity option in years (numeric)
+            S0 = initial stock price (numeric)
+            r = risk-free rate (numeric)
+            strikes = strike prices of the options (array)
+            market = market type (EU or USA)
+            option_types = call, put or an array with the type of every option
+            lattice = tree construction (crr, lr, tian or trinomial)
+            dtype = precision of the shared price tree (float64 or float32)
+        Output:
+            returns an object representation of the chain. Except for
+            Leisen-Reimer trees, whose movements depend on the strike, all
+            options share one (cached) price tree
+        """
+
+        # Leisen-Reimer trees only converge smoothly for an odd number of steps
+        if lattice.lower() == "lr" and N % 2 == 0:
+            N += 1
+
+        # Init
+        self.N = N
+        self.T = T
+        self.S0 = S0
+        self.sigma = sigma
+        self.r = r
+        self.K = np.atleast_1d(np.asarray(strikes, dtype=float))
+        self.market = market.upper()
+        self.lattice = lattice.lower()
+        self.dtype = np.dtype(dtype)
+        option_types = np.broadcast_to(np.char.lower(np.asarray(option_types, dtype=str)), self.K.shape)
+        self.sign = np.where(option_types == "call", 1.0, -1.0)
+
+        # Checks if market type, option types and lattice are valid
+        assert self.market in ["EU", "USA"], "Market not found. Choose EU or USA"
+        assert np.all(np.isin(option_types, ["call", "put"])), "Non-existing option type."
+        assert self.lattice in ["crr", "lr", "tian", "trinomial"], \
+            "Lattice not found. Choose crr, lr, tian or trinomial"
+
+        # Setup parameters for movements of the tree, per option for Leisen-Reimer
+        self.dt = T / N
+        self.discount = np.exp(-r * self.dt)
+        self.set_lattice_parameters()
+
+        self.price_tree = None
+        if self.lattice != "lr":
+            self.create_price_tree()
+
+    def layer_prices(self, i):
+        """
+        Stock prices of layer i, shape (1, nodes) for a shared tree and
+        (options, nodes) for Leisen-Reimer trees.
+        """
+        if self.price_tree is not None:
+            nodes = 2 * i + 1 if self.lattice == "trinomial" else i + 1
+            return self.price_tree[None, :nodes, i]
+
+        j = np.arange(i + 1)
+        return self.S0 * (self.u[:, None] ** (i - j)) * (self.d[:, None] ** j)
+
+    def determine_price(self):
+        """
+        Determines the prices and deltas of all options of the chain at once.
+        Output:
+            prices and deltas at spot time (arrays with one value per option)
+        """
+        sign, K = self.sign[:, None], self.K[:, None]
+        trinomial = self.lattice == "trinomial"
+
+        # Probabilities per option as columns, such that they broadcast over the nodes
+        if trinomial:
+            pu, pm, pd = self.pu, self.pm, self.pd
+        else:
+            p = self.p[:, None] if np.ndim(self.p) else self.p
+
+        option = np.maximum(0, sign * (self.layer_prices(self.N) - K))
+        for i in np.arange(self.N - 1, -1, -1):
+
+            # The delta at spot time follows from the first layer
+            if i == 0:
+                S = self.layer_prices(1)
+                self.deltas = ((option[:, 0] - option[:, -1]) /
+                               (S[:, 0] - S[:, -1]))
+
+            if trinomial:
+                option = self.discount * (pu * option[:, :-2] + pm * option[:, 1:-1] + pd * option[:, 2:])
+            else:
+                option = self.discount * (p * option[:, :-1] + (1 - p) * option[:, 1:])
+
+            if self.market == "USA":
+                option = np.maximum(option, sign * (self.layer_prices(i) - K))
+
+        self.prices = option[:, 0]
+        self.priced = True
+
+        return self.prices, self.deltas
 
 
 class BlackScholes:
@@ -264,14 +633,24 @@ class BlackScholes:
 
         return put
 
+    def vega(self, t=0):
+        """
+        Sensitivity of the call and put price to the volatility.
+        """
+        d1 = (np.log(self.S0 / self.K) + (self.r + 0.5 * self.sigma ** 2)
+              * (self.T - t)) / (self.sigma * np.sqrt(self.T - t))
+
+        return self.S0 * st.norm.pdf(d1, 0.0, 1.0) * np.sqrt(self.T - t)
+
     def asian_call_price(self, t=0) :
         """
+        Geometric average Asian call, averaged over the prices at t_1, ..., t_N.
         """
         N = self.steps
         sigma = self.sigma * np.sqrt(((N + 1) * (2 * N + 1)) / (6 * N ** 2))
-        b = ((N + 1) / (2 * N)) * (self.r - 0.5 * (sigma ** 2))
+        b = ((N + 1) / (2 * N)) * (self.r - 0.5 * (self.sigma ** 2)) + 0.5 * sigma ** 2
 
-        d1 = ((np.log(self.K / self.S0) + (b + 0.5 * self.sigma ** 2) * (self.T - t)) /
+        d1 = ((np.log(self.S0 / self.K) + (b + 0.5 * sigma ** 2) * (self.T - t)) /
               (sigma * np.sqrt(self.T - t)))
 
         d2 = d1 - sigma * np.sqrt(self.T - t)
@@ -283,12 +662,13 @@ class BlackScholes:
 
     def asian_put_price(self, t=0) :
         """
+        Geometric average Asian put, averaged over the prices at t_1, ..., t_N.
         """
         N = self.steps
         sigma = self.sigma * np.sqrt(((N + 1) * (2 * N + 1)) / (6 * N ** 2))
-        b = ((N + 1) / (2 * N)) * (self.r - 0.5 * (sigma ** 2))
+        b = ((N + 1) / (2 * N)) * (self.r - 0.5 * (self.sigma ** 2)) + 0.5 * sigma ** 2
 
-        d1 = ((np.log(self.K / self.S0) + (b + 0.5 * sigma ** 2) * (self.T - t)) /
+        d1 = ((np.log(self.S0 / self.K) + (b + 0.5 * sigma ** 2) * (self.T - t)) /
               (sigma * np.sqrt(self.T - t)))
 
         d2 = d1 - (sigma * np.sqrt(self.T - t))
@@ -351,6 +731,36 @@ class BlackScholes:
         # return profit made during the hedging
         return profit
     
+    def hedge_pnl_vectorized(self, random_numbers, hedge_setting='call'):
+        """
+        Profit of delta hedging a sold option on a batch of exact price paths.
+        The premium is put in the bank, the hedge is rebalanced at the start of every
+        interval and at maturity the position is sold and the payoff paid.
+        Input:
+            random_numbers = standard normal draws of shape (paths, hedge steps)
+            hedge_setting = call or put
+        Output:
+            profit of every path with shape (paths,)
+        """
+        paths, steps = random_numbers.shape
+        dt = self.T / steps
+        growth = math.exp(self.r * dt)
+        call = hedge_setting.lower() == 'call'
+
+        S = np.full(paths, float(self.S0))
+        bank = np.full(paths, self.call_price() if call else self.put_price())
+        previous_delta = np.zeros(paths)
+
+        for j in range(steps):
+            delta = self.hedge(j * dt, S, hedge_setting)
+            bank -= (delta - previous_delta) * S
+            bank *= growth
+            previous_delta = delta
+            S *= np.exp((self.r - 0.5 * self.sigma ** 2) * dt + self.sigma * math.sqrt(dt) * random_numbers[:, j])
+
+        payoff = np.maximum(S - self.K, 0) if call else np.maximum(self.K - S, 0)
+        return bank + previous_delta * S - payoff
+
     def plot_price_path(self, hedge_plot=True):
         '''
         Eneables to plot both price path and delta over time
@@ -396,12 +806,163 @@ class BlackScholes:
             return st.norm.cdf(d1, 0.0, 1.0)
 
         elif hedge_setting.lower() == 'put':
-            return -st.norm.cdf(d1, 0.0, 1.0)
+            return st.norm.cdf(d1, 0.0, 1.0) - 1
         else:
             print("Setting not found")
             return None
 
 
+class BarrierOption:
+    def __init__(self, T, S0, K, r, sigma, barrier, barrier_type="down-and-out", option_type="call"):
+        """
+        Closed form of single barrier options without rebate (Reiner and Rubinstein).
+        Input:
+            T = maturity option in years (numeric)
+            S0 = initial stock price (numeric)
+            K = strike price option (numeric)
+            r = risk-free rate (numeric)
+            sigma = volatility (numeric)
+            barrier = barrier level (numeric)
+            barrier_type = down-and-out, down-and-in, up-and-out or up-and-in
+            option_type = call or put
+        """
+        self.T = T
+        self.S0 = S0
+        self.K = K
+        self.r = r
+        self.sigma = sigma
+        self.barrier = barrier
+        self.barrier_type = barrier_type.lower()
+        self.option_type = option_type.lower()
+        assert self.barrier_type in ["down-and-out", "down-and-in", "up-and-out", "up-and-in"], \
+            "Barrier type not found."
+        assert self.option_type in ["call", "put"], "Non-existing option type."
+
+    def price(self, barrier=None):
+        """
+        Price of the continuously monitored barrier option.
+        """
+        H = self.barrier if barrier is None else barrier
+        S, K, T, r, sigma = self.S0, self.K, self.T, self.r, self.sigma
+        down = self.barrier_type.startswith("down")
+        knock_in = self.barrier_type.endswith("in")
+        phi = 1 if self.option_type == "call" else -1
+        eta = 1 if down else -1
+
+        # An option that starts beyond its barrier is knocked in (or out) at once
+        vanilla = BlackScholes(T, S, K, r, sigma)
+        vanilla = vanilla.call_price() if phi == 1 else vanilla.put_price()
+        if (down and S <= H) or (not down and S >= H):
+            return vanilla if knock_in else 0.0
+
+        vol = sigma * np.sqrt(T)
+        mu = (r - 0.5 * sigma ** 2) / sigma ** 2
+        x1 = np.log(S / K) / vol + (1 + mu) * vol
+        x2 = np.log(S / H) / vol + (1 + mu) * vol
+        y1 = np.log(H ** 2 / (S * K)) / vol + (1 + mu) * vol
+        y2 = np.log(H / S) / vol + (1 + mu) * vol
+
+        # Building blocks of all eight barrier options
+        N = st.norm.cdf
+        discount = np.exp(-r * T)
+        A = phi * S * N(phi * x1) - phi * K * discount * N(phi * x1 - phi * vol)
+        B = phi * S * N(phi * x2) - phi * K * discount * N(phi * x2 - phi * vol)
+        C = (phi * S * (H / S) ** (2 * (mu + 1)) * N(eta * y1) -
+             phi * K * discount * (H / S) ** (2 * mu) * N(eta * y1 - eta * vol))
+        D = (phi * S * (H / S) ** (2 * (mu + 1)) * N(eta * y2) -
+             phi * K * discount * (H / S) ** (2 * mu) * N(eta * y2 - eta * vol))
+
+        # Knock-in prices, knock-out prices follow from in-out parity
+        above = K > H
+        if phi == 1 and down:
+            price_in = C if above else A - B + D
+        elif phi == 1:
+            price_in = A if above else B - C + D
+        elif down:
+            price_in = B - C + D if above else A
+        else:
+            price_in = A - B + D if above else C
+
+        return price_in if knock_in else vanilla - price_in
+
+    def discrete_price(self, monitoring_dates):
+        """
+        Price of the barrier option monitored at equally spaced dates, with the
+        continuity correction of Broadie, Glasserman and Kou: the continuous price
+        with the barrier shifted away from the spot by exp(0.5826 sigma sqrt(dt)).
+        """
+        return self.price(self.shifted_barrier(monitoring_dates))
+
+    def shifted_barrier(self, monitoring_dates):
+        """
+        Barrier of the continuous option that matches the discretely monitored one.
+        """
+        beta = 0.5826
+        sign = 1 if self.barrier_type.startswith("up") else -1
+        return self.barrier * np.exp(sign * beta * self.sigma * np.sqrt(self.T / monitoring_dates))
+
+
+class MertonJumpDiffusion:
+    def __init__(self, T, S0, K, r, sigma, lam, mu_j, sigma_j, n_terms=50):
+        """
+        Closed form of the Merton (1976) jump-diffusion model with lognormal jumps.
+        Input:
+            T = maturity option in years (numeric)
+            S0 = initial stock price (numeric)
+            K = strike price option (numeric)
+            r = risk-free rate (numeric)
+            sigma = volatility of the diffusion (numeric)
+            lam = jump intensity per year (numeric)
+            mu_j = mean of the log jump size (numeric)
+            sigma_j = standard deviation of the log jump size (numeric)
+            n_terms = number of terms of the Poisson series (integer)
+        """
+        self.T = T
+        self.S0 = S0
+        self.K = K
+        self.r = r
+        self.sigma = sigma
+        self.lam = lam
+        self.mu_j = mu_j
+        self.sigma_j = sigma_j
+        self.n_terms = n_terms
+
+        # Expected relative jump size and jump intensity under the adjusted measure
+        self.kappa = np.exp(mu_j + 0.5 * sigma_j ** 2) - 1
+        self.lam_adj = lam * (1 + self.kappa)
+
+    def series(self):
+        """
+        Poisson weights, rates and volatilities of the Black Scholes terms
+        conditional on n = 0, ..., n_terms - 1 jumps.
+        """
+        n = np.arange(self.n_terms)
+        weights = st.poisson.pmf(n, self.lam_adj * self.T)
+        r_n = (self.r - self.lam * self.kappa
+               + n * np.log(1 + self.kappa) / self.T)
+        sigma_n = np.sqrt(self.sigma ** 2 + n * self.sigma_j ** 2 / self.T)
+
+        return weights, r_n, sigma_n
+
+    def call_price(self):
+        """
+        Weighted sum of Black Scholes call prices.
+        """
+        weights, r_n, sigma_n = self.series()
+        bs = BlackScholes(self.T, self.S0, self.K, r_n, sigma_n)
+
+        return np.sum(weights * bs.call_price())
+
+    def put_price(self):
+        """
+        Weighted sum of Black Scholes put prices.
+        """
+        weights, r_n, sigma_n = self.series()
+        bs = BlackScholes(self.T, self.S0, self.K, r_n, sigma_n)
+
+        return np.sum(weights * bs.put_price())
+
+
 if __name__ == "__main__":
 
     for i in range(1):
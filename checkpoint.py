@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Checkpoints of long Monte Carlo sweeps such that killed jobs can resume
+with bit-identical results.
+"""
+
+import os
+import pickle
+import time
+
+import numpy as np
+
+
+class Checkpoint:
+    """
+    Stores completed grid points, the accumulator of the grid point in progress
+    and the state of the global NumPy random stream in a local file.
+
+    Attributes:
+        path (str): Location of the checkpoint file.
+        every (float): Minimum number of seconds between two periodic saves.
+        run (dict): Parameters of the sweep, a checkpoint only resumes the same sweep.
+        completed (dict): Results of the completed grid points.
+        partial (dict): Accumulator state of the grid point in progress (or None).
+    """
+
+    def __init__(self, path, run, every=60.0, resume=False):
+        """
+        Constructs a new checkpoint or loads an existing one if resume is True.
+        """
+        self.path = path
+        self.run = run
+        self.every = every
+        self.completed = {}
+        self.partial = None
+        self.last_save = time.time()
+
+        if resume and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        """
+        Loads the checkpoint and restores the random stream.
+        """
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+
+        assert state["run"] == self.run, "Checkpoint belongs to a sweep with different parameters"
+        self.completed = state["completed"]
+        self.partial = state["partial"]
+        np.random.set_state(state["rng_state"])
+
+    def save(self):
+        """
+        Writes the checkpoint atomically, a kill during the write keeps the previous one.
+        """
+        state = {
+            "run": self.run,
+            "completed": self.completed,
+            "partial": self.partial,
+            "rng_state": np.random.get_state(),
+        }
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.last_save = time.time()
+
+    def update(self, key, accumulator):
+        """
+        Records the progress of a grid point and saves if the last save is too old.
+        """
+        self.partial = {"key": key, "accumulator": accumulator}
+        if time.time() - self.last_save >= self.every:
+            self.save()
+
+    def resume_partial(self, key):
+        """
+        Returns the accumulator of the grid point if it was in progress (otherwise None).
+        """
+        if self.partial is not None and self.partial["key"] == key:
+            return self.partial["accumulator"]
+        return None
+
+    def complete(self, key, result):
+        """
+        Records a completed grid point and saves.
+        """
+        self.completed[key] = result
+        self.partial = None
+        self.save()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Coordinator and workers that share a large Monte Carlo run over several
+machines with plain TCP sockets and JSON lines.
+
+Protocol (one JSON object per line):
+    worker -> coordinator: {"type": "ready"}
+    coordinator -> worker: {"type": "shard", "shard": 3, "paths": 1000000, "job": {...},
+                            "entropy": ..., "spawn_key": [3]}
+    worker -> coordinator: {"type": "result", "shard": 3, "stats": {"count": ..., "mean": ..., "m2": ...}}
+    coordinator -> worker: {"type": "done"}
+Every shard has its own SeedSequence stream, such that the result does not depend on
+which worker simulated a shard. Shards of workers that disconnect or time out are
+handed to the remaining workers.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import socket
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from accumulators import RunningStats
+from binomial_tree import BlackScholes
+from monte_carlo import MonteCarlo, Workspace
+
+JOB_DEFAULTS = {
+    "contract": "european", "option_type": "call", "S0": 100, "K": 99, "T": 1, "r": 0.06,
+    "sigma": 0.2, "steps": 50, "chunk_size": 100000,
+}
+
+
+def send_message(stream, message):
+    """
+    Writes one JSON line to a socket stream.
+    """
+    stream.write(json.dumps(message).encode() + b"\n")
+    stream.flush()
+
+
+def receive_message(stream):
+    """
+    Reads one JSON line from a socket stream (None if the connection was closed).
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def validate_job(job):
+    """
+    Fills in the defaults of a job and checks its contract and option type.
+    """
+    job = {**JOB_DEFAULTS, **job}
+    assert job["contract"] in ["european", "digital", "asian"], "Non-existing contract."
+    assert job["option_type"] in ["call", "put"], "Non-existing option type."
+    return job
+
+
+def simulate_shard(job, paths, seed_sequence):
+    """
+    Simulates the discounted payoffs of one shard.
+    :param job: dict with the contract (european, digital or asian), option_type and the
+                parameters S0, K, T, r, sigma, steps and chunk_size
+    :param paths: number of paths of the shard
+    :param seed_sequence: SeedSequence of the shard
+    :return: RunningStats of the discounted payoffs
+    """
+    job = validate_job(job)
+    rng = np.random.default_rng(seed_sequence)
+    asian = job["contract"] == "asian"
+    steps = job["steps"] if asian else 1
+    discount = math.exp(-job["r"] * job["T"])
+    mc = MonteCarlo(steps, job["T"], job["S0"], job["sigma"], job["r"], job["K"], option_type=job["option_type"])
+
+    # The normal numbers are drawn into one buffer, which the kernels then overwrite
+    # with the prices and payoffs of every chunk
+    stats_payoff = RunningStats()
+    workspace = Workspace()
+    for start in range(0, paths, job["chunk_size"]):
+        size = min(job["chunk_size"], paths - start)
+        if asian:
+            underlying = mc.euler_path_vectorized(rng.standard_normal((size, steps))).mean(axis=1)
+        else:
+            underlying = rng.standard_normal(out=workspace.get("prices", size))
+            mc.euler_method_vectorized(underlying, math.sqrt(job["T"]), out=underlying)
+
+        payoffs = mc.payoffs(underlying, digital=job["contract"] == "digital", out=underlying)
+        payoffs *= discount
+        stats_payoff.update(payoffs)
+
+    return stats_payoff
+
+
+class Coordinator:
+    """
+    Splits a Monte Carlo run into shards, hands them to the workers that connect and
+    merges their partial statistics. Workers pull one shard at a time, such that fast
+    machines get more shards than slow ones.
+
+    Attributes:
+        job (dict): Contract and model parameters of the run.
+        shards (list): Number of paths of every shard.
+        address (tuple): Host and port the coordinator listens on.
+        results (dict): RunningStats of the completed shards.
+        reassigned (int): Number of shards handed out again after a worker was lost.
+        active (int): Number of workers that are connected.
+    """
+
+    def __init__(
+        self, job, paths, shard_size=1000000, seed=None, host="127.0.0.1", port=0,
+        timeout=600.0, max_failures=3
+    ):
+        """
+        Opens the listening socket (port 0 picks a free port). The job is checked
+        here, such that an invalid job fails before any worker is started. A shard
+        that fails on max_failures workers aborts the run.
+        """
+        self.job = validate_job(job)
+        self.shards = [min(shard_size, paths - start) for start in range(0, paths, shard_size)]
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.timeout = timeout
+        self.max_failures = max_failures
+
+        self.pending = deque(range(len(self.shards)))
+        self.results = {}
+        self.failures = {}
+        self.error = None
+        self.reassigned = 0
+        self.workers = 0
+        self.active = 0
+        self.condition = threading.Condition()
+
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()[:2]
+
+    def run(self, idle_timeout=None):
+        """
+        Serves workers until every shard is completed.
+        :param idle_timeout: seconds to wait for a worker while none is connected and
+                             shards are pending (the socket timeout if None)
+        :return: dict with the price, its standard error and statistics of the run
+        """
+        start = time.perf_counter()
+        idle_timeout = self.timeout if idle_timeout is None else idle_timeout
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+        try:
+            with self.condition:
+                deadline = time.monotonic() + idle_timeout
+                while len(self.results) < len(self.shards):
+                    if self.error is not None:
+                        raise self.error
+                    if self.active:
+                        deadline = time.monotonic() + idle_timeout
+                    elif time.monotonic() >= deadline:
+                        raise TimeoutError(
+                            f"No worker connected for {idle_timeout:.0f} s with "
+                            f"{len(self.shards) - len(self.results)} shards left"
+                        )
+                    self.condition.wait(max(deadline - time.monotonic(), 0.01))
+        finally:
+            self.server.close()
+
+        # Merge in shard order, such that the result does not depend on the workers
+        stats_payoff = RunningStats()
+        for shard in range(len(self.shards)):
+            stats_payoff.merge(self.results[shard])
+
+        return {
+            "price": stats_payoff.mean, "std_error": stats_payoff.std_error(), "paths": stats_payoff.count,
+            "shards": len(self.shards), "workers": self.workers, "reassigned": self.reassigned,
+            "time": time.perf_counter() - start,
+        }
+
+    def accept_loop(self):
+        """
+        Accepts workers and serves every worker on its own thread.
+        """
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve_worker, args=(connection,), daemon=True).start()
+
+    def next_shard(self):
+        """
+        Takes a pending shard, waits while shards are still in progress elsewhere
+        (they return to the queue if their worker is lost) and returns None when done.
+        """
+        with self.condition:
+            while not self.pending and len(self.results) < len(self.shards) and self.error is None:
+                self.condition.wait()
+            return self.pending.popleft() if self.pending and self.error is None else None
+
+    def serve_worker(self, connection):
+        """
+        Hands shards to one worker until the run is done or the worker is lost.
+        """
+        connection.settimeout(self.timeout)
+        stream = connection.makefile("rwb")
+        shard = None
+        connected = False
+        try:
+            message = receive_message(stream)
+            if message is None or message.get("type") != "ready":
+                return
+            with self.condition:
+                self.workers += 1
+                self.active += 1
+                connected = True
+
+            while True:
+                shard = self.next_shard()
+                if shard is None:
+                    send_message(stream, {"type": "done"})
+                    return
+
+                send_message(stream, {
+                    "type": "shard", "shard": shard, "paths": self.shards[shard], "job": self.job,
+                    "entropy": self.seed_sequence.entropy, "spawn_key": [shard],
+                })
+                message = receive_message(stream)
+                if message is None or message.get("type") != "result" or message.get("shard") != shard:
+                    return
+
+                with self.condition:
+                    self.results[shard] = RunningStats.from_dict(message["stats"])
+                    self.condition.notify_all()
+                shard = None
+
+        except (OSError, ValueError):
+            pass
+
+        finally:
+            # A shard that was not completed goes back to the queue, unless it
+            # already failed on max_failures workers
+            with self.condition:
+                if shard is not None and shard not in self.results:
+                    self.failures[shard] = self.failures.get(shard, 0) + 1
+                    if self.failures[shard] >= self.max_failures:
+                        self.error = RuntimeError(f"Shard {shard} failed on {self.failures[shard]} workers")
+                    else:
+                        self.pending.append(shard)
+                        self.reassigned += 1
+                if connected:
+                    self.active -= 1
+                self.condition.notify_all()
+            stream.close()
+            connection.close()
+
+
+def run_worker(host, port, retries=50, delay=0.2):
+    """
+    Connects to a coordinator and simulates shards until the run is done.
+    :param host: host of the coordinator
+    :param port: port of the coordinator
+    :param retries: number of connection attempts (the coordinator may start later)
+    :param delay: seconds between connection attempts
+    :return: number of simulated shards
+    """
+    for attempt in range(retries):
+        try:
+            connection = socket.create_connection((host, port))
+            break
+        except OSError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(delay)
+
+    completed = 0
+    with connection, connection.makefile("rwb") as stream:
+        send_message(stream, {"type": "ready"})
+        while True:
+            message = receive_message(stream)
+            if message is None or message["type"] == "done":
+                return completed
+
+            seed_sequence = np.random.SeedSequence(message["entropy"], spawn_key=message["spawn_key"])
+            stats_payoff = simulate_shard(message["job"], message["paths"], seed_sequence)
+            send_message(stream, {"type": "result", "shard": message["shard"], "stats": stats_payoff.to_dict()})
+            completed += 1
+
+
+def run_local(job, paths, workers=multiprocessing.cpu_count(), shard_size=1000000, seed=None, idle_timeout=30.0):
+    """
+    Runs a coordinator with worker processes on localhost. The run fails if no
+    worker is left for idle_timeout seconds.
+    :param job: dict with the contract and model parameters
+    :param paths: total number of paths
+    :param workers: number of worker processes
+    :param shard_size: number of paths per shard
+    :param seed: seed of the run
+    :param idle_timeout: seconds to wait while no worker is connected
+    :return: dict with the price, its standard error and statistics of the run
+    """
+    coordinator = Coordinator(job, paths, shard_size, seed)
+    processes = [multiprocessing.Process(target=run_worker, args=coordinator.address) for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        result = coordinator.run(idle_timeout)
+    finally:
+        for process in processes:
+            process.join(timeout=idle_timeout)
+            if process.is_alive():
+                process.terminate()
+
+    return result
+
+
+def reference_price(job):
+    """
+    Black Scholes price of European jobs (NaN for other contracts).
+    """
+    job = validate_job(job)
+    if job["contract"] != "european":
+        return float("nan")
+    bs = BlackScholes(job["T"], job["S0"], job["K"], job["r"], job["sigma"])
+    return bs.call_price() if job["option_type"] == "call" else bs.put_price()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Shard a Monte Carlo run over workers on several machines.")
+    parser.add_argument("mode", type=str, choices=["coordinator", "worker", "local"], help="Role of this process")
+    parser.add_argument("-host", type=str, default="127.0.0.1", help="Host of the coordinator")
+    parser.add_argument("-port", type=int, default=5555, help="Port of the coordinator (default: 5555)")
+    parser.add_argument("-paths", type=int, default=10 ** 8, help="Total number of paths")
+    parser.add_argument("-shard_size", type=int, default=10 ** 6, help="Number of paths per shard")
+    parser.add_argument("-workers", type=int, default=multiprocessing.cpu_count(), help="Worker processes (local mode)")
+    parser.add_argument("-seed", type=int, default=None, help="Seed of the run")
+    parser.add_argument("-job", type=str, default="{}", help="JSON with the contract and model parameters")
+    args = parser.parse_args()
+
+    job = json.loads(args.job)
+    if args.mode == "worker":
+        print(f"Simulated {run_worker(args.host, args.port)} shards")
+    else:
+        if args.mode == "local":
+            result = run_local(job, args.paths, args.workers, args.shard_size, args.seed)
+        else:
+            coordinator = Coordinator(job, args.paths, args.shard_size, args.seed, args.host, args.port)
+            print(f"Waiting for workers on {coordinator.address[0]}:{coordinator.address[1]}")
+            result = coordinator.run()
+        print(f"Price: {result['price']:.6f} (std. error {result['std_error']:.2e}, reference {reference_price(job):.6f})")
+        print(f"{result['paths']} paths in {result['shards']} shards on {result['workers']} workers, "
+              f"{result['reassigned']} reassigned, {result['time']:.2f} s")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Efficiency benchmark of plain Monte Carlo, variance reduction and
+quasi-Monte Carlo estimators, measured by error and computation time.
+"""
+
+import argparse
+import csv
+import math
+import time
+
+import numpy as np
+import scipy.stats as st
+
+import helper
+from binomial_tree import BlackScholes
+from monte_carlo import MonteCarlo, Workspace
+from samplers import NormalSampler
+
+CONTRACTS = ["european_call", "european_put", "digital_call", "asian_call"]
+ESTIMATORS = ["plain", "antithetic", "stratified", "sobol", "control_variate"]
+
+
+def sampler_for(estimator):
+    """
+    NormalSampler that draws the normal numbers of an estimator.
+    """
+    if estimator == "antithetic":
+        return NormalSampler(antithetic=True)
+    elif estimator in ["stratified", "sobol"]:
+        return NormalSampler(estimator)
+    return NormalSampler()
+
+
+def reference_price(contract, T, S0, K, r, sigma, steps):
+    """
+    Reference prices: Black Scholes closed forms and for the Asian option a large
+    randomized quasi-Monte Carlo run.
+    """
+    bs = BlackScholes(T, S0, K, r, sigma)
+    if contract == "european_call":
+        return bs.call_price()
+    elif contract == "european_put":
+        return bs.put_price()
+    elif contract == "digital_call":
+        d2 = (np.log(S0 / K) + (r - 0.5 * sigma ** 2) * T) / (sigma * np.sqrt(T))
+        return math.exp(-r * T) * st.norm.cdf(d2)
+
+    prices = [estimate(contract, "sobol", 2 ** 16, T, S0, K, r, sigma, steps)[0] for _ in range(16)]
+    return np.mean(prices)
+
+
+def estimate(contract, estimator, paths, T, S0, K, r, sigma, steps, workspace=None):
+    """
+    Price and standard error of a contract with the given estimator. The terminal
+    prices are written to the buffer of the workspace (if given).
+    """
+    discount = math.exp(-r * T)
+
+    # Control variate of the arithmetic Asian option on the geometric average
+    if estimator == "control_variate":
+        price, std_error, _ = helper.control_variate_monte_carlo(T, S0, K, r, sigma, steps, paths)
+        return price, std_error
+
+    sampler = sampler_for(estimator)
+    if contract == "asian_call":
+        mc = MonteCarlo(steps, T, S0, sigma, r, K)
+        S = mc.euler_path_vectorized(sampler.draw((paths, steps))).mean(axis=1)
+    else:
+        mc = MonteCarlo(1, T, S0, sigma, r, K)
+        out = workspace.get("prices", paths) if workspace is not None else None
+        S = mc.euler_method_vectorized(sampler.draw(paths), math.sqrt(T), out=out)
+
+    if contract == "european_put":
+        payoffs = np.maximum(K - S, 0)
+    elif contract == "digital_call":
+        payoffs = (S > K).astype(float)
+    else:
+        payoffs = np.maximum(S - K, 0)
+
+    return discount * sampler.mean(payoffs), discount * sampler.std_error(payoffs)
+
+
+def efficiency_benchmark(
+    T=1, S0=100, K=99, r=0.06, sigma=0.2, steps=50, contracts=CONTRACTS,
+    estimators=ESTIMATORS, path_counts=[2 ** 10, 2 ** 12, 2 ** 14],
+    replications=10, seed_nr=10, output=None
+    ):
+    """
+    Runs every contract with every estimator over a grid of path counts and measures
+    the root mean square error against the reference, the wall-clock time and the
+    work-normalized variance (mean squared error times time).
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility
+    :param steps: number of steps of the Asian option
+    :param contracts: contracts to price
+    :param estimators: estimators to compare (control_variate only applies to the Asian option)
+    :param path_counts: numbers of paths
+    :param replications: independent runs per grid point
+    :param seed_nr: seed of the benchmark
+    :param output: CSV file to export the table to (optional)
+    :return: list of rows (dicts) of the results table
+    """
+    np.random.seed(seed_nr)
+    rows = []
+    workspace = Workspace()
+    for contract in contracts:
+        reference = reference_price(contract, T, S0, K, r, sigma, steps)
+
+        for estimator in estimators:
+            if estimator == "control_variate" and contract != "asian_call":
+                continue
+
+            for paths in path_counts:
+                prices, std_errors, times = [], [], []
+                for _ in range(replications):
+                    start = time.perf_counter()
+                    price, std_error = estimate(contract, estimator, paths, T, S0, K, r, sigma, steps, workspace)
+                    times.append(time.perf_counter() - start)
+                    prices.append(price)
+                    std_errors.append(std_error)
+
+                prices = np.array(prices)
+                rmse = math.sqrt(np.mean((prices - reference) ** 2))
+                mean_time = np.mean(times)
+                rows.append({
+                    "contract": contract,
+                    "estimator": estimator,
+                    "paths": paths,
+                    "reference": reference,
+                    "mean_price": prices.mean(),
+                    "rmse": rmse,
+                    "mean_std_error": np.mean(std_errors),
+                    "time": mean_time,
+                    "mse_x_time": rmse ** 2 * mean_time,
+                })
+
+    if output:
+        with open(output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    return rows
+
+
+def print_table(rows):
+    """
+    Prints the results table.
+    """
+    header = f"{'contract':<14} {'estimator':<16} {'paths':>8} {'rmse':>10} {'time [s]':>10} {'mse x time':>11}"
+    print(header)
+    print("=" * len(header))
+    for row in rows:
+        print(f"{row['contract']:<14} {row['estimator']:<16} {row['paths']:>8} "
+              f"{row['rmse']:>10.2e} {row['time']:>10.2e} {row['mse_x_time']:>11.2e}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Efficiency benchmark of Monte Carlo estimators.")
+    parser.add_argument("-paths", type=int, nargs="+", default=[2 ** 10, 2 ** 12, 2 ** 14], help="Numbers of paths")
+    parser.add_argument("-replications", type=int, default=10, help="Independent runs per grid point (default: 10)")
+    parser.add_argument("-contracts", type=str, nargs="+", default=CONTRACTS, help="Contracts to price")
+    parser.add_argument("-estimators", type=str, nargs="+", default=ESTIMATORS, help="Estimators to compare")
+    parser.add_argument("-output", type=str, default="efficiency.csv", help="CSV output file (default: efficiency.csv)")
+    args = parser.parse_args()
+
+    rows = efficiency_benchmark(
+        contracts=args.contracts, estimators=args.estimators, path_counts=args.paths,
+        replications=args.replications, output=args.output
+    )
+    print_table(rows)
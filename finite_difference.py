@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Crank-Nicolson finite difference solver of the Black Scholes PDE as a
+fast reference for European and American options.
+"""
+
+# Import built-in libs
+import math
+
+# Import 3th parties libraries
+import numpy as np
+from scipy.linalg import solve_banded
+
+
+class CrankNicolson:
+    def __init__(
+        self, T, S0, K, r, sigma, market="EU", option_type="call",
+        space_steps=400, time_steps=200, width=5.0, rannacher_steps=4,
+        exercise="penalty", penalty=1e8, tolerance=1e-8
+    ):
+        """
+        Finite difference solver of the Black Scholes PDE on a log-spot grid.
+        Input:
+            T = maturity option in years (numeric)
+            S0 = initial stock price (numeric)
+            K = strike price option (numeric)
+            r = risk-free rate (numeric)
+            sigma = volatility (numeric)
+            market = market type (EU or USA)
+            option_type = determines option type (call or put)
+            space_steps = number of intervals of the log-spot grid (even integer)
+            time_steps = number of Crank-Nicolson steps (integer)
+            width = half width of the grid in standard deviations of log(S_T)
+            rannacher_steps = number of implicit Euler half steps at the start,
+                              which damp the oscillations of the kinked payoff
+            exercise = penalty or psor (projected SOR) for American options
+            penalty = weight that pulls exercised nodes onto the payoff in the
+                      penalty method (larger is closer to the payoff)
+            tolerance = convergence tolerance of the projected SOR iterations
+        Output:
+            returns an object representation of the solver, solve determines
+            the price, delta and gamma at every spot of the grid at once
+        """
+
+        # Init
+        self.T = T
+        self.S0 = S0
+        self.K = K
+        self.r = r
+        self.sigma = sigma
+        self.market = market.upper()
+        self.option_type = option_type.lower()
+        self.space_steps = space_steps
+        self.time_steps = time_steps
+        self.rannacher_steps = rannacher_steps
+        self.exercise = exercise.lower()
+        self.penalty = penalty
+        self.tolerance = tolerance
+
+        # Checks if market type, option type and exercise method are valid
+        assert self.market in ["EU", "USA"], "Market not found. Choose EU or USA"
+        assert self.option_type in ["call", "put"], "Non-existing option type."
+        assert self.exercise in ["penalty", "psor"], "Exercise method not found. Choose penalty or psor"
+        assert space_steps % 2 == 0, "The number of space steps must be even"
+
+        # Log-spot grid centred at the spot price, such that S0 is a grid node
+        half_width = width * sigma * math.sqrt(T)
+        self.dx = 2 * half_width / space_steps
+        self.x = math.log(S0) + np.linspace(-half_width, half_width, space_steps + 1)
+        self.S = np.exp(self.x)
+        self.dt = T / time_steps
+
+        # Coefficients of the operator L V = 0.5 sigma^2 V_xx + nu V_x - r V
+        nu = r - 0.5 * sigma ** 2
+        diffusion = 0.5 * sigma ** 2 / self.dx ** 2
+        convection = 0.5 * nu / self.dx
+        self.lower = diffusion - convection
+        self.diag = -2 * diffusion - r
+        self.upper = diffusion + convection
+
+        self.sign = 1 if self.option_type == "call" else -1
+        self.payoff = np.maximum(0, self.sign * (self.S - K))
+
+    def boundaries(self, tau):
+        """
+        Option values at the lowest and highest spot for time to maturity tau.
+        """
+        if self.market == "USA" and self.option_type == "put":
+            return self.K - self.S[0], 0.0
+
+        # European values deep in and out of the money (American calls are never exercised early)
+        forward_strike = self.K * math.exp(-self.r * tau)
+        if self.option_type == "call":
+            return 0.0, self.S[-1] - forward_strike
+        return forward_strike - self.S[0], 0.0
+
+    def step(self, V, tau, dt, theta):
+        """
+        One theta-scheme step from tau - dt to tau of the interior nodes:
+        (I - theta dt L) V_new = (I + (1 - theta) dt L) V.
+        """
+        explicit = (1 - theta) * dt
+        rhs = V[1:-1] + explicit * (self.lower * V[:-2] + self.diag * V[1:-1] + self.upper * V[2:])
+
+        low, high = self.boundaries(tau)
+        implicit = theta * dt
+        rhs[0] += implicit * self.lower * low
+        rhs[-1] += implicit * self.upper * high
+
+        # Tridiagonal matrix in the banded storage of solve_banded
+        n = V.size - 2
+        banded = np.empty((3, n))
+        banded[0, :] = -implicit * self.upper
+        banded[1, :] = 1 - implicit * self.diag
+        banded[2, :] = -implicit * self.lower
+
+        V_new = np.empty_like(V)
+        V_new[0], V_new[-1] = low, high
+        if self.market == "USA":
+            V_new[1:-1] = self.exercise_step(banded, rhs, V[1:-1])
+        else:
+            V_new[1:-1] = solve_banded((1, 1), banded, rhs)
+
+        return V_new
+
+    def exercise_step(self, banded, rhs, guess):
+        """
+        Solves the linear complementarity problem of the American option,
+        V >= payoff, with the penalty method or projected SOR.
+        """
+        payoff = self.payoff[1:-1]
+
+        # Penalty method: nodes below the payoff get a large diagonal term pulling them
+        # onto the payoff, iterated until the set of exercised nodes is stable
+        if self.exercise == "penalty":
+            exercised = guess < payoff
+            for _ in range(100):
+                penalized = banded.copy()
+                penalized[1] += self.penalty * exercised
+                V = solve_banded((1, 1), penalized, rhs + self.penalty * exercised * payoff)
+                new_exercised = V < payoff
+                if np.array_equal(new_exercised, exercised):
+                    break
+                exercised = new_exercised
+            return np.maximum(V, payoff)
+
+        # Projected successive over-relaxation in red-black order: the even nodes only
+        # couple to odd nodes and vice versa, so every half sweep is one vectorized update
+        omega = 1.2
+        upper, diag, lower = banded[0], banded[1], banded[2]
+        V = np.maximum(guess, payoff)
+        n = V.size
+        for _ in range(1000):
+            error = 0.0
+            for parity in (0, 1):
+                residual = rhs - diag * V
+                residual[1:] -= lower[:-1] * V[:-1]
+                residual[:-1] -= upper[1:] * V[1:]
+                nodes = slice(parity, n, 2)
+                new = np.maximum(payoff[nodes], V[nodes] + omega * residual[nodes] / diag[nodes])
+                error = max(error, np.max(np.abs(new - V[nodes])))
+                V[nodes] = new
+            if error < self.tolerance:
+                break
+
+        return V
+
+    def solve(self):
+        """
+        Solves the PDE backwards from maturity to spot time.
+        Output:
+            spot grid, option prices, deltas and gammas at spot time (arrays)
+        """
+        V = self.payoff.copy()
+        tau = 0.0
+
+        # Rannacher start-up with implicit Euler half steps, then Crank-Nicolson
+        startup = min(self.rannacher_steps, 2 * self.time_steps)
+        for _ in range(startup):
+            tau += 0.5 * self.dt
+            V = self.step(V, tau, 0.5 * self.dt, 1.0)
+
+        steps = self.time_steps - math.ceil(startup / 2)
+        dt = (self.T - tau) / steps if steps else 0.0
+        for _ in range(steps):
+            tau += dt
+            V = self.step(V, tau, dt, 0.5)
+
+        # Greeks from the derivatives in log-spot: V_S = V_x / S, V_SS = (V_xx - V_x) / S^2
+        V_x = np.gradient(V, self.dx)
+        V_xx = np.zeros_like(V)
+        V_xx[1:-1] = (V[2:] - 2 * V[1:-1] + V[:-2]) / self.dx ** 2
+        V_xx[0], V_xx[-1] = V_xx[1], V_xx[-2]
+
+        self.prices = V
+        self.deltas = V_x / self.S
+        self.gammas = (V_xx - V_x) / self.S ** 2
+
+        return self.S, self.prices, self.deltas, self.gammas
+
+    def determine_price(self):
+        """
+        Price, delta and gamma at the spot price (the middle node of the grid).
+        """
+        self.solve()
+        middle = self.space_steps // 2
+        return self.prices[middle], self.deltas[middle], self.gammas[middle]
+
+
+if __name__ == "__main__":
+
+    from binomial_tree import BinTreeOption, BlackScholes
+
+    pde = CrankNicolson(1, 100, 99, 0.06, 0.2, "EU", "put")
+    print("European put (PDE, Black Scholes):", pde.determine_price()[0], BlackScholes(1, 100, 99, 0.06, 0.2).put_price())
+
+    pde = CrankNicolson(1, 100, 99, 0.06, 0.2, "USA", "put")
+    tree = BinTreeOption(1001, 1, 100, 0.2, 0.06, 99, "USA", "put", lattice="lr", theoretical_delta=False)
+    print("American put (PDE, tree):", pde.determine_price()[0], tree.determine_price()[0])
@@ -10,19 +10,29 @@ Final Project
 import argparse
 import math
 import os
+import time
 from decimal import Decimal
-from monte_carlo import monte_carlo
+from monte_carlo import MonteCarlo, Workspace
 import matplotlib.pyplot as plt
 import matplotlib.lines as ls
 import colorsys
 import numpy as np
 import scipy.stats as stats
+from scipy.special import ndtr
 import tqdm
 from collections import defaultdict
 import multiprocessing
-from binomial_tree import BinTreeOption, BlackScholes
+from binomial_tree import BarrierOption, BinTreeOption, BlackScholes, MertonJumpDiffusion
 import tqdm
 import pickle
+from accumulators import (
+    Histogram, PathLogSum, PathMax, PathMin, PathSum, QuantileSketch, RunningCovariance, RunningStats,
+    SamplerStats
+)
+from checkpoint import Checkpoint
+from memory_planner import check_memory, engine_bytes, plan
+from samplers import NormalSampler
+from results_store import DEFAULT_PATH, ResultsStore
 
 
 def plot_wiener_process(T,K, S0, r, sigma, steps,save_plot=False):
@@ -37,7 +47,7 @@ def plot_wiener_process(T,K, S0, r, sigma, steps,save_plot=False):
     :return:  returns a plot of a simulated stock movement
     """
 
-    mc=monte_carlo(steps, T, S0, sigma, r, K)
+    mc=MonteCarlo(steps, T, S0, sigma, r, K)
 
     mc.wiener_method()
 
@@ -69,7 +79,33 @@ def worker_pay_off_euler_sim(object):
 
     return pay_off_array
 
-def diff_monte_carlo_process(T, S0, K, r, sigma, steps,samples,save_plot=False):
+def euler_integration_chunks(mc, reps, key, ckpt, chunk_size=100000):
+    """
+    Simulates the put payoffs of the Euler integration method in chunks and
+    checkpoints the accumulator and the random stream between the chunks.
+    :param mc: MonteCarlo object
+    :param reps: number of samples
+    :param key: key of the grid point in the checkpoint
+    :param ckpt: Checkpoint object (None to run without checkpoints)
+    :param chunk_size: number of samples per chunk
+    :return: RunningStats of the payoffs
+    """
+    stats = (ckpt.resume_partial(key) if ckpt is not None else None) or RunningStats()
+    workspace = Workspace(mc.dtype)
+    while stats.count < reps:
+        size = min(chunk_size, reps - stats.count)
+        S = mc.euler_method_vectorized(np.random.normal(size=size), np.sqrt(mc.T), out=workspace.get("prices", size))
+        np.subtract(mc.K, S, out=S)
+        stats.update(np.maximum(S, 0, out=S))
+        if ckpt is not None:
+            ckpt.update(key, stats)
+
+    return stats
+
+def diff_monte_carlo_process(
+    T, S0, K, r, sigma, steps,samples,save_plot=False,
+    checkpoint=None, resume=False, chunk_size=100000, save_output=False
+    ):
     """
     :param T:  Period
     :param S0: Stock price at spot time
@@ -78,6 +114,10 @@ def diff_monte_carlo_process(T, S0, K, r, sigma, steps,samples,save_plot=False):
     :param sigma: volatility
     :param steps: number of steps
     :param save_plot:  to save the plot
+    :param checkpoint: file to checkpoint the sweep to (None to run without checkpoints)
+    :param resume: continue from the checkpoint file if it exists
+    :param chunk_size: number of samples per chunk
+    :param save_output: appends the results to the results store (True or the location of a store)
     :return:  returns a plot of a simulated stock movement
     """
 
@@ -87,18 +127,25 @@ def diff_monte_carlo_process(T, S0, K, r, sigma, steps,samples,save_plot=False):
     # mc_pricing will be a dict a list containing  tuples of (pricing and standard error)
     mc_pricing = defaultdict(list)
 
-    for repetition in tqdm.tqdm(different_mc_rep):
+    ckpt = None
+    if checkpoint:
+        run = {"function": "diff_monte_carlo_process", "T": T, "S0": S0, "K": K, "r": r,
+               "sigma": sigma, "steps": steps, "samples": list(samples), "chunk_size": chunk_size}
+        ckpt = Checkpoint(checkpoint, run, resume=resume)
 
-        mc_list = [monte_carlo(steps, T, S0, sigma, r, K) for i in range(repetition)]
-        num_core = 3
-        pool = multiprocessing.Pool(num_core)
-        pay_off_list = pool.map(worker_pay_off_euler_direct, ((mc) for mc in mc_list))
-        pool.close()
-        pool.join()
+    # Chunked simulation with or without checkpoints, such that both modes simulate
+    # the same payoffs. Completed grid points come from the checkpoint.
+    for repetition in tqdm.tqdm(different_mc_rep):
+        if ckpt is not None and repetition in ckpt.completed:
+            mc_pricing['euler_integration'].append(ckpt.completed[repetition])
+            continue
 
-        mean_pay_off = np.mean([pay_off for pay_off in pay_off_list])
-        std_pay_off = np.std([pay_off for pay_off in pay_off_list])/np.sqrt(repetition)
-        mc_pricing['euler_integration'].append((np.exp(-r*T)*mean_pay_off ,std_pay_off))
+        mc = MonteCarlo(steps, T, S0, sigma, r, K)
+        stats = euler_integration_chunks(mc, repetition, repetition, ckpt, chunk_size)
+        result = (np.exp(-r*T)*stats.mean, np.sqrt(stats.variance())/np.sqrt(repetition))
+        if ckpt is not None:
+            ckpt.complete(repetition, result)
+        mc_pricing['euler_integration'].append(result)
 
     bs = BlackScholes(T, S0, K, r, sigma)
     bs_solution=np.ones(increments)*bs.put_price()
@@ -108,6 +155,18 @@ def diff_monte_carlo_process(T, S0, K, r, sigma, steps,samples,save_plot=False):
     for i in range(len(different_mc_rep)):
         print("Number of samples: ", different_mc_rep[i]," Mean :", mc_pricing['euler_integration'][i][0], " Variance :", mc_pricing['euler_integration'][i][1])
 
+    # if required output is saved
+    if save_output:
+        path = save_output if isinstance(save_output, str) else DEFAULT_PATH
+        rows = [{
+            "experiment": "price", "contract": "european", "option_type": "put", "market": "EU",
+            "S0": S0, "K": K, "sigma": sigma, "T": T, "r": r, "steps": steps, "method": "euler_integration",
+            "sampler": "random", "paths": repetition, "estimate": price, "std_error": std_error,
+            "reference": bs.put_price(), "error": price - bs.put_price(),
+        } for repetition, (price, std_error) in zip(different_mc_rep, mc_pricing['euler_integration'])]
+        with ResultsStore(path) as store:
+            store.append(rows)
+
 
     fig, axs = plt.subplots(2,figsize=(10, 7))
     axs[0].plot(different_mc_rep, [i[0] for i in mc_pricing['euler_integration']], color='gray', label='Monte Carlo')
@@ -147,7 +206,7 @@ def diff_K_monte_carlo_process(T,different_k , S0, r, sigma, steps, repetition,
 
     for diff_strike_price in tqdm.tqdm(different_k):
 
-        mc_list = [monte_carlo(steps, T, S0, sigma, r, diff_strike_price) for i in range(repetition)]
+        mc_list = [MonteCarlo(steps, T, S0, sigma, r, diff_strike_price) for i in range(repetition)]
         num_core = 3
         pool = multiprocessing.Pool(num_core)
         pay_off_list = pool.map(worker_pay_off_euler_direct, ((mc) for mc in mc_list))
@@ -202,7 +261,7 @@ def diff_sigma_monte_carlo_process(T,K , S0, r, different_sigma, steps, repetiti
 
     for sigma in tqdm.tqdm(different_sigma):
 
-        mc_list = [monte_carlo(steps, T, S0, sigma, r, K) for i in range(repetition)]
+        mc_list = [MonteCarlo(steps, T, S0, sigma, r, K) for i in range(repetition)]
         num_core = 3
         pool = multiprocessing.Pool(num_core)
         pay_off_list = pool.map(worker_pay_off_euler_direct, ((mc) for mc in mc_list))
@@ -253,7 +312,7 @@ def milstein_process(T, S0, K, r, sigma, steps,save_plot=False):
     :return:  returns a plot of a simulated stock movement
     """
 
-    mc = monte_carlo(steps, T, S0, sigma, r, K)
+    mc = MonteCarlo(steps, T, S0, sigma, r, K)
 
     price_path=mc.milstein_method()
 
@@ -274,13 +333,14 @@ def milstein_process(T, S0, K, r, sigma, steps,save_plot=False):
 
 def antithetic_monte_carlo_process(T, S0, K, r, sigma, steps,save_plot=False):
 
-    mc = monte_carlo(steps, T, S0, sigma, r, K)
+    mc = MonteCarlo(steps, T, S0, sigma, r, K)
 
     path_list=mc.antithetic_wiener_method()
 
+    # The antithetic path of path i is path i + n / 2
     plt.figure()
     plt.plot(path_list[0])
-    plt.plot(path_list[1])
+    plt.plot(path_list[len(path_list) // 2])
     plt.xlabel("Days", fontsize=12, fontweight='bold')
     plt.ylabel("Stock price", fontsize=12, fontweight='bold')
     plt.title("Antithetic Monte Carlo", fontsize=17, fontweight='bold')
@@ -294,7 +354,8 @@ def diff_iter_bump_and_revalue(
     T, S0, K, r, sigma, steps,
     epsilons=[0.5], set_seed="random",iterations=[100],contract="put", seed_nr=10,
     full_output=False, option_type="regular",
-    show_plot=False, save_plot=False, save_output=False
+    show_plot=False, save_plot=False, save_output=False,
+    checkpoint=None, resume=False, sampler=None, dtype=np.float64
     ):
     """
     Applies bump and revalue for for different amount of iterations.
@@ -309,8 +370,14 @@ def diff_iter_bump_and_revalue(
     :param seed_nr: seed to use
     :param iterations: list of number of MC simulations
     :param option_type: option's type (regular or digital)
-    :param full_output: returns full output
+    :param full_output: also returns the revalue and bump prices of the simulated grid points as
+                        a dict {(iteration index, bump index): (prices_revalue, prices_bump)}
+                        (grid points taken from a checkpoint have no prices)
     :param save_plot:  to save the plot
+    :param checkpoint: file to checkpoint the completed grid points to
+    :param resume: continue from the checkpoint file if it exists
+    :param sampler: NormalSampler for the normal numbers (plain random numbers if None)
+    :param dtype: precision of the simulated stock prices (float64 or float32)
     :return:  returns a plot of a simulated stock movement
     """
 
@@ -325,13 +392,38 @@ def diff_iter_bump_and_revalue(
     if set_seed == "fixed":
         seeds = [seed_nr for _ in range(diff_eps)]
 
-    # Apply bump and revalue method for each number of iterations
+    ckpt = None
+    if checkpoint:
+        run = {"function": "diff_iter_bump_and_revalue", "T": T, "S0": S0, "K": K,
+               "r": r, "sigma": sigma, "epsilons": list(epsilons), "set_seed": set_seed,
+               "iterations": list(iterations), "contract": contract,
+               "seed_nr": seed_nr, "option_type": option_type, "steps": steps,
+               "dtype": np.dtype(dtype).name, "full_output": full_output, "sampler": None}
+        if sampler is not None:
+            run["sampler"] = {"method": sampler.method, "strata": sampler.strata,
+                              "allocation": sampler.allocation, "antithetic": sampler.antithetic,
+                              "randomizations": sampler.randomizations}
+        ckpt = Checkpoint(checkpoint, run, resume=resume)
+
+    # Apply bump and revalue method for each number of iterations and each bump,
+    # grid points that were completed before are taken from the checkpoint
+    prices = {}
     for i, iteration in enumerate(iterations):
-        result = bump_revalue_vectorized(T, S0, K, r, sigma, steps,
-                    epsilons=epsilons, seeds=seeds, reps=iteration,
-                    full_output=full_output, option_type=option_type, contract=contract
-                )
-        deltas[i, :], bs_deltas[i, :], errors[i, :], std_deltas[i, :] = result
+        for j, eps in enumerate(epsilons):
+            if ckpt is not None and (i, j) in ckpt.completed:
+                result = ckpt.completed[(i, j)]
+            else:
+                result = bump_revalue_vectorized(T, S0, K, r, sigma, steps,
+                            epsilons=[eps], seeds=seeds[j:j + 1], reps=iteration,
+                            full_output=full_output, option_type=option_type, contract=contract,
+                            sampler=sampler, dtype=dtype
+                        )
+                if full_output:
+                    prices[(i, j)] = result[4:]
+                    result = result[:4]
+                if ckpt is not None:
+                    ckpt.complete((i, j), result)
+            deltas[i, j], bs_deltas[i, j], errors[i, j], std_deltas[i, j] = [x[0] for x in result]
 
     if show_plot or save_plot:
         plot_bump_and_revalue(
@@ -341,18 +433,25 @@ def diff_iter_bump_and_revalue(
 
     # if required output is saved
     if save_output:
-        name = os.path.join(
-            "Data", f"{option_type}-{contract}_bump_and_revalue_{set_seed}seed_"
+        save_output_deltas(
+            save_output, "bump_and_revalue", T, S0, K, r, sigma, steps, contract, option_type,
+            seed_nr if set_seed == "fixed" else None, iterations, epsilons, deltas, bs_deltas, errors, std_deltas, sampler
             )
-        save_output_ex2(name, K, sigma, deltas, bs_deltas, errors, std_deltas)
+
+    if full_output:
+        return deltas, bs_deltas, errors, std_deltas, prices
 
     return deltas, bs_deltas, errors, std_deltas
 
 def bump_revalue_vectorized(
-    T, S0, K, r, sigma, steps, epsilons=[0.5], seeds=[], reps=100, full_output=False, option_type="regular", contract="put"
+    T, S0, K, r, sigma, steps, epsilons=[0.5], seeds=[], reps=100, full_output=False, option_type="regular", contract="put",
+    sampler=None, dtype=np.float64
 ):
     """
-    Applies bump and revalue method to determine the delta at spot time
+    Applies bump and revalue method to determine the delta at spot time,
+    optionally with the normal numbers of a (variance reducing) NormalSampler.
+    The stock prices are simulated in the given precision (float64 or float32),
+    means and variances are always accumulated in float64.
     """
     
     # Init amount of bumps (epsilons) and storage (Black Scholes) deltas
@@ -361,6 +460,15 @@ def bump_revalue_vectorized(
     bs_deltas = np.zeros(diff_eps)
     std_deltas = np.zeros(diff_eps)
     discount = math.exp(-r * T)
+    workspace = Workspace(dtype)
+
+    # Paths are simulated in chunks that fit the memory budget, the estimators of
+    # the sampler and the full output need all paths at once
+    if sampler is None and not full_output:
+        chunk_size = plan("bump_revalue", reps, dtype=dtype, workers=1)["chunk_size"]
+    else:
+        chunk_size = reps
+        check_memory(reps * engine_bytes("bump_revalue", dtype=dtype), f"Bump and revalue with {reps} paths")
 
     # Start MC simulation for each bump
     for i, eps in enumerate(epsilons):
@@ -369,40 +477,48 @@ def bump_revalue_vectorized(
         S0_eps = S0 + eps
 
         # Create bump and revalue Monte Carlo (MC) objects
-        mc_revalue = monte_carlo(steps, T, S0, sigma, r, K)
-        mc_bump = monte_carlo(steps, T, S0_eps, sigma, r, K)
+        mc_revalue = MonteCarlo(steps, T, S0, sigma, r, K, dtype=dtype)
+        mc_bump = MonteCarlo(steps, T, S0_eps, sigma, r, K, dtype=dtype)
 
-        # Determine stock prices at maturity
-        S_rev, S_bump = stock_prices_bump_revalue(
-                            seeds, reps, mc_revalue, mc_bump, i
-                        )
+        # With a seed, bump and revalue share the normal numbers
+        if seeds:
+            np.random.seed(seeds[i])
+
+        accumulator = RunningCovariance(2)
+        for start in range(0, reps, chunk_size):
+            size = min(chunk_size, reps - start)
+
+            # Determine stock prices at maturity
+            S_rev, S_bump = stock_prices_bump_revalue(
+                                bool(seeds), size, mc_revalue, mc_bump, sampler, workspace
+                            )
+
+            # Determine prices and delta hedging depending at spot time
+            results = payoff_and_hedge_options(
+                option_type, contract, S_rev,
+                S_bump, S0_eps, K, r, sigma,
+                T, bs_deltas, discount, i
+            )
+            prices_revalue, prices_bump, bs_deltas = results
+            if sampler is None:
+                accumulator.update(np.column_stack((prices_bump, prices_revalue)))
 
-        # Determine prices and delta hedging depending at spot time
-        results = payoff_and_hedge_options(
-            option_type, contract, S_rev,
-            S_bump, S0_eps, K, r, sigma,
-            T, bs_deltas, discount, i
-        )
-        prices_revalue, prices_bump, bs_deltas = results
+        # Estimators of the sampler, both draws share the allocation over the strata
+        if sampler is not None:
+            difference = prices_bump - prices_revalue
+            deltas[i] = discount * sampler.mean(difference) / eps
+            std_deltas[i] = discount * sampler.std_error(difference) / eps
+            continue
 
-        # Mean and variance option prices bump and revalue
-        mean_revalue = prices_revalue.mean()
-        mean_bump = prices_bump.mean()
-        var_bump = prices_bump.var()
-        var_revalue = prices_revalue.var()
+        # Mean and (co)variance option prices bump and revalue
+        mean_bump, mean_revalue = accumulator.mean
+        covariance = accumulator.covariance()
 
         # Determine MC delta and its variance
         deltas[i] = (discount * (mean_bump - mean_revalue)) / eps
         var_delta = 0
         if not seeds:
-            cov_br = np.cov(prices_bump, prices_revalue)[0, 1]
-            var_delta = (1 / (eps * eps)) * ((var_bump + var_revalue - 2 * cov_br) / reps)
-
-        # print("Var BUMP:", round(var_bump, 3))
-        # print("Var REVALUE", round(var_revalue, 3))
-        # print("COVARIANCE:", round(cov_br, 3))
-        # print("Var DELTA:", round(var_delta, 3))
-        # print("========================================================")
+            var_delta = (1 / (eps * eps)) * ((covariance[0, 0] + covariance[1, 1] - 2 * covariance[0, 1]) / reps)
 
         std_deltas[i] = math.sqrt(var_delta)
 
@@ -415,27 +531,40 @@ def bump_revalue_vectorized(
 
     return deltas, bs_deltas, errors, std_deltas
 
-def stock_prices_bump_revalue(seeds, reps, mc_revalue, mc_bump, i):
+def draw_normals(reps, sampler=None):
     """
+    Standard normal numbers from the given NormalSampler (plain random numbers if None).
+    """
+    if sampler is None:
+        return np.random.normal(size=reps)
+    return sampler.draw(reps)
+
+def stock_prices_bump_revalue(common, reps, mc_revalue, mc_bump, sampler=None, workspace=None):
+    """
+    Stock prices at maturity of the revalue and bump simulations, on common normal
+    numbers (common=True) or on independent ones. The prices are written to the revalue
+    and bump buffers of the workspace (if given).
     """
-    # Set seed (if given) and generate similar sequence for bump and revalue
     S_rev, S_bump = None, None
-    if seeds:
-        np.random.seed(seeds[i])
-        numbers = np.random.normal(size=reps)
+    out_rev = workspace.get("revalue", reps) if workspace is not None else None
+    out_bump = workspace.get("bump", reps) if workspace is not None else None
+
+    # Generate similar sequence for bump and revalue
+    if common:
+        numbers = draw_normals(reps, sampler)
 
         # Euler method
-        S_rev = mc_revalue.euler_method_vectorized(numbers)
-        S_bump = mc_bump.euler_method_vectorized(numbers)
+        S_rev = mc_revalue.euler_method_vectorized(numbers, out=out_rev)
+        S_bump = mc_bump.euler_method_vectorized(numbers, out=out_bump)
 
     # Otherwise generate a different sequence for bump and revalue
     else:
-        numbers_rev = np.random.normal(size=reps)
-        numbers_bump = np.random.normal(size=reps)
+        numbers_rev = draw_normals(reps, sampler)
+        numbers_bump = draw_normals(reps, sampler)
 
         # Euler method
-        S_rev = mc_revalue.euler_method_vectorized(numbers_rev)
-        S_bump = mc_bump.euler_method_vectorized(numbers_bump)
+        S_rev = mc_revalue.euler_method_vectorized(numbers_rev, out=out_rev)
+        S_bump = mc_bump.euler_method_vectorized(numbers_bump, out=out_bump)
 
     return S_rev, S_bump
 
@@ -443,7 +572,8 @@ def payoff_and_hedge_options(
     option_type, contract, S_rev, S_bump, S0_eps, K, r, sigma, T, bs_deltas, discount, i
     ):
     """
-    Determine payoffs at maturity and (theoretical) delta hedging at spot time
+    Determine payoffs at maturity and (theoretical) delta hedging at spot time.
+    The payoffs overwrite the stock prices in place.
     """
     prices_revalue, prices_bump = 0, 0
 
@@ -451,8 +581,8 @@ def payoff_and_hedge_options(
     if option_type == "regular" and contract == "put":
 
         # Determine option price
-        prices_revalue = np.where(K - S_rev > 0, K - S_rev, 0)
-        prices_bump = np.where(K - S_bump > 0, K - S_bump, 0)
+        prices_revalue = np.maximum(np.subtract(K, S_rev, out=S_rev), 0, out=S_rev)
+        prices_bump = np.maximum(np.subtract(K, S_bump, out=S_bump), 0, out=S_bump)
 
         # Theoretical delta
         d1 = (np.log(S0_eps / K) + (r + 0.5 * sigma ** 2)
@@ -463,8 +593,8 @@ def payoff_and_hedge_options(
     elif option_type == "digital" and contract == "call":
 
         # Determine option price
-        prices_revalue = np.where(S_rev - K > 0, 1, 0)
-        prices_bump = np.where(S_bump - K > 0, 1, 0)
+        prices_revalue = np.greater(S_rev, K, out=S_rev)
+        prices_bump = np.greater(S_bump, K, out=S_bump)
 
         # Theoretical delta
         d2 = (np.log(S0_eps / K) + (r - 0.5 * sigma ** 2)
@@ -540,10 +670,12 @@ def plot_bump_and_revalue(
     plt.close()
 
 
-def LR_method(T, S0, K,r, sigma, steps, set_seed = "random", reps = [100],contract = "call", seed_nr = 10, option_type = "digital", show_plot = False, save_plot = False, save_output = False):
+def LR_method(T, S0, K,r, sigma, steps, set_seed = "random", reps = [100],contract = "call", seed_nr = 10, option_type = "digital", show_plot = False, save_plot = False, save_output = False, sampler = None, dtype = np.float64):
 
     """
     ONLY FOR DIGITAL OPTION.
+    The normal numbers can be drawn by a (variance reducing) NormalSampler and the
+    stock prices simulated in float32, the deltas are accumulated in float64.
     """
 
     # Initialize variables
@@ -551,7 +683,8 @@ def LR_method(T, S0, K,r, sigma, steps, set_seed = "random", reps = [100],contra
     deltas = np.zeros(diff_reps)
     std_deltas = np.zeros(diff_reps)
     discount = math.exp(-r * T)
-    mc = monte_carlo(steps, T, S0, sigma, r, K)
+    mc = MonteCarlo(steps, T, S0, sigma, r, K, dtype=dtype)
+    workspace = Workspace(dtype)
 
     seeds = []
     if set_seed == "fixed":
@@ -566,13 +699,17 @@ def LR_method(T, S0, K,r, sigma, steps, set_seed = "random", reps = [100],contra
 
         # Generate random normally distrivuted numbers for given repitition
         # determine stock prices and payoffs and calculate (average) deltas
-        numbers = np.random.normal(size=rep)
+        numbers = draw_normals(rep, sampler)
         scores = numbers / (S0 * sigma * math.sqrt(T))
-        S = mc.euler_method_vectorized(numbers)
-        payoffs = np.where(S - K > 0, 1, 0)
+        S = mc.euler_method_vectorized(numbers, math.sqrt(T), out=workspace.get("prices", rep))
+        payoffs = mc.payoffs(S, digital=True, out=S)
         d = discount * payoffs * scores
-        deltas[i] = d.mean()
-        std_deltas[i] = payoffs.std() / math.sqrt(rep)
+        if sampler is not None:
+            deltas[i] = sampler.mean(d)
+            std_deltas[i] = sampler.std_error(d)
+        else:
+            deltas[i] = d.mean(dtype=np.float64)
+            std_deltas[i] = d.std(dtype=np.float64) / math.sqrt(rep)
 
     # Theoretical delta
     bs_deltas = np.ones(diff_reps)
@@ -593,10 +730,11 @@ def LR_method(T, S0, K,r, sigma, steps, set_seed = "random", reps = [100],contra
 
     # Save output, if required
     if save_output:
-        name = os.path.join(
-            "Data", f"{option_type}-{contract}_LR_{set_seed}seed_"
+        save_output_deltas(
+            save_output, "likelihood_ratio", T, S0, K, r, sigma, steps, contract, option_type,
+            seed_nr if set_seed == "fixed" else None, reps, [None], deltas[:, None], bs_deltas[:, None], errors[:, None],
+            std_deltas[:, None], sampler
         )
-        save_output_ex2(name, K, sigma, deltas, bs_deltas, errors, std_deltas)
 
     return deltas, bs_deltas, errors, std_deltas
 
@@ -646,13 +784,37 @@ def plot_LR(iterations, errors, std_deltas, option_type, contract, set_seed, sho
 
     plt.close()
 
-def save_output_ex2(name, K, sigma, deltas, bs_deltas, errors, std_deltas):
+def save_output_deltas(
+    save_output, method, T, S0, K, r, sigma, steps, contract, option_type, seed,
+    iterations, epsilons, deltas, bs_deltas, errors, std_deltas, sampler=None
+    ):
     """
+    Appends the deltas of a run to the results store, one row per number of
+    iterations (and bump).
+    :param save_output: True for the default store or the location of a store
+    :param method: bump_and_revalue or likelihood_ratio
+    :param contract: call or put
+    :param option_type: regular or digital
+    :param seed: fixed seed of the run (None for random seeds)
+    :param iterations: list of number of MC simulations
+    :param epsilons: list of bumps (None for the likelihood ratio method)
+    :param deltas, bs_deltas, errors, std_deltas: arrays of shape (iterations, bumps)
+    :return: run id of the stored rows
     """
-    np.save(name + f"deltas_K={K}_sigma={sigma}.npy", deltas)
-    np.save(name + f"BSdeltas_K={K}_sigma={sigma}.npy", bs_deltas)
-    np.save(name + f"errors_K={K}_sigma={sigma}.npy", errors)
-    np.save(name + f"deviations_K={K}_sigma={sigma}.npy", std_deltas)
+    path = save_output if isinstance(save_output, str) else DEFAULT_PATH
+    rows = []
+    for i, iteration in enumerate(iterations):
+        for j, eps in enumerate(epsilons):
+            rows.append({
+                "experiment": "delta", "contract": "digital" if option_type == "digital" else "european",
+                "option_type": contract, "market": "EU", "S0": S0, "K": K, "sigma": sigma, "T": T, "r": r,
+                "steps": steps, "method": method, "sampler": sampler.method if sampler is not None else "random",
+                "seed": seed, "paths": iteration, "epsilon": eps, "estimate": deltas[i, j],
+                "std_error": std_deltas[i, j], "reference": bs_deltas[i, j], "error": errors[i, j],
+            })
+
+    with ResultsStore(path) as store:
+        return store.append(rows)
 
 
 def get_N_HexCol(N=5):
@@ -678,8 +840,27 @@ def get_N_linestyles(N=5):
     return [linestyles[style % styles] for style in range(N)]
 
 
-def monte_carlo_asian(T, S0, K, r, sigma, steps, period=False, reps=100):
+def stream_time_slices(mc, n_paths, accumulators, sampler=None):
+    """
+    Simulates n_paths paths one time slice at a time and feeds every slice to the
+    accumulators, such that no (paths, steps) matrix is stored.
+    :param mc: MonteCarlo object with the parameters of the paths
+    :param n_paths: number of paths
+    :param accumulators: objects with an update(prices) method (see accumulators.py)
+    :param sampler: NormalSampler of the normal numbers of every slice (random or latin_hypercube)
+    :return: prices at maturity
+    """
+    for prices in mc.time_slices(n_paths, sampler):
+        for accumulator in accumulators:
+            accumulator.update(prices)
+    return prices
+
+def monte_carlo_asian(T, S0, K, r, sigma, steps, period=False, reps=100, chunk_size=1000000, sampler=None):
     '''
+    Prices an arithmetic Asian call on streamed paths. The average is taken over the
+    prices at t_1, ..., t_N, or with a period over t_p, t_2p, ..., so the spot price at
+    t_0 is no longer part of the average (the earlier per-path loop averaged t_0, t_p, ...).
+    The price is discounted, which the earlier loop did not do.
     :param T: time in years
     :param S0: stock price at time = 0
     :param K: sttrike price
@@ -688,35 +869,34 @@ def monte_carlo_asian(T, S0, K, r, sigma, steps, period=False, reps=100):
     :param steps: amount of intervals in time
     :param period: time window of asian average pricing in number of steps
     :param reps: amount of repetitions of the monte carlo progress
-    :return: option price and list of payoffs
+    :param chunk_size: number of paths simulated at once
+    :param sampler: NormalSampler of the normal numbers (random or latin_hypercube, optionally
+                    antithetic), plain random numbers if None
+    :return: discounted option price and its standard error
     '''
 
     # Initialize the monte carlo class
-    mc = monte_carlo(steps, T, S0, sigma, r, K)
-    payoffs = np.zeros(reps)
+    mc = MonteCarlo(steps, T, S0, sigma, r, K)
+    stats_payoff = SamplerStats(sampler)
 
-    for rep in range(reps):
-        # Create wiener process
-        mc.wiener_method()
+    for start in range(0, reps, chunk_size):
+        size = min(chunk_size, reps - start)
 
-        # Take chucks of periods, or all prices
-        if period:
-            prices = mc.wiener_price_path[::period]
-        else:
-            prices = mc.wiener_price_path
+        # Stream the paths and average the prices at t_1, ..., t_N, or every period steps
+        average = PathSum(size, every=period or 1)
+        stream_time_slices(mc, size, [average], sampler)
+        stats_payoff.update(np.maximum(average.mean() - mc.K, 0))
 
-        # take the mean of the periods
-        mean_price = (sum(prices) / len(prices))
-        payoffs[rep] = max(mean_price - mc.K, 0)
-
-    # calculate the price by finding the mean of the payoffs
-    option_price = np.mean(payoffs)
-    return option_price, payoffs
+    # calculate the price by finding the mean of the discounted payoffs
+    discount = math.exp(-r * T)
+    return discount * stats_payoff.mean, discount * stats_payoff.std_error()
 
-def control_variance_asian(T=1, S0=100, K=99, r=0.06, sigma=0.2, steps=100, reps=10000):
+def control_variance_asian(
+    T=1, S0=100, K=99, r=0.06, sigma=0.2, steps=100, reps=10000, chunk_size=1000000, sampler=None
+    ):
     '''
     Control variance on the Asian option price, taking geometric averaging as control since we have the
-    Black-Scholes price of it. We pridict using a monte-carlo method.
+    Black-Scholes price of it. The coefficient of the control is estimated from the sample covariance.
     :param T: time in years
     :param S0: stock price at time = 0
     :param K: sttrike price
@@ -724,47 +904,605 @@ def control_variance_asian(T=1, S0=100, K=99, r=0.06, sigma=0.2, steps=100, reps
     :param sigma: volatility
     :param steps: amount of intervals in time
     :param reps: amount of repetitions of the monte carlo progress
-    :return: option price and list of payoffs
+    :param chunk_size: number of paths simulated at once
+    :param sampler: NormalSampler of the normal numbers (random or latin_hypercube, optionally
+                    antithetic), plain random numbers if None. Antithetic pairs are averaged
+                    before the covariance is estimated, Latin hypercube draws give the
+                    conservative plain estimate.
+    :return: controlled option price and its standard error
     '''
     # Initialize classes
-    mc = monte_carlo(steps, T, S0, sigma, r, K)
+    mc = MonteCarlo(steps, T, S0, sigma, r, K)
     bs = BlackScholes(T, S0, K, r, sigma, steps)
-
-    # Estimate Rho and get analytical option price
-    N = steps
-    rho = 0.99
     C_B = bs.asian_call_price()
+    discount = math.exp(-r * T)
 
-    # Calculate B from different sigmas
-    sigma_mean = sigma / np.sqrt(3)
-    sigma_gmean =  sigma * np.sqrt(((N + 1) * (2 * N + 1)) / (6 * N ** 2))
+    # Payoffs of the arithmetic (column 0) and geometric (column 1) average of the same
+    # paths, which are streamed one time slice at a time. Only their means and covariance
+    # are kept, the controlled estimate is mean_A - beta (mean_G - C_B) with the variance
+    # var_A - cov^2 / var_G of the residual.
+    stats_cv = RunningCovariance(2)
+    for start in range(0, reps, chunk_size):
+        n = min(chunk_size, reps - start)
+        arithmetic, geometric = PathSum(n), PathLogSum(n)
+        stream_time_slices(mc, n, [arithmetic, geometric], sampler)
+        samples = np.empty((n, 2))
+        samples[:, 0] = discount * np.maximum(arithmetic.mean() - K, 0)
+        samples[:, 1] = discount * np.maximum(geometric.mean() - K, 0)
+        if sampler is not None and sampler.antithetic:
+            samples = 0.5 * (samples[:n // 2] + samples[n // 2:])
+        stats_cv.update(samples)
+
+    option_price, std_error, _ = stats_cv.control_variate([C_B])
+
+    return option_price, std_error
+
+def lookback_monte_carlo(
+    T, S0, K, r, sigma, steps=365, reps=100000, chunk_size=1000000,
+    option_type="call", strike="floating", sampler=None
+    ):
+    """
+    Prices a discretely monitored lookback option on streamed paths, only the running
+    maximum and minimum of every path are kept.
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price (only used for fixed strikes)
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility
+    :param steps: number of monitoring dates
+    :param reps: number of paths
+    :param chunk_size: number of paths simulated at once
+    :param option_type: call or put
+    :param strike: floating (the extreme price is the strike) or fixed
+    :param sampler: NormalSampler of the normal numbers (random or latin_hypercube, optionally
+                    antithetic), plain random numbers if None
+    :return: option price and standard error
+    """
+    mc = MonteCarlo(steps, T, S0, sigma, r, K)
+    stats_payoff = SamplerStats(sampler)
+
+    for start in range(0, reps, chunk_size):
+        size = min(chunk_size, reps - start)
+        maximum, minimum = PathMax(size, S0), PathMin(size, S0)
+        terminal = stream_time_slices(mc, size, [maximum, minimum], sampler)
+
+        if strike == "floating" and option_type == "call":
+            payoffs = terminal - minimum.value
+        elif strike == "floating":
+            payoffs = maximum.value - terminal
+        elif option_type == "call":
+            payoffs = np.maximum(maximum.value - K, 0)
+        else:
+            payoffs = np.maximum(K - minimum.value, 0)
+        stats_payoff.update(payoffs)
 
-    Beta = (sigma_mean / sigma_gmean) * rho
-    payoffs = np.zeros(reps)
+    discount = math.exp(-r * T)
+    return discount * stats_payoff.mean, discount * stats_payoff.std_error()
 
-    # Repeat monte carlo for #reps times
-    for rep in range(reps) :
-        # Create wiener process
-        mc.wiener_method()
+def control_variate_samples(mc, random_numbers, controls, contract="asian", option_type="call"):
+    """
+    Discounted payoffs of the contract (column 0) and of the controls (further columns)
+    on a batch of paths.
+    :param mc: MonteCarlo object with the parameters of the paths
+    :param random_numbers: standard normal numbers of shape (paths, steps)
+    :param controls: list of controls (geometric, stock, european)
+    :param contract: asian (arithmetic average over t_1, ..., t_N) or european
+    :param option_type: call or put
+    :return: array of shape (paths, 1 + len(controls))
+    """
+    sign = 1 if option_type == "call" else -1
+    discount = math.exp(-mc.r * mc.T)
+    paths = mc.euler_path_vectorized(random_numbers)
+    terminal = paths[:, -1]
+
+    samples = np.empty((paths.shape[0], 1 + len(controls)))
+    underlying = paths.mean(axis=1, dtype=np.float64) if contract == "asian" else terminal
+    samples[:, 0] = np.maximum(sign * (underlying - mc.K), 0)
+
+    for i, control in enumerate(controls, start=1):
+        if control == "geometric":
+            geometric = np.exp(np.log(paths).mean(axis=1, dtype=np.float64))
+            samples[:, i] = np.maximum(sign * (geometric - mc.K), 0)
+        elif control == "stock":
+            samples[:, i] = terminal
+        elif control == "european":
+            samples[:, i] = np.maximum(sign * (terminal - mc.K), 0)
+
+    samples *= discount
+    return samples
+
+def control_variate_expectations(T, S0, K, r, sigma, steps, controls, option_type="call"):
+    """
+    Known (discounted) expectations of the controls.
+    :param controls: list of controls (geometric, stock, european)
+    :param option_type: call or put
+    :return: array of expectations
+    """
+    bs = BlackScholes(T, S0, K, r, sigma, steps)
+    closed_forms = {
+        "geometric": bs.asian_call_price if option_type == "call" else bs.asian_put_price,
+        "stock": lambda: S0,
+        "european": bs.call_price if option_type == "call" else bs.put_price,
+    }
+    return np.array([closed_forms[control]() for control in controls])
+
+def control_variate_monte_carlo(
+    T, S0, K, r, sigma, steps=100, reps=100000, contract="asian", option_type="call",
+    controls=["geometric"], chunk_size=100000, sampler=None, dtype=np.float64
+    ):
+    """
+    Monte Carlo price with control variates, the optimal coefficients of the controls
+    are estimated from the sample covariance which is accumulated over the batches.
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility
+    :param steps: number of monitoring dates
+    :param reps: number of paths
+    :param contract: asian (arithmetic average) or european
+    :param option_type: call or put
+    :param controls: list of controls (geometric, stock, european)
+    :param chunk_size: number of paths simulated at once
+    :param sampler: NormalSampler of the normal numbers (optional)
+    :param dtype: precision of the simulated paths (float64 or float32)
+    :return: price, standard error and the coefficients of the controls
+    """
+    assert contract in ["asian", "european"], "Non-existing contract."
+    assert option_type in ["call", "put"], "Non-existing option type."
+    assert all(control in ["geometric", "stock", "european"] for control in controls), "Control not found."
+    sampler = sampler or NormalSampler()
 
-        # Get price path
-        prices = mc.wiener_price_path
+    mc = MonteCarlo(steps, T, S0, sigma, r, K, dtype=dtype)
+    expectations = control_variate_expectations(T, S0, K, r, sigma, steps, controls, option_type)
 
-        # Calculate both geometric mean and normal mean from same price path (Seed)
-        mean_price = (sum(prices) / len(prices))
-        gmean_price = stats.gmean(prices)
+    stats_cv = RunningCovariance(1 + len(controls))
+    for start in range(0, reps, chunk_size):
+        n = min(chunk_size, reps - start)
+        stats_cv.update(control_variate_samples(mc, sampler.draw((n, steps)), controls, contract, option_type))
 
-        # Calculate payoff of individual methods
-        C_a = max(mean_price - mc.K, 0)
-        C_b = max(gmean_price - mc.K, 0)
+    return stats_cv.control_variate(expectations)
 
-        # Apply control variance with analytical option price
-        payoffs[rep] = C_a - Beta * (C_b - C_B)
+def merton_monte_carlo(
+    T, S0, K, r, sigma, lam, mu_j, sigma_j, steps=1, reps=100000,
+    chunk_size=100000, contract="call", generate_path=False, dtype=np.float64, sampler=None
+    ):
+    """
+    Prices an European option under the Merton jump-diffusion model. Normal draws,
+    jump counts and jump sizes are generated in bulk for each chunk of paths.
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility of the diffusion
+    :param lam: Jump intensity per year
+    :param mu_j: Mean of the log jump size
+    :param sigma_j: Standard deviation of the log jump size
+    :param steps: Number of time steps (only used if generate_path is True)
+    :param reps: Total number of simulated paths
+    :param chunk_size: Number of paths simulated at once
+    :param contract: call or put
+    :param generate_path: simulate full paths instead of the final prices only
+    :param dtype: precision of the simulated paths (float64 or float32)
+    :param sampler: NormalSampler of the diffusion normals, plain random numbers if None
+    :return: option price, standard error and the Merton closed form
+    """
+    mc = MonteCarlo(steps, T, S0, sigma, r, K, dtype=dtype)
+    discount = math.exp(-r * T)
+
+    # Mean and variance of the payoffs are accumulated per chunk (in float64 whatever
+    # the precision of the paths) to avoid storing all paths
+    stats_payoff = SamplerStats(sampler)
+    for start in range(0, reps, chunk_size):
+        size = min(chunk_size, reps - start)
+        shape = (size, steps) if generate_path else size
+        S = mc.merton_jump_vectorized(
+            draw_normals(shape, sampler), lam, mu_j, sigma_j, generate_path
+            )
+        if generate_path:
+            S = S[:, -1]
+
+        if contract == "call":
+            payoffs = np.maximum(S - K, 0)
+        else:
+            payoffs = np.maximum(K - S, 0)
+        stats_payoff.update(payoffs)
+
+    option_price = discount * stats_payoff.mean
+    std_error = discount * stats_payoff.std_error()
+
+    merton = MertonJumpDiffusion(T, S0, K, r, sigma, lam, mu_j, sigma_j)
+    if contract == "call":
+        reference = merton.call_price()
+    else:
+        reference = merton.put_price()
+
+    return option_price, std_error, reference
+
+def worker_hedge_pnl(args):
+    """
+    Simulates one shard of hedged paths chunk by chunk and returns the summaries
+    of the profits as plain dicts, such that shards of different workers can be merged.
+    """
+    T, S0, K, r, sigma, hedge_steps, reps, chunk_size, option_type, seed, k, pnl_range, bins = args
+    np.random.seed(seed)
+    bs = BlackScholes(T, S0, K, r, sigma, hedge_steps)
+
+    stats_pnl = RunningStats()
+    sketch = QuantileSketch(k)
+    histogram = Histogram(pnl_range[0], pnl_range[1], bins)
+    for start in range(0, reps, chunk_size):
+        size = min(chunk_size, reps - start)
+        profits = bs.hedge_pnl_vectorized(np.random.normal(size=(size, hedge_steps)), option_type)
+        stats_pnl.update(profits)
+        sketch.update(profits)
+        histogram.update(profits)
+
+    return stats_pnl.to_dict(), sketch.to_dict(), histogram.to_dict()
+
+def hedge_pnl_distribution(
+    T, S0, K, r, sigma, hedge_steps=52, reps=1000000, chunk_size=100000, option_type="call",
+    workers=1, seed_nr=10, alpha=0.05, k=400, pnl_range=None, bins=200
+    ):
+    """
+    Distribution of the profit of delta hedging a sold option. The profits are summarized
+    chunk by chunk in a quantile sketch and a histogram, such that the memory does not
+    grow with the number of paths, and the summaries of the workers are merged.
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility
+    :param hedge_steps: number of rebalancing dates
+    :param reps: total number of simulated paths
+    :param chunk_size: number of paths simulated at once
+    :param option_type: call or put
+    :param workers: number of worker processes (every worker simulates a shard with its own seed)
+    :param seed_nr: seed of the first shard
+    :param alpha: level of the value at risk and expected shortfall
+    :param k: accuracy parameter of the quantile sketch (rank error of order 1 / k)
+    :param pnl_range: range of the histogram (default: +/- half a standard deviation of S0)
+    :param bins: number of bins of the histogram
+    :return: dict with the mean, standard error, value at risk, expected shortfall and
+             quantiles of the profit, and the merged sketch and histogram
+    """
+    if pnl_range is None:
+        pnl_range = (-0.5 * sigma * S0, 0.5 * sigma * S0)
+
+    shards = np.full(workers, reps // workers)
+    shards[:reps % workers] += 1
+    args = [(T, S0, K, r, sigma, hedge_steps, int(n), chunk_size, option_type, seed_nr + w, k, pnl_range, bins)
+            for w, n in enumerate(shards)]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(worker_hedge_pnl, args)
+    else:
+        results = [worker_hedge_pnl(args[0])]
+
+    stats_pnl = RunningStats()
+    sketch = QuantileSketch(k)
+    histogram = Histogram(pnl_range[0], pnl_range[1], bins)
+    for stats_dict, sketch_dict, histogram_dict in results:
+        stats_pnl.merge(RunningStats.from_dict(stats_dict))
+        sketch.merge(QuantileSketch.from_dict(sketch_dict))
+        histogram.merge(Histogram.from_dict(histogram_dict))
+
+    levels = [0.01, 0.05, 0.5, 0.95, 0.99]
+    return {
+        "mean": stats_pnl.mean,
+        "std_error": stats_pnl.std_error(),
+        "std": math.sqrt(stats_pnl.variance()),
+        "value_at_risk": -float(sketch.quantile(alpha)),
+        "expected_shortfall": -float(sketch.tail_mean(alpha)),
+        "quantiles": dict(zip(levels, sketch.quantile(levels).tolist())),
+        "sketch": sketch,
+        "histogram": histogram,
+    }
+
+def validate_precision(T=1, S0=100, K=99, r=0.06, sigma=0.2, steps=50, reps=200000, seed_nr=10, dtype=np.float32):
+    """
+    Runs the simulation engines twice on the same random numbers, in float64 and in the
+    given precision, and compares the differences with the statistical error.
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility
+    :param steps: number of time steps of the path engines
+    :param reps: number of paths
+    :param seed_nr: seed shared by both runs
+    :param dtype: precision to validate
+    :return: dict per engine with both estimates, their difference, the standard error
+             (zero for the tree) and the time of both runs
+    """
+    engines = {
+        "asian": lambda precision: control_variate_monte_carlo(
+            T, S0, K, r, sigma, steps, reps, controls=[], dtype=precision)[:2],
+        "asian_control_variate": lambda precision: control_variate_monte_carlo(
+            T, S0, K, r, sigma, steps, reps, dtype=precision)[:2],
+        "merton": lambda precision: merton_monte_carlo(
+            T, S0, K, r, sigma, 1, -0.1, 0.2, steps, reps, generate_path=True, dtype=precision)[:2],
+        "bump_and_revalue": lambda precision: [x[0] for x in bump_revalue_vectorized(
+            T, S0, K, r, sigma, steps, epsilons=[0.5], seeds=[seed_nr], reps=reps, dtype=precision)][::3],
+        "binomial": lambda precision: (BinTreeOption(
+            1001, T, S0, sigma, r, K, "USA", "put", theoretical_delta=False, dtype=precision
+            ).determine_price()[0], 0.0),
+    }
+
+    results = {}
+    for name, engine in engines.items():
+        runs = []
+        for precision in [np.float64, dtype]:
+            np.random.seed(seed_nr)
+            start = time.perf_counter()
+            estimate, std_error = engine(precision)
+            runs.append((float(estimate), float(std_error), time.perf_counter() - start))
+
+        (estimate_64, std_error, time_64), (estimate_low, _, time_low) = runs
+        results[name] = {
+            "float64": estimate_64, str(np.dtype(dtype)): estimate_low,
+            "difference": abs(estimate_low - estimate_64), "std_error": std_error,
+            "time_float64": time_64, "time_" + str(np.dtype(dtype)): time_low,
+        }
+
+    return results
+
+def barrier_monte_carlo(
+    T, S0, K, r, sigma, barrier, barrier_type="down-and-out", option_type="call",
+    steps=50, reps=100000, chunk_size=100000, monitoring_dates=None, bridge=True,
+    dtype=np.float64, sampler=None
+    ):
+    """
+    Prices a single barrier option on batches of exact paths. Continuous monitoring
+    uses the Brownian bridge between the steps. A barrier monitored at given dates is
+    priced on the coarse steps through the Broadie-Glasserman-Kou shifted barrier.
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility
+    :param barrier: barrier level
+    :param barrier_type: down-and-out, down-and-in, up-and-out or up-and-in
+    :param option_type: call or put
+    :param steps: number of simulated time steps
+    :param reps: number of paths
+    :param chunk_size: number of paths simulated at once
+    :param monitoring_dates: number of equally spaced monitoring dates (None for continuous monitoring)
+    :param bridge: Brownian bridge between the steps, otherwise the barrier is only checked
+                   at the steps (monitoring_dates is then ignored)
+    :param dtype: precision of the simulated paths (float64 or float32)
+    :param sampler: NormalSampler of the normal numbers, plain random numbers if None
+    :return: option price, standard error and the closed form
+    """
+    mc = MonteCarlo(steps, T, S0, sigma, r, K, option_type=option_type, dtype=dtype)
+    closed_form = BarrierOption(T, S0, K, r, sigma, barrier, barrier_type, option_type)
+    discount = math.exp(-r * T)
 
-    # Option price is equal to the mean of the payoffs
-    option_price = np.mean(payoffs)
+    # The closed forms of the discretely monitored options are continuity corrected
+    level = barrier
+    if monitoring_dates is not None:
+        level = closed_form.shifted_barrier(monitoring_dates)
+        reference = closed_form.discrete_price(monitoring_dates)
+    else:
+        reference = closed_form.price()
+    if not bridge:
+        level = barrier
+        reference = closed_form.discrete_price(steps)
+
+    stats_payoff = SamplerStats(sampler)
+    for start in range(0, reps, chunk_size):
+        size = min(chunk_size, reps - start)
+        paths = mc.euler_path_vectorized(draw_normals((size, steps), sampler))
+        stats_payoff.update(mc.barrier_payoffs(paths, level, barrier_type, bridge))
+
+    return discount * stats_payoff.mean, discount * stats_payoff.std_error(), reference
+
+def conditional_monte_carlo_greeks(
+    T, S0, K, r, sigma, steps=50, reps=100000, contract="digital", option_type="call",
+    barrier=None, barrier_type="down-and-out", epsilon=None, chunk_size=100000, dtype=np.float64,
+    sampler=None
+    ):
+    """
+    Price, delta and gamma of digital and discretely monitored barrier options with
+    conditional Monte Carlo: the last step (and for barriers the survival of every
+    step) is integrated analytically, such that the payoff is smooth in S0. Digital
+    Greeks are pathwise, barrier Greeks are central bumps on the same uniforms. Unlike
+    the indicator payoffs of bump and revalue and the likelihood ratio method, the
+    errors decrease at the normal rate without a trade-off in the bump size.
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility
+    :param steps: number of time steps (monitoring dates of the barrier)
+    :param reps: number of paths
+    :param contract: digital (cash-or-nothing) or barrier
+    :param option_type: call or put
+    :param barrier: barrier level (barrier contracts only)
+    :param barrier_type: down-and-out, down-and-in, up-and-out or up-and-in, knock-in
+                         options follow from in-out parity with Black Scholes
+    :param epsilon: bump of S0 for the barrier Greeks (default 1% of S0)
+    :param chunk_size: number of paths simulated at once
+    :param dtype: precision of the simulated prices (float64 or float32)
+    :param sampler: NormalSampler of the normal numbers (mapped to the uniforms of the barrier
+                    steps), plain random numbers if None
+    :return: dict with the price, delta and gamma, their standard errors and references
+    """
+    assert contract in ["digital", "barrier"], "Non-existing contract."
+    discount = math.exp(-r * T)
+    epsilon = 0.01 * S0 if epsilon is None else epsilon
+    knock_out = barrier_type.replace("-in", "-out")
+
+    models = [MonteCarlo(steps, T, S, sigma, r, K, option_type=option_type, dtype=dtype)
+              for S in [S0, S0 + epsilon, S0 - epsilon]]
+    stats_price, stats_delta, stats_gamma = SamplerStats(sampler), SamplerStats(sampler), SamplerStats(sampler)
+    for start in range(0, reps, chunk_size):
+        size = min(chunk_size, reps - start)
+        if contract == "digital":
+            payoffs, deltas, gammas = models[0].conditional_digital_payoffs(draw_normals(size, sampler))
+        else:
+            if sampler is None:
+                uniforms = np.random.uniform(size=(size, steps - 1))
+            else:
+                uniforms = ndtr(sampler.draw((size, steps - 1)))
+            payoffs, up, down = [mc.conditional_barrier_payoffs(uniforms, barrier, knock_out) for mc in models]
+            deltas = (up - down) / (2 * epsilon)
+            gammas = (up - 2 * payoffs + down) / epsilon ** 2
+        stats_price.update(payoffs)
+        stats_delta.update(deltas)
+        stats_gamma.update(gammas)
+
+    results = {}
+    for name, stats_greek in [("price", stats_price), ("delta", stats_delta), ("gamma", stats_gamma)]:
+        results[name] = discount * stats_greek.mean
+        results[name + "_std_error"] = discount * stats_greek.std_error()
+
+    # Closed forms: the digital exactly, the barrier continuity corrected with bumps for the Greeks
+    if contract == "digital":
+        phi = 1 if option_type == "call" else -1
+        d2 = (math.log(S0 / K) + (r - 0.5 * sigma ** 2) * T) / (sigma * math.sqrt(T))
+        references = [
+            discount * stats.norm.cdf(phi * d2),
+            phi * discount * stats.norm.pdf(d2) / (S0 * sigma * math.sqrt(T)),
+            -phi * discount * stats.norm.pdf(d2) * (d2 / (sigma * math.sqrt(T)) + 1) / (S0 ** 2 * sigma * math.sqrt(T)),
+        ]
+    else:
+        up, mid, down = [BarrierOption(T, S, K, r, sigma, barrier, knock_out, option_type).discrete_price(steps)
+                         for S in [S0 + epsilon, S0, S0 - epsilon]]
+        references = [mid, (up - down) / (2 * epsilon), (up - 2 * mid + down) / epsilon ** 2]
+    results.update(zip(["price_reference", "delta_reference", "gamma_reference"], references))
+
+    # Knock-in options are the vanilla option minus the knock-out option
+    if contract == "barrier" and barrier_type.endswith("in"):
+        bs = BlackScholes(T, S0, K, r, sigma)
+        d1 = (math.log(S0 / K) + (r + 0.5 * sigma ** 2) * T) / (sigma * math.sqrt(T))
+        vanilla = [bs.call_price() if option_type == "call" else bs.put_price(), bs.hedge(0, S0, option_type),
+                   stats.norm.pdf(d1) / (S0 * sigma * math.sqrt(T))]
+        for name, value in zip(["price", "delta", "gamma"], vanilla):
+            results[name] = value - results[name]
+            results[name + "_reference"] = value - results[name + "_reference"]
+
+    return results
+
+def importance_sampling_payoffs(
+    T, S0, K, r, sigma, steps, z, shift, contract="call",
+    option_type="regular", generate_path=False, asian=False, workspace=None
+    ):
+    """
+    Weighted payoffs of shifted normal draws, undiscounted.
+    :param z: standard normal draws, shape (paths,) or (paths, steps) for path engines
+    :param shift: shift of the terminal normal (spread evenly over the steps of a path)
+    :param workspace: Workspace for the terminal prices (optional)
+    :return: payoffs multiplied by the likelihood ratios
+    """
+    mc = MonteCarlo(steps, T, S0, sigma, r, K)
+
+    if generate_path:
+        step_shift = shift / math.sqrt(steps)
+        z = z + step_shift
+        log_ratio = -step_shift * z.sum(axis=1) + 0.5 * steps * step_shift ** 2
+        paths = mc.euler_path_vectorized(z)
+        S = paths.mean(axis=1) if asian else paths[:, -1]
+    else:
+        z = z + shift
+        log_ratio = -shift * z + 0.5 * shift ** 2
+        out = workspace.get("prices", z.shape[0]) if workspace is not None else None
+        S = mc.euler_method_vectorized(z, math.sqrt(T), out=out)
+
+    sign = 1 if contract == "call" else -1
+    if option_type == "digital":
+        payoffs = (sign * (S - K) > 0).astype(float)
+    else:
+        payoffs = np.maximum(sign * (S - K), 0)
+
+    return payoffs * np.exp(log_ratio)
+
+def importance_sampling_shift(
+    T, S0, K, r, sigma, steps=1, contract="call", option_type="regular",
+    pilot_reps=0, generate_path=False, asian=False, chunk_size=100000, sampler=None
+    ):
+    """
+    Shift of the terminal normal draw for importance sampling. The analytic shift moves
+    the median of the terminal price to the strike of an out-of-the-money option, a pilot
+    run picks the shift with the smallest standard error around it.
+    :param pilot_reps: number of paths per candidate shift (0 gives the analytic shift)
+    :param chunk_size: number of paths simulated at once
+    :param sampler: NormalSampler of the normal numbers, plain random numbers if None
+    :return: shift of the terminal standard normal
+    """
+    # Normal draw at which the terminal price equals the strike
+    boundary = (math.log(K / S0) - (r - 0.5 * sigma ** 2) * T) / (sigma * math.sqrt(T))
+    shift = max(boundary, 0) if contract == "call" else min(boundary, 0)
+    if pilot_reps <= 0 or shift == 0:
+        return shift
+
+    candidates = np.linspace(0.5 * shift, 1.5 * shift, 11)
+    std_errors = np.zeros(candidates.size)
+    workspace = Workspace()
+    for i, candidate in enumerate(candidates):
+        stats_weighted = SamplerStats(sampler)
+        for start in range(0, pilot_reps, chunk_size):
+            size = min(chunk_size, pilot_reps - start)
+            shape = (size, steps) if generate_path else size
+            stats_weighted.update(importance_sampling_payoffs(
+                T, S0, K, r, sigma, steps, draw_normals(shape, sampler), candidate,
+                contract, option_type, generate_path, asian, workspace
+                ))
+        std_errors[i] = stats_weighted.std_error()
+
+    return candidates[np.argmin(std_errors)]
+
+def importance_sampling_monte_carlo(
+    T, S0, K, r, sigma, steps=1, reps=10000, contract="call", option_type="regular",
+    shift=None, pilot_reps=0, generate_path=False, asian=False, chunk_size=100000, sampler=None
+    ):
+    """
+    Prices deep out-of-the-money and digital options with importance sampling: the normal
+    draws are shifted towards the exercise region and the payoffs are reweighted with the
+    likelihood ratios. Works on the terminal prices and on full price paths.
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility
+    :param steps: number of steps of the price paths
+    :param reps: number of paths
+    :param contract: call or put
+    :param option_type: regular or digital
+    :param shift: shift of the terminal normal (None determines it analytically or by a pilot run)
+    :param pilot_reps: number of paths per candidate shift of the pilot run
+    :param generate_path: use the full path engine instead of the terminal prices
+    :param asian: arithmetic average payoff (only with generate_path)
+    :param chunk_size: number of paths simulated at once
+    :param sampler: NormalSampler of the (unshifted) normal numbers, plain random numbers if None
+    :return: option price, standard error and the used shift
+    """
+    engine, engine_steps = ("path", steps) if generate_path else ("terminal", 1)
+    check_memory(
+        min(chunk_size, max(reps, pilot_reps)) * engine_bytes(engine, engine_steps),
+        f"Importance sampling with chunks of {chunk_size} paths"
+        )
+
+    if shift is None:
+        shift = importance_sampling_shift(
+            T, S0, K, r, sigma, steps, contract, option_type, pilot_reps, generate_path, asian, chunk_size,
+            sampler
+            )
+
+    # Weighted payoffs are streamed chunk by chunk into the accumulator
+    stats_weighted = SamplerStats(sampler)
+    workspace = Workspace()
+    for start in range(0, reps, chunk_size):
+        size = min(chunk_size, reps - start)
+        shape = (size, steps) if generate_path else size
+        stats_weighted.update(importance_sampling_payoffs(
+            T, S0, K, r, sigma, steps, draw_normals(shape, sampler), shift,
+            contract, option_type, generate_path, asian, workspace
+            ))
+
+    discount = math.exp(-r * T)
+    return discount * stats_weighted.mean, discount * stats_weighted.std_error(), shift
 
-    return option_price, payoffs
 
 ########################################################################################################################
 ########################################################################################################################
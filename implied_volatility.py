@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Implied volatilities of European quotes (vectorized Newton with a
+bisection fallback) and American quotes (warm-started secant on binomial trees).
+"""
+
+import numpy as np
+
+from binomial_tree import BinTreeOption, BlackScholes
+
+
+def implied_volatility(
+    prices, T, S0, K, r, option_type="call", tol=1e-8, max_iter=100,
+    sigma_low=1e-4, sigma_high=5.0
+    ):
+    """
+    Implied volatilities of an array of European quotes. Every quote keeps a bracket
+    of the volatility and Newton steps that leave the bracket are replaced by bisection.
+    :param prices: option prices (numeric or array)
+    :param T:  Maturity in years (numeric or array)
+    :param S0: Stock price at spot time (numeric or array)
+    :param K:  Strike price (numeric or array)
+    :param r:  Risk-free interest rate (numeric or array)
+    :param option_type: call or put
+    :param tol: tolerance on the price
+    :param max_iter: maximum number of iterations
+    :param sigma_low: lower bound of the volatility bracket
+    :param sigma_high: upper bound of the volatility bracket
+    :return: implied volatilities (nan for quotes outside the no-arbitrage bounds and for
+             quotes that did not converge within max_iter, such as quotes whose volatility
+             lies outside [sigma_low, sigma_high])
+    """
+    prices, T, S0, K, r = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in (prices, T, S0, K, r)]
+        )
+    prices, T, S0, K, r = [x.ravel() for x in (prices, T, S0, K, r)]
+    call = option_type.lower() == "call"
+
+    # No-arbitrage bounds of the quotes
+    discounted_K = K * np.exp(-r * T)
+    if call:
+        lower, upper = np.maximum(S0 - discounted_K, 0), S0
+    else:
+        lower, upper = np.maximum(discounted_K - S0, 0), discounted_K
+    valid = (prices > lower) & (prices < upper)
+
+    # Brenner-Subrahmanyam approximation as starting point
+    sigma = np.clip(np.sqrt(2 * np.pi / T) * prices / S0, sigma_low, sigma_high)
+    low = np.full(prices.shape, sigma_low)
+    high = np.full(prices.shape, sigma_high)
+
+    # Only iterate on quotes that did not converge yet
+    active = np.flatnonzero(valid)
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+
+        bs = BlackScholes(T[active], S0[active], K[active], r[active], sigma[active])
+        diff = (bs.call_price() if call else bs.put_price()) - prices[active]
+        vega = bs.vega()
+
+        # Shrink the bracket, the price increases with the volatility
+        high[active] = np.where(diff > 0, sigma[active], high[active])
+        low[active] = np.where(diff < 0, sigma[active], low[active])
+
+        # Newton step with bisection if it leaves the bracket
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            newton = sigma[active] - diff / vega
+        outside = ~((newton > low[active]) & (newton < high[active]))
+        sigma[active] = np.where(outside, 0.5 * (low[active] + high[active]), newton)
+
+        active = active[np.abs(diff) > tol]
+
+    # Quotes still active did not reach the tolerance, this includes quotes stuck at a
+    # bound of the bracket because their volatility lies outside of it
+    sigma[active] = np.nan
+    sigma[~valid] = np.nan
+
+    return sigma
+
+
+def american_implied_volatility(
+    prices, T, S0, K, r, option_type="put", N=201, lattice="lr",
+    tol=1e-6, max_iter=50
+    ):
+    """
+    Implied volatilities of American quotes with the secant method on binomial trees.
+    The first guess is the European implied volatility of the quote, while quotes are
+    solved in order of strike such that the previous solution warm-starts the next one.
+    :param prices: option prices (array)
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike prices (array)
+    :param r:  Risk-free interest rate
+    :param option_type: call or put
+    :param N: number of steps of the binomial tree
+    :param lattice: lattice construction of the binomial tree
+    :param tol: tolerance on the price
+    :param max_iter: maximum number of secant iterations per quote
+    :return: implied volatilities (nan if no solution was found)
+    """
+    prices, K = np.broadcast_arrays(np.asarray(prices, dtype=float), np.asarray(K, dtype=float))
+    prices, K = prices.ravel(), K.ravel()
+    sigmas = np.full(prices.shape, np.nan)
+
+    def tree_price(sigma, strike):
+        tree = BinTreeOption(
+            N, T, S0, sigma, r, strike, market="USA", option_type=option_type,
+            lattice=lattice, theoretical_delta=False
+            )
+        return tree.determine_price()[0]
+
+    # European implied volatilities as first guesses
+    guesses = implied_volatility(prices, T, S0, K, r, option_type)
+
+    previous = None
+    for i in np.argsort(K):
+        sigma_0 = guesses[i] if np.isfinite(guesses[i]) else previous
+        if sigma_0 is None:
+            continue
+        sigma_1 = previous if previous is not None and previous != sigma_0 else 1.05 * sigma_0
+
+        diff_0 = tree_price(sigma_0, K[i]) - prices[i]
+        diff_1 = tree_price(sigma_1, K[i]) - prices[i]
+        for _ in range(max_iter):
+            if abs(diff_1) < tol or diff_1 == diff_0:
+                break
+
+            sigma_0, sigma_1 = sigma_1, max(sigma_1 - diff_1 * (sigma_1 - sigma_0) / (diff_1 - diff_0), 1e-4)
+            diff_0, diff_1 = diff_1, tree_price(sigma_1, K[i]) - prices[i]
+
+        if abs(diff_1) < tol:
+            sigmas[i] = previous = sigma_1
+
+    return sigmas
+
+
+if __name__ == "__main__":
+
+    strikes = np.linspace(50, 150, 2000)
+    true_sigma = 0.2 + 0.1 * ((strikes - 100) / 100) ** 2
+    quotes = BlackScholes(1, 100, strikes, 0.06, true_sigma).call_price()
+    sigma = implied_volatility(quotes, 1, 100, strikes, 0.06, "call")
+    print("Maximum error European implied volatility:", np.nanmax(np.abs(sigma - true_sigma)))
+
+    american_strikes = np.array([90, 95, 99, 105, 110])
+    american_quotes = [
+        BinTreeOption(201, 1, 100, 0.25, 0.06, k, "USA", "put", lattice="lr").determine_price()[0]
+        for k in american_strikes
+        ]
+    print("American implied volatilities:",
+          american_implied_volatility(american_quotes, 1, 100, american_strikes, 0.06))
@@ -9,6 +9,9 @@ Final Project
 """
 
 import helper as helper
+import multilevel
+import sweep
+from memory_planner import PeakMemory, set_budget
 import numpy as np
 import argparse
 
@@ -23,7 +26,9 @@ The different - func: \n '
 -diff_K : Computes MC with different strike price using the default parameter \n \
 -diff_sigma : Computes MC with different implied volatility using the default parameter \n \
 -lr_method : Computes the likelihood ration for discounted payoffs of digital option \n \
--bump_and_revalue : Use bump and revalue method to determine the Delta \n ' )
+-bump_and_revalue : Use bump and revalue method to determine the Delta \n \
+-mlmc : Prices an Asian option with multilevel Monte Carlo up to the given accuracy \n \
+-sweep : Prices every cell of the parameter grid in the grid file on a pool of workers \n ' )
 
 parser.add_argument("-func",type = str, default='diff_Mc_samples', help='Defines which function to execute')
 parser.add_argument('-T', type=int,default=1, help='Time to maturity in years (default : 1)')
@@ -35,19 +40,36 @@ parser.add_argument('-s', type=float, default=0.2, help='volatility s (default :
 parser.add_argument('-option_type', type=str,default='put', help='option type call or put (default : call)')
 parser.add_argument('-market', type=str,default='EU', help='option type EU or USA(default : EU)')
 parser.add_argument('-save_plot',default=False, help='return the plots (default : False)')
-parser.add_argument('-diff_samples',type=int, default=[100,1000,10000,100000,1000000], help='Different number of samples (default: default=[100,1000,10000,100000,1000000])')
+parser.add_argument('-diff_samples',type=int,nargs='+', default=[100,1000,10000,100000,1000000], help='Different number of samples (default: default=[100,1000,10000,100000,1000000])')
 parser.add_argument('-samples',type=int,default=10000,help='Number of samples (default: 10000)')
-parser.add_argument('-different_k',type=int,default=np.linspace(80,130,dtype=int),help='Different strike price (default:80-130)')
-parser.add_argument('-different_s',type=float,default=np.linspace(0.01,1),help='Different volatility from 0 to 1')
-parser.add_argument('-epsilons',type=float,default= [0.01, 0.02, 0.5], help='set epsilon to bump the stock price for the bump and revalue method (default: [0.01, 0.02, 0.5])')
+parser.add_argument('-different_k',type=int,nargs='+',default=np.linspace(80,130,dtype=int),help='Different strike price (default:80-130)')
+parser.add_argument('-different_s',type=float,nargs='+',default=np.linspace(0.01,1),help='Different volatility from 0 to 1')
+parser.add_argument('-epsilons',type=float,nargs='+',default= [0.01, 0.02, 0.5], help='set epsilon to bump the stock price for the bump and revalue method (default: [0.01, 0.02, 0.5])')
+parser.add_argument('-accuracy',type=float,default=0.01,help='Root mean square error of the multilevel Monte Carlo estimate (default: 0.01)')
+parser.add_argument('-checkpoint',type=str,default=None,help='File to periodically checkpoint the sweep to (default: None)')
+parser.add_argument('--resume',action='store_true',help='Continue the sweep from the last checkpoint (default checkpoint: checkpoint.pkl)')
+parser.add_argument('-grid',type=str,default='grid.json',help='JSON or YAML file with the parameter grid of the sweep (default: grid.json)')
+parser.add_argument('-workers',type=int,default=3,help='Number of worker processes of the sweep (default: 3)')
+parser.add_argument('-output',type=str,default='sweep.csv',help='Output table of the sweep (default: sweep.csv)')
+parser.add_argument('-store',type=str,default=None,help='Results store (SQLite file) to append the sweep and diff_Mc_samples results to (default: None)')
+parser.add_argument('-dtype',type=str,default='float64',help='Precision of the simulated paths, float64 or float32 (default: float64)')
 parser.add_argument('-set_seed',type=str,default='fixed',help='Set a seed (default : fixed or random')
+parser.add_argument('-memory_budget',type=str,default=None,help='Memory budget of the run, e.g. 4G (default: 80%% of the available memory)')
+parser.add_argument('--trace_memory',action='store_true',help='Also report the peak allocations of the run with tracemalloc (slower)')
 parser=parser.parse_args()
 
+if parser.resume and parser.checkpoint is None:
+    parser.checkpoint = 'checkpoint.pkl'
 
-if not parser.func in ['wiener_process','diff_Mc_samples','diff_K','diff_sigma','lr_method','bump_and_revalue'] :
+
+if not parser.func in ['wiener_process','diff_Mc_samples','diff_K','diff_sigma','lr_method','bump_and_revalue','mlmc','sweep'] :
     print("\n\n\n !!! You need to define a funciton that exists !!!  \n\n\n")
     raise AssertionError()
 
+# Chunk sizes and tree sizes are checked against the memory budget, the peak memory is reported at the end
+set_budget(parser.memory_budget)
+memory = PeakMemory(parser.trace_memory)
+memory.start()
 
 '''
 Basic Option Valuation :
@@ -68,7 +90,10 @@ elif parser.func == 'diff_Mc_samples':
         parser.s,
         parser.steps,
         parser.diff_samples,
-        parser.save_plot)
+        parser.save_plot,
+        checkpoint=parser.checkpoint,
+        resume=parser.resume,
+        save_output=parser.store or False)
 
 elif parser.func == 'diff_K':
     helper.diff_K_monte_carlo_process(
@@ -136,7 +161,10 @@ elif parser.func == 'bump_and_revalue':
          parser.epsilons,
          parser.set_seed,
          parser.diff_samples,
-         parser.option_type
+         parser.option_type,
+         checkpoint=parser.checkpoint,
+         resume=parser.resume,
+         dtype=np.dtype(parser.dtype)
     )
 
 
@@ -151,6 +179,34 @@ elif parser.func == 'bump_and_revalue':
     print(errors.round(3))
     print("=================================================")
 
+elif parser.func == 'mlmc':
+    price, levels = multilevel.mlmc(
+        parser.T,
+        parser.S,
+        parser.K,
+        parser.r,
+        parser.s,
+        parser.accuracy,
+        payoff="asian",
+        contract=parser.option_type
+    )
+    print("Multilevel Monte Carlo Price:")
+    print(round(price, 3))
+    print("=================================================")
+    print("Samples per level:")
+    print(levels["samples"])
+    print("=================================================")
+    print("Variance per level:")
+    print(levels["variances"])
+    print("=================================================")
+
+elif parser.func == 'sweep':
+    rows = sweep.run_sweep(parser.grid, parser.workers, parser.output, parser.store)
+    print("Priced", len(rows), "grid cells, results written to", parser.output)
+
+memory.stop()
+print(memory.report())
+
 
 '''
 Variance Reduction:
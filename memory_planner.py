@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Memory planner that estimates the footprint of the simulation engines and
+trees, picks chunk sizes and worker counts that fit a memory budget and reports the
+peak memory of a run.
+"""
+
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import tracemalloc
+
+import numpy as np
+
+# Arrays alive at the peak of the chunked engines, including the temporaries of the
+# accumulators, as (float64 arrays per path, arrays in the simulation precision per path,
+# float64 arrays per path and time step, arrays in the simulation precision per path and
+# time step). The normal numbers and accumulators are float64, the prices follow dtype.
+# Measured with tracemalloc and rounded up, streaming counts one path accumulator.
+ENGINE_ARRAYS = {
+    "terminal": (2, 1, 0, 0),
+    "bump_revalue": (4, 2, 0, 0),
+    "path": (3, 0, 2, 1),
+    "streaming": (4, 1, 0, 0),
+}
+# The budget is a fraction of the available memory unless it is set explicitly
+BUDGET_FRACTION = 0.8
+_budget = None
+
+
+def parse_size(size):
+    """
+    Converts a size like 512M, 4G or 1.5e9 (bytes) to bytes.
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    size = size.strip().upper().rstrip("B")
+    units = {"K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(float(size))
+
+
+def format_size(size):
+    """
+    Converts bytes to a readable size.
+    """
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+def available_memory():
+    """
+    Memory available to new allocations in bytes (MemAvailable on Linux, otherwise the
+    free physical pages).
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def set_budget(budget):
+    """
+    Sets the memory budget of all runs (bytes or a size like 4G, None to use a
+    fraction of the available memory).
+    """
+    global _budget
+    _budget = None if budget is None else parse_size(budget)
+
+
+def memory_budget():
+    """
+    Returns the memory budget in bytes.
+    """
+    if _budget is not None:
+        return _budget
+    return int(BUDGET_FRACTION * available_memory())
+
+
+def engine_bytes(engine, steps=1, dtype=np.float64):
+    """
+    Estimated bytes per path of an engine.
+    :param engine: terminal, bump_revalue, path or streaming
+    :param steps: number of time steps of the paths
+    :param dtype: precision of the simulation (float32 halves the path arrays)
+    :return: bytes per path
+    """
+    assert engine in ENGINE_ARRAYS, f"Engine {engine} not found"
+    per_path, per_path_dtype, per_step, per_step_dtype = ENGINE_ARRAYS[engine]
+    itemsize = np.dtype(dtype).itemsize
+    return 8 * per_path + itemsize * per_path_dtype + steps * (8 * per_step + itemsize * per_step_dtype)
+
+
+def tree_bytes(N, lattice="crr", dtype=np.float64):
+    """
+    Bytes of the four trees (prices, option values, deltas and theoretical deltas)
+    of a BinTreeOption with N steps.
+    """
+    nodes = 2 * N + 1 if lattice == "trinomial" else N + 1
+    return 4 * nodes * (N + 1) * np.dtype(dtype).itemsize
+
+
+def chain_bytes(N, strikes, lattice="crr", dtype=np.float64):
+    """
+    Bytes of a BinTreeChain with N steps: the shared price tree (Leisen-Reimer chains
+    compute their prices per layer) and three float64 layers per strike for the option
+    values, the stock prices of the layer and the temporaries of the induction.
+    """
+    nodes = 2 * N + 1 if lattice == "trinomial" else N + 1
+    price_tree = 0 if lattice == "lr" else tree_bytes(N, lattice, dtype) // 4
+    return price_tree + 3 * 8 * strikes * nodes
+
+
+def check_memory(required, what, budget=None):
+    """
+    Raises a MemoryError before an allocation that does not fit the budget.
+    :param required: bytes of the allocation
+    :param what: description of the allocation for the message
+    :param budget: memory budget in bytes (the configured budget if None)
+    """
+    budget = memory_budget() if budget is None else budget
+    if required > budget:
+        raise MemoryError(
+            f"{what} needs about {format_size(required)}, which exceeds the memory budget "
+            f"of {format_size(budget)}. Reduce its size or raise the budget."
+        )
+
+
+def plan(engine, paths, steps=1, dtype=np.float64, budget=None, workers=None, min_chunk=10000, max_chunk=2 ** 20):
+    """
+    Chunk size and number of workers of a run that fit the memory budget. The budget
+    is split over the workers, every worker simulates chunks of chunk_size paths.
+    :param engine: terminal, bump_revalue, path or streaming
+    :param paths: total number of paths
+    :param steps: number of time steps of the paths
+    :param dtype: precision of the simulation
+    :param budget: memory budget in bytes (the configured budget if None)
+    :param workers: maximum number of workers (number of cores if None)
+    :param min_chunk: smallest chunk worth a worker of its own
+    :param max_chunk: largest chunk (larger chunks only cost memory, they are not faster)
+    :return: dict with chunk_size, workers, chunks, bytes_per_path, budget and estimated_peak
+    """
+    budget = memory_budget() if budget is None else budget
+    per_path = engine_bytes(engine, steps, dtype)
+    workers = multiprocessing.cpu_count() if workers is None else workers
+
+    # Use fewer workers if a minimal chunk per worker does not fit, but at least one
+    workers = max(1, min(workers, budget // (per_path * min_chunk), math.ceil(paths / min_chunk)))
+    chunk_size = max(1, min(math.ceil(paths / workers), budget // workers // per_path, max_chunk))
+    check_memory(per_path, f"One path of the {engine} engine", budget)
+
+    return {
+        "engine": engine, "bytes_per_path": per_path, "chunk_size": int(chunk_size),
+        "workers": int(workers), "chunks": math.ceil(paths / chunk_size), "budget": budget,
+        "estimated_peak": int(workers * chunk_size * per_path),
+    }
+
+
+class PeakMemory:
+    """
+    Measures the peak memory of a run: the peak resident set size of the process
+    and, if trace is set, the peak of the Python and NumPy allocations during the run
+    (tracemalloc slows down allocation heavy code, so tracing is opt-in).
+
+    Attributes:
+        trace (bool): Traces the allocations during the run.
+        peak (int): Peak traced allocations during the run in bytes (None without trace).
+        max_rss (int): Peak resident set size over the lifetime of the process (not
+            only the run) in bytes.
+    """
+
+    def __init__(self, trace=False):
+        """
+        Constructs the monitor.
+        """
+        self.trace = trace
+        self.peak = None
+        self.max_rss = 0
+        self.started = False
+
+    def start(self):
+        """
+        Starts measuring (tracing allocations if trace is set and they are not
+        traced yet).
+        """
+        if self.trace:
+            self.started = not tracemalloc.is_tracing()
+            if self.started:
+                tracemalloc.start()
+            self.baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+    def stop(self):
+        """
+        Stops measuring and stores the peaks. The resident set size includes the
+        largest finished worker process.
+        """
+        if self.trace:
+            self.peak = tracemalloc.get_traced_memory()[1] - self.baseline
+            if self.started:
+                tracemalloc.stop()
+
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        self.max_rss = max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def report(self):
+        """
+        Returns a one-line summary.
+        """
+        report = f"Peak resident memory of the process: {format_size(self.max_rss)}"
+        if self.peak is not None:
+            report += f", peak allocated during the run: {format_size(self.peak)}"
+        return report
@@ -11,6 +11,7 @@ for options pricing.
 
 import numpy as np
 import math
+from scipy.special import ndtr, ndtri
 
 class MonteCarlo:
     """
@@ -25,9 +26,10 @@ class MonteCarlo:
         K (float): Strike price of the option.
         market (str): Market type ('EU' for European, 'USA' for American).
         option_type (str): Type of the option ('call' or 'put').
+        dtype (np.dtype): Precision of the simulated paths (float64 or float32).
     """
 
-    def __init__(self, steps, T, S0, sigma, r, K, market="EU", option_type="call"):
+    def __init__(self, steps, T, S0, sigma, r, K, market="EU", option_type="call", dtype=np.float64):
         """
         Constructs all the necessary attributes for the MonteCarlo object.
         """
@@ -41,15 +43,17 @@ class MonteCarlo:
         self.price = S0
         self.market = market.upper()
         self.option_type = option_type.lower()
+        self.dtype = np.dtype(dtype)
         assert self.market in ["EU", "USA"], "Market not found. Choose EU or USA"
         assert self.option_type in ["call", "put"], "Non-existing option type."
+        assert self.dtype in [np.float32, np.float64], "Precision must be float32 or float64"
 
     def wiener_method(self):
         """
         Simulates price paths using the Wiener process (geometric Brownian motion).
         """
         price = self.price
-        self.wiener_price_path = np.zeros(self.steps)
+        self.wiener_price_path = np.zeros(self.steps, dtype=self.dtype)
         for i in range(self.steps):
             self.wiener_price_path[i] = price
             ds = self.r * price * self.dt + self.sigma * price * np.random.normal(0, 1) * np.sqrt(self.dt)
@@ -71,7 +75,7 @@ class MonteCarlo:
 
         if generate_path:
             price = self.price
-            self.euler_price_path = np.zeros(self.steps)
+            self.euler_price_path = np.zeros(self.steps, dtype=self.dtype)
             for i in range(self.steps):
                 self.euler_price_path[i] = price
                 ds = price * math.exp((self.r-0.5*self.sigma**2)*self.dt + self.sigma*np.random.normal(0, 1) * math.sqrt(self.dt))
@@ -81,18 +85,144 @@ class MonteCarlo:
 
         return self.euler_integration
 
-    def euler_method_vectorized(self, random_numbers):
+    def euler_method_vectorized(self, random_numbers, scale=1.0, out=None):
         """
-        Vectorized version of the Euler method for faster computation.
+        Vectorized version of the Euler method for faster computation. Scaling, drift,
+        exp and the product with S0 run in place on one buffer, which is the caller's
+        out buffer if given (out may be random_numbers itself).
 
         Args:
             random_numbers (np.array): Pre-generated array of random numbers.
+            scale (float): Factor of the random numbers (sqrt(T) for standard normals).
+            out (np.array): Buffer of the precision of the object for the results (optional).
 
         Returns:
-            np.array: Vectorized simulation results.
+            np.array: Vectorized simulation results (in the precision of the object).
         """
-        self.euler_vectorized = self.S0 * np.exp((self.r - 0.5 * self.sigma**2) * self.T + self.sigma * random_numbers)
-        return self.euler_vectorized
+        if out is None:
+            out = np.empty(np.shape(random_numbers), dtype=self.dtype)
+        drift = float((self.r - 0.5 * self.sigma**2) * self.T)
+        np.multiply(random_numbers, float(self.sigma * scale), out=out)
+        out += drift
+        np.exp(out, out=out)
+        out *= float(self.S0)
+        return out
+
+    def payoffs(self, prices, digital=False, out=None):
+        """
+        Undiscounted payoffs of European (or cash-or-nothing digital) options on the
+        strike and option type of the object, computed in place if out is given.
+
+        Args:
+            prices (np.array): Prices of the underlying at maturity.
+            digital (bool): Digital (True) or regular (False) payoffs.
+            out (np.array): Buffer for the payoffs (optional, may be prices itself).
+
+        Returns:
+            np.array: Payoff of every price.
+        """
+        if out is None:
+            out = np.empty(np.shape(prices), dtype=self.dtype)
+        K = float(self.K)
+        call = self.option_type == "call"
+        if digital:
+            return np.greater(prices, K, out=out) if call else np.less(prices, K, out=out)
+
+        if call:
+            np.subtract(prices, K, out=out)
+        else:
+            np.subtract(K, prices, out=out)
+        return np.maximum(out, 0, out=out)
+
+    def euler_path_vectorized(self, random_numbers):
+        """
+        Vectorized geometric Brownian motion paths using the exact log-Euler scheme.
+
+        Args:
+            random_numbers (np.array): Standard normal draws of shape (paths, steps).
+
+        Returns:
+            np.array: Simulated prices at t_1, ..., t_steps with shape (paths, steps).
+        """
+        random_numbers = np.asarray(random_numbers, dtype=self.dtype)
+        drift = float((self.r - 0.5 * self.sigma**2) * self.dt)
+        log_paths = drift + float(self.sigma * np.sqrt(self.dt)) * random_numbers
+        np.cumsum(log_paths, axis=1, out=log_paths)
+        np.exp(log_paths, out=log_paths)
+        log_paths *= float(self.S0)
+        self.euler_path = log_paths
+        return self.euler_path
+
+    def time_slices(self, n_paths, sampler=None):
+        """
+        Generator of exact geometric Brownian motion paths, one time slice at a time,
+        such that path-dependent payoffs only need memory of the order of n_paths.
+        The normal numbers are drawn per slice, by the sampler if given. Stratified and
+        Sobol sampling need the whole path (one dimension per step) and are not available
+        per slice.
+
+        Args:
+            n_paths (int): Number of paths.
+            sampler (NormalSampler): Sampler of the normal numbers (optional).
+
+        Yields:
+            np.array: Prices at t_1, ..., t_steps with shape (n_paths,). The same array
+                is updated in place, so it must be consumed (or copied) before the next slice.
+        """
+        assert sampler is None or sampler.method in ["random", "latin_hypercube"], \
+            "Stratified and Sobol sampling are not available for paths drawn one time slice at a time"
+        drift = float((self.r - 0.5 * self.sigma**2) * self.dt)
+        vol = float(self.sigma * np.sqrt(self.dt))
+        log_prices = np.full(n_paths, math.log(self.S0), dtype=self.dtype)
+        prices = np.empty(n_paths, dtype=self.dtype)
+
+        for _ in range(self.steps):
+            numbers = np.random.normal(size=n_paths) if sampler is None else sampler.draw(n_paths)
+            numbers *= vol
+            numbers += drift
+            log_prices += numbers
+            np.exp(log_prices, out=prices)
+            yield prices
+
+    def merton_jump_vectorized(self, random_numbers, lam, mu_j, sigma_j, generate_path=False):
+        """
+        Vectorized Merton jump-diffusion. The Poisson jump counts and the lognormal
+        jump sizes are drawn in bulk for the whole block and added to the log-price
+        increments of the diffusion.
+
+        Args:
+            random_numbers (np.array): Standard normal draws of the diffusion, shape (paths,)
+                for terminal prices or (paths, steps) if generate_path is True.
+            lam (float): Jump intensity (expected number of jumps per year).
+            mu_j (float): Mean of the log jump size.
+            sigma_j (float): Standard deviation of the log jump size.
+            generate_path (bool): Whether to generate the full price paths or only the final prices.
+
+        Returns:
+            np.array: Final simulated prices with shape (paths,), or the price paths at
+                t_1, ..., t_steps with shape (paths, steps) if generate_path is True.
+        """
+        dt = self.dt if generate_path else self.T
+
+        # Compensated drift such that the discounted stock price stays a martingale
+        kappa = math.exp(mu_j + 0.5 * sigma_j**2) - 1
+        random_numbers = np.asarray(random_numbers, dtype=self.dtype)
+        drift = float((self.r - 0.5 * self.sigma**2 - lam * kappa) * dt)
+        log_increments = drift + float(self.sigma * math.sqrt(dt)) * random_numbers
+
+        # Sum of n lognormal jumps is normal, so only nodes with at least one jump need a draw
+        jump_counts = np.random.poisson(lam * dt, size=log_increments.shape)
+        jumped = np.nonzero(jump_counts)
+        counts = jump_counts[jumped]
+        log_increments[jumped] += mu_j * counts + sigma_j * np.sqrt(counts) * np.random.normal(size=counts.size)
+
+        if generate_path:
+            np.cumsum(log_increments, axis=1, out=log_increments)
+        np.exp(log_increments, out=log_increments)
+        log_increments *= float(self.S0)
+
+        self.merton_vectorized = log_increments
+        return self.merton_vectorized
 
     def milstein_method(self):
         """
@@ -102,7 +232,7 @@ class MonteCarlo:
             Adds a correction term to the geometric Brownian motion to account for discretization errors.
         """
         price = self.price
-        self.milstein_price_path = np.zeros(self.steps)
+        self.milstein_price_path = np.zeros(self.steps, dtype=self.dtype)
         for i in range(self.steps):
             self.milstein_price_path[i] = price
             epsilon = np.random.normal(0, 1)
@@ -110,32 +240,265 @@ class MonteCarlo:
                   0.5 * self.sigma**2 * epsilon**2 * self.dt)
             price *= ds
 
-    def antithetic_wiener_method(self):
+    def wiener_method_vectorized(self, increments):
+        """
+        Vectorized Euler scheme of the geometric Brownian motion driven by given
+        Brownian increments, such that different discretizations can share them.
+
+        Args:
+            increments (np.array): Brownian increments of shape (paths, steps) with variance dt.
+
+        Returns:
+            np.array: Simulated prices at t_1, ..., t_steps with shape (paths, steps).
+        """
+        increments = np.asarray(increments, dtype=self.dtype)
+        factors = float(1 + self.r * self.dt) + float(self.sigma) * increments
+        np.cumprod(factors, axis=1, out=factors)
+        factors *= float(self.S0)
+        self.wiener_vectorized = factors
+        return self.wiener_vectorized
+
+    def milstein_method_vectorized(self, increments):
+        """
+        Vectorized Milstein scheme of the geometric Brownian motion driven by given
+        Brownian increments, such that different discretizations can share them.
+
+        Args:
+            increments (np.array): Brownian increments of shape (paths, steps) with variance dt.
+
+        Returns:
+            np.array: Simulated prices at t_1, ..., t_steps with shape (paths, steps).
+        """
+        increments = np.asarray(increments, dtype=self.dtype)
+        factors = (float(1 + self.r * self.dt) + float(self.sigma) * increments +
+                   float(0.5 * self.sigma**2) * (increments**2 - float(self.dt)))
+        np.cumprod(factors, axis=1, out=factors)
+        factors *= float(self.S0)
+        self.milstein_vectorized = factors
+        return self.milstein_vectorized
+
+    def brownian_bridge_survival(self, paths, barrier, up=True):
+        """
+        Probability that the geometric Brownian motion does not cross the barrier
+        between the monitoring dates, conditional on the simulated prices.
+
+        Args:
+            paths (np.array): Simulated prices at t_1, ..., t_steps with shape (paths, steps).
+            barrier (float): Barrier level.
+            up (bool): Up barrier (True) or down barrier (False).
+
+        Returns:
+            np.array: Survival probability of every path with shape (paths,).
+        """
+        log_dist = np.log(paths / float(barrier))
+        log_start = np.empty_like(log_dist)
+        log_start[:, 0] = math.log(self.S0 / barrier)
+        log_start[:, 1:] = log_dist[:, :-1]
+
+        # Crossing probability of a Brownian bridge over each step
+        dt = self.T / paths.shape[1]
+        crossing = np.exp(-2 * log_start * log_dist / float(self.sigma**2 * dt))
+        outside = (log_dist >= 0) | (log_start >= 0) if up else (log_dist <= 0) | (log_start <= 0)
+        crossing[outside] = 1
+
+        return np.prod(1 - crossing, axis=1)
+
+    def barrier_payoffs(self, paths, barrier, barrier_type="down-and-out", bridge=True):
+        """
+        Undiscounted payoffs of single barrier options on a batch of paths. With the
+        Brownian bridge the barrier is monitored continuously by weighting every path
+        with its survival probability between the steps, otherwise only at the steps.
+
+        Args:
+            paths (np.array): Simulated prices at t_1, ..., t_steps with shape (paths, steps).
+            barrier (float): Barrier level.
+            barrier_type (str): down-and-out, down-and-in, up-and-out or up-and-in.
+            bridge (bool): Continuous (True) or discrete (False) monitoring.
+
+        Returns:
+            np.array: Payoff of every path with shape (paths,).
+        """
+        up = barrier_type.startswith("up")
+        if bridge:
+            survival = self.brownian_bridge_survival(paths, barrier, up)
+        elif up:
+            survival = (np.max(paths, axis=1) < barrier) & (self.S0 < barrier)
+        else:
+            survival = (np.min(paths, axis=1) > barrier) & (self.S0 > barrier)
+
+        terminal = paths[:, -1]
+        if self.option_type == "call":
+            payoffs = np.maximum(terminal - float(self.K), 0)
+        else:
+            payoffs = np.maximum(float(self.K) - terminal, 0)
+
+        if barrier_type.endswith("in"):
+            return payoffs * (1 - survival)
+        return payoffs * survival
+
+    def conditional_digital_payoffs(self, random_numbers):
+        """
+        Smoothed payoffs of cash-or-nothing digital options by conditional Monte Carlo.
+        The stock price is simulated up to the last step, over which the probability of
+        ending in the money is integrated analytically. The payoff is then a smooth
+        function of S0, with pathwise delta and gamma.
+
+        Args:
+            random_numbers (np.array): Standard normal numbers, one per path.
+
+        Returns:
+            tuple: Undiscounted payoffs, pathwise deltas and pathwise gammas of every path.
+        """
+        phi = 1 if self.option_type == "call" else -1
+        drift = self.r - 0.5 * self.sigma ** 2
+        before = self.T - self.dt
+        vol = self.sigma * math.sqrt(self.dt)
+
+        # Stock price at the last step before maturity
+        S = np.asarray(random_numbers, dtype=self.dtype) * float(self.sigma * math.sqrt(before))
+        S += float(drift * before)
+        np.exp(S, out=S)
+        S *= float(self.S0)
+
+        d2 = (np.log(S / float(self.K)) + float(drift * self.dt)) / float(vol)
+        density = np.exp(-0.5 * d2 ** 2) / math.sqrt(2 * math.pi)
+        payoffs = ndtr(phi * d2)
+        deltas = phi * density / float(self.S0 * vol)
+        gammas = -deltas * (d2 / float(vol) + 1) / float(self.S0)
+
+        return payoffs, deltas, gammas
+
+    def conditional_barrier_payoffs(self, uniforms, barrier, barrier_type="down-and-out"):
+        """
+        Smoothed payoffs of knock-out options monitored at the steps (Glasserman and
+        Staum). Every step is drawn conditional on surviving the barrier and the path is
+        weighted with the survival probability, the last step is integrated analytically.
+        The payoff is then a smooth function of S0, such that bumped prices on the same
+        uniforms give stable Greeks.
+
+        Args:
+            uniforms (np.array): Uniform numbers with shape (paths, steps - 1).
+            barrier (float): Barrier level.
+            barrier_type (str): down-and-out or up-and-out.
+
+        Returns:
+            np.array: Undiscounted payoff of every path with shape (paths,).
+        """
+        assert barrier_type in ["down-and-out", "up-and-out"], "Only knock-out options are smoothed"
+        up = barrier_type == "up-and-out"
+        side = 1 if up else -1
+        n_paths = uniforms.shape[0]
+        if (up and self.S0 >= barrier) or (not up and self.S0 <= barrier):
+            return np.zeros(n_paths, dtype=self.dtype)
+
+        drift = float((self.r - 0.5 * self.sigma ** 2) * self.dt)
+        vol = float(self.sigma * math.sqrt(self.dt))
+        log_barrier = math.log(barrier)
+        tiny = np.finfo(self.dtype).tiny
+
+        # Steps drawn conditional on survival: the normal number is restricted to the
+        # surviving side of the barrier and the weight is multiplied by its probability
+        log_S = np.full(n_paths, math.log(self.S0), dtype=self.dtype)
+        weights = np.ones(n_paths, dtype=self.dtype)
+        for i in range(uniforms.shape[1]):
+            survival = ndtr(side * (log_barrier - log_S - drift) / vol)
+            weights *= survival
+            z = side * ndtri(np.maximum(uniforms[:, i] * survival, tiny))
+            log_S += drift + vol * z
+
+        # Expected payoff over the last step on the surviving side of the barrier
+        S = np.exp(log_S)
+        forward = S * math.exp(self.r * self.dt)
+
+        def d(level):
+            d2 = (log_S - math.log(level) + drift) / vol
+            return d2 + vol, d2
+
+        K = float(self.K)
+        if self.option_type == "call":
+            low = max(K, barrier) if not up else K
+            d1, d2 = d(low)
+            payoffs = forward * ndtr(d1) - K * ndtr(d2)
+            if up and barrier > K:
+                d1, d2 = d(barrier)
+                payoffs -= forward * ndtr(d1) - K * ndtr(d2)
+            elif up:
+                payoffs[:] = 0
+        else:
+            high = min(K, barrier) if up else K
+            d1, d2 = d(high)
+            payoffs = K * ndtr(-d2) - forward * ndtr(-d1)
+            if not up and barrier < K:
+                d1, d2 = d(barrier)
+                payoffs -= K * ndtr(-d2) - forward * ndtr(-d1)
+            elif not up:
+                payoffs[:] = 0
+
+        return weights * payoffs
+
+    def antithetic_wiener_method(self, n_paths=1000):
         """
         Enhances efficiency by using the antithetic variate technique to reduce variance in the simulation.
 
+        Args:
+            n_paths (int): Number of paths, half of them are the antithetic paths.
+
         Returns:
-            list: A list of price paths for both original and antithetic paths.
+            np.array: Price paths with shape (n_paths, steps), the second half mirrors
+                the first half such that path i and path i + n_paths / 2 form a pair
+                (the layout of NormalSampler.antithetic_draw).
         """
-        n_paths = 1000
-        paths_list = []
-        price = self.price
-        anti_price = self.price
-        for k in range(int(n_paths/2)):
-            wiener_price_path = np.zeros(self.steps)
-            anti_wiener_price_path = np.zeros(self.steps)
+        half = n_paths // 2
+        epsilon = np.empty((2 * half, self.steps), dtype=self.dtype)
+        epsilon[:half] = np.random.normal(size=(half, self.steps))
+        np.negative(epsilon[:half], out=epsilon[half:])
 
-            for i in range(self.steps):
-                epsilon = np.random.normal(0, 1)
-                wiener_price_path[i] = price
-                anti_wiener_price_path[i] = anti_price
-                ds = self.r * price * self.dt + self.sigma * price * epsilon * np.sqrt(self.dt)
-                anti_ds = self.r * anti_price * self.dt + self.sigma * price * -epsilon * np.sqrt(self.dt)
+        # Every path starts at the initial price and stores the price before each step
+        factors = float(1 + self.r * self.dt) + float(self.sigma * np.sqrt(self.dt)) * epsilon
+        factors[:, 1:] = factors[:, :-1]
+        factors[:, 0] = self.price
+        np.cumprod(factors, axis=1, out=factors)
 
-                price += ds
-                anti_price += anti_ds
+        return factors
 
-            paths_list.append(wiener_price_path)
-            paths_list.append(anti_wiener_price_path)
 
-        return paths_list
\ No newline at end of file
+class Workspace:
+    """
+    Named buffers for the in-place kernels. A buffer is allocated on first use and
+    reused by every later chunk of the same or a smaller size, such that chunked
+    simulations do not allocate new arrays per chunk.
+
+    Attributes:
+        dtype (np.dtype): Precision of the buffers.
+        buffers (dict): Allocated buffers by name.
+    """
+
+    def __init__(self, dtype=np.float64):
+        """
+        Constructs an empty workspace.
+        """
+        self.dtype = np.dtype(dtype)
+        self.buffers = {}
+
+    def get(self, name, shape):
+        """
+        Returns a buffer of the given shape, a view of a larger buffer if one exists.
+
+        Args:
+            name (str): Name of the buffer.
+            shape (int or tuple): Shape of the requested buffer.
+
+        Returns:
+            np.array: Uninitialized buffer.
+        """
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = self.buffers[name] = np.empty(size, dtype=self.dtype)
+        return buffer[:size].reshape(shape)
+
+    def nbytes(self):
+        """
+        Returns the memory of all buffers in bytes.
+        """
+        return sum(buffer.nbytes for buffer in self.buffers.values())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Multilevel Monte Carlo (Giles, 2008) for path-dependent options
+priced with the discretized schemes of the MonteCarlo class.
+"""
+
+import math
+import warnings
+
+import numpy as np
+
+from monte_carlo import MonteCarlo
+
+
+def payoff_paths(mc, paths, payoff="asian", contract="call", barrier=None):
+    """
+    Discounted payoffs of simulated price paths.
+    :param mc: MonteCarlo object that simulated the paths
+    :param paths: prices at t_1, ..., t_steps with shape (paths, steps)
+    :param payoff: european, asian (continuous arithmetic average) or barrier (up-and-out
+                   above S0, down-and-out below)
+    :param contract: call or put
+    :param barrier: barrier level (only used for barrier payoffs)
+    :return: discounted payoff of every path
+    """
+    discount = math.exp(-mc.r * mc.T)
+
+    if payoff == "asian":
+        # Trapezoidal rule such that every level approximates the same continuous average
+        underlying = (0.5 * mc.S0 + paths[:, :-1].sum(axis=1) + 0.5 * paths[:, -1]) / mc.steps
+    else:
+        underlying = paths[:, -1]
+
+    if contract == "call":
+        payoffs = np.maximum(underlying - mc.K, 0)
+    else:
+        payoffs = np.maximum(mc.K - underlying, 0)
+
+    # Continuously monitored barrier through the Brownian bridge survival probability
+    if payoff == "barrier":
+        payoffs *= mc.brownian_bridge_survival(paths, barrier, up=barrier > mc.S0)
+
+    return discount * payoffs
+
+
+def mlmc_level(
+    level, n_paths, T, S0, K, r, sigma, payoff="asian", contract="call",
+    barrier=None, scheme="milstein", M=2, chunk_size=10000
+    ):
+    """
+    Simulates the correction P_l - P_{l-1} of a single level, where the fine and the
+    coarse paths are driven by the same Brownian increments.
+    :param level: level l, the fine paths use M**l steps
+    :param n_paths: number of samples
+    :param scheme: milstein or euler
+    :param M: refinement factor between two levels
+    :param chunk_size: number of paths simulated at once
+    :return: sums of the corrections, squared corrections and fine payoffs, and the cost
+    """
+    steps_fine = M ** level
+    mc_fine = MonteCarlo(steps_fine, T, S0, sigma, r, K)
+    mc_coarse = MonteCarlo(max(steps_fine // M, 1), T, S0, sigma, r, K)
+    method = "milstein_method_vectorized" if scheme == "milstein" else "wiener_method_vectorized"
+
+    sum_y, sum_y_sq, sum_fine = 0.0, 0.0, 0.0
+    done = 0
+    while done < n_paths:
+        size = min(chunk_size, n_paths - done)
+        increments = math.sqrt(mc_fine.dt) * np.random.normal(size=(size, steps_fine))
+
+        # Coarse increments are sums of M consecutive fine increments
+        coarse_increments = None
+        if level > 0:
+            coarse_increments = increments.reshape(size, steps_fine // M, M).sum(axis=2)
+
+        p_fine = payoff_paths(
+            mc_fine, getattr(mc_fine, method)(increments), payoff, contract, barrier
+            )
+        y = p_fine
+        if level > 0:
+            p_coarse = payoff_paths(
+                mc_coarse, getattr(mc_coarse, method)(coarse_increments), payoff, contract, barrier
+                )
+            y = p_fine - p_coarse
+
+        sum_y += y.sum()
+        sum_y_sq += np.dot(y, y)
+        sum_fine += p_fine.sum()
+        done += size
+
+    # Cost in time steps per sample of the fine and the coarse path
+    cost = n_paths * (steps_fine + (steps_fine // M if level > 0 else 0))
+
+    return sum_y, sum_y_sq, sum_fine, cost
+
+
+def mlmc(
+    T, S0, K, r, sigma, eps, payoff="asian", contract="call", barrier=None,
+    scheme="milstein", M=2, L_min=2, L_max=10, N0=1000, chunk_size=10000
+    ):
+    """
+    Multilevel Monte Carlo estimator that reaches a root mean square error eps by
+    adding levels until the bias is small enough and by allocating the samples
+    optimally over the levels given their variance and cost.
+    :param T:  Maturity in years
+    :param S0: Stock price at spot time
+    :param K:  Strike price
+    :param r:  Risk-free interest rate
+    :param sigma: Volatility
+    :param eps: requested root mean square error
+    :param payoff: european, asian or barrier
+    :param contract: call or put
+    :param barrier: barrier level (only used for barrier payoffs)
+    :param scheme: milstein or euler
+    :param M: refinement factor between two levels
+    :param L_min: minimum level
+    :param L_max: maximum level
+    :param N0: number of pilot samples on a new level
+    :param chunk_size: number of paths simulated at once
+    :return: option price and a dict with samples, means, variances and costs per level and
+             whether the requested accuracy was reached (converged)
+    """
+    L = L_min
+    n_levels = L + 1
+    N = np.zeros(n_levels, dtype=np.int64)
+    sums = np.zeros((n_levels, 3))
+    costs = np.zeros(n_levels)
+    dN = np.full(n_levels, N0, dtype=np.int64)
+    converged = True
+
+    # Weak (alpha) and strong (beta) convergence rates used to extrapolate a new level
+    alpha = 1
+    beta = 2 if scheme == "milstein" else 1
+
+    while dN.sum() > 0:
+
+        # Update sample sums and costs of levels that require extra samples
+        for l in range(n_levels):
+            if dN[l] > 0:
+                sum_y, sum_y_sq, sum_fine, cost = mlmc_level(
+                    l, int(dN[l]), T, S0, K, r, sigma, payoff, contract,
+                    barrier, scheme, M, chunk_size
+                    )
+                N[l] += dN[l]
+                sums[l] += [sum_y, sum_y_sq, sum_fine]
+                costs[l] += cost
+
+        means = sums[:, 0] / N
+        variances = np.maximum(sums[:, 1] / N - means ** 2, 0)
+        cost_per_sample = costs / N
+
+        # Optimal number of samples per level
+        N_opt = np.ceil(
+            2 / eps ** 2 * np.sqrt(variances / cost_per_sample)
+            * np.sum(np.sqrt(variances * cost_per_sample))
+            ).astype(np.int64)
+        dN = np.maximum(0, N_opt - N)
+
+        # Test for weak convergence once the sample sizes are sufficient
+        if dN.sum() == 0:
+            bias = max(abs(means[-1]), abs(means[-2]) / M ** alpha) / (M ** alpha - 1)
+            if bias > eps / math.sqrt(2):
+                if L == L_max:
+                    warnings.warn(f"MLMC reached the maximum level {L_max} before the requested accuracy {eps}")
+                    converged = False
+                    break
+
+                # Add a level with an extrapolated variance and cost
+                L += 1
+                n_levels += 1
+                N = np.append(N, 0)
+                sums = np.vstack([sums, np.zeros(3)])
+                costs = np.append(costs, 0.0)
+                variances = np.append(variances, variances[-1] / M ** beta)
+                cost_per_sample = np.append(cost_per_sample, cost_per_sample[-1] * M)
+
+                N_opt = np.ceil(
+                    2 / eps ** 2 * np.sqrt(variances / cost_per_sample)
+                    * np.sum(np.sqrt(variances * cost_per_sample))
+                    ).astype(np.int64)
+                dN = np.maximum(0, N_opt - N)
+                dN[-1] = max(dN[-1], N0)
+
+    means = sums[:, 0] / N
+    levels = {
+        "samples": N,
+        "means": means,
+        "variances": np.maximum(sums[:, 1] / N - means ** 2, 0),
+        "costs": costs / N,
+        "total_cost": costs.sum(),
+        "converged": converged,
+    }
+
+    return means.sum(), levels
+
+
+if __name__ == "__main__":
+
+    price, levels = mlmc(1, 100, 99, 0.06, 0.2, eps=0.01, payoff="asian")
+    print("MLMC Asian call price:", price)
+    for l, (n, v, c) in enumerate(zip(levels["samples"], levels["variances"], levels["costs"])):
+        print(f"Level {l}: samples = {n}, variance = {v:.3e}, cost = {c:.0f}")
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Long-running pricing service that reads JSON lines from stdin or a
+Unix socket and micro-batches concurrent requests into vectorized evaluations.
+
+Example request (one JSON object per line):
+    {"id": 1, "method": "black_scholes", "S0": 100, "K": 99, "T": 1, "r": 0.06, "sigma": 0.2, "option_type": "put"}
+Methods: black_scholes, monte_carlo (with "paths") and binomial (with "N" and "market").
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from binomial_tree import BinTreeChain, BlackScholes
+from memory_planner import check_memory, engine_bytes
+from monte_carlo import MonteCarlo, Workspace
+
+
+class PricingServer:
+    """
+    Collects pricing requests for a short time window and evaluates every batch
+    with as few vectorized calls as possible.
+
+    Attributes:
+        max_delay (float): Maximum time in seconds a request waits for its batch.
+        max_batch (int): Maximum number of requests in a batch.
+        executor (ThreadPoolExecutor): Warm executor for the simulations and trees.
+    """
+
+    def __init__(self, max_delay=0.0005, max_batch=4096, workers=4, seed=None):
+        """
+        Constructs the request queue, the executor and the random number generators.
+        """
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        # Generators are not thread-safe, so every worker thread gets its own stream
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def generator(self):
+        """
+        Returns the (cached) random number generator of the current thread.
+        """
+        if not hasattr(self.local, "rng"):
+            with self.lock:
+                self.local.rng = np.random.default_rng(self.seed_sequence.spawn(1)[0])
+        return self.local.rng
+
+    def workspace(self):
+        """
+        Returns the (cached) buffers of the current thread for the simulated prices.
+        """
+        if not hasattr(self.local, "workspace"):
+            self.local.workspace = Workspace()
+        return self.local.workspace
+
+    async def submit(self, request):
+        """
+        Queues a single request and waits for its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((request, future))
+        return await future
+
+    async def batch_loop(self):
+        """
+        Gathers requests until the batch is full or the oldest request waited
+        max_delay seconds, and dispatches the batch.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            asyncio.ensure_future(self.dispatch(batch))
+
+    async def dispatch(self, batch):
+        """
+        Splits a batch by method and underlying and resolves the futures.
+        """
+        loop = asyncio.get_running_loop()
+        groups = defaultdict(list)
+        for request, future in batch:
+            try:
+                groups[self.group_key(request)].append((request, future))
+            except Exception as error:
+                request_id = request.get("id") if isinstance(request, dict) else None
+                future.set_result({"id": request_id, "error": f"invalid request: {error}"})
+
+        async def inline(function, requests):
+            return function(requests)
+
+        jobs = []
+        for key, items in groups.items():
+            method = key[0]
+            requests = [request for request, _ in items]
+
+            # Closed forms are cheap enough to evaluate on the event loop
+            if method == "black_scholes":
+                jobs.append((items, inline(self.price_black_scholes, requests)))
+            elif method == "monte_carlo":
+                jobs.append((items, loop.run_in_executor(self.executor, self.price_monte_carlo, requests)))
+            else:
+                jobs.append((items, loop.run_in_executor(self.executor, self.price_binomial, requests)))
+
+        for items, job in jobs:
+            try:
+                results = await job
+            except Exception as error:
+                results = [{"error": str(error)} for _ in items]
+            for (request, future), result in zip(items, results):
+                result["id"] = request.get("id")
+                future.set_result(result)
+
+    def group_key(self, request):
+        """
+        Requests with the same key are evaluated together.
+        """
+        method = request.get("method", "black_scholes")
+        for name in ("S0", "K", "T", "r", "sigma"):
+            float(request[name])
+
+        if method == "black_scholes":
+            return (method,)
+        elif method == "monte_carlo":
+            return (method, float(request["S0"]), float(request["sigma"]), float(request["r"]),
+                    float(request["T"]), int(request.get("paths", 100000)))
+        elif method == "binomial":
+            return (method, float(request["S0"]), float(request["sigma"]), float(request["r"]),
+                    float(request["T"]), int(request.get("N", 201)), request.get("market", "USA"),
+                    request.get("lattice", "lr"))
+        raise ValueError(f"unknown method {method}")
+
+    def price_black_scholes(self, requests):
+        """
+        Evaluates all closed-form requests with a single vectorized call.
+        """
+        S0, K, T, r, sigma = (np.array([float(req[name]) for req in requests])
+                              for name in ("S0", "K", "T", "r", "sigma"))
+        is_call = np.array([req.get("option_type", "call").lower() == "call" for req in requests])
+
+        bs = BlackScholes(T, S0, K, r, sigma)
+        prices = np.where(is_call, bs.call_price(), bs.put_price())
+
+        return [{"price": float(price)} for price in prices]
+
+    def price_monte_carlo(self, requests):
+        """
+        Simulates the terminal prices of an underlying once and prices all
+        strikes and option types of the group on the same paths.
+        """
+        first = requests[0]
+        S0, sigma, r, T = (float(first[name]) for name in ("S0", "sigma", "r", "T"))
+        paths = int(first.get("paths", 100000))
+
+        # The normal numbers are drawn into the buffer of the thread and turned into
+        # terminal prices in place, the payoffs of every request reuse a second buffer
+        check_memory(paths * engine_bytes("terminal"), f"Monte Carlo batch with {paths} paths")
+        workspace = self.workspace()
+        mc = MonteCarlo(1, T, S0, sigma, r, 0)
+        S = self.generator().standard_normal(out=workspace.get("prices", paths))
+        mc.euler_method_vectorized(S, math.sqrt(T), out=S)
+
+        discount = math.exp(-r * T)
+        results = []
+        for req in requests:
+            option = MonteCarlo(1, T, S0, sigma, r, float(req["K"]),
+                                option_type=req.get("option_type", "call"))
+            payoffs = option.payoffs(S, out=workspace.get("payoffs", paths))
+            results.append({
+                "price": discount * float(payoffs.mean(dtype=np.float64)),
+                "std_error": discount * float(payoffs.std(dtype=np.float64)) / math.sqrt(paths),
+            })
+
+        return results
+
+    def price_binomial(self, requests):
+        """
+        Prices all strikes and option types of a group in a single backward
+        induction of one tree chain.
+        """
+        first = requests[0]
+        chain = BinTreeChain(
+            int(first.get("N", 201)), float(first["T"]), float(first["S0"]), float(first["sigma"]),
+            float(first["r"]), [float(req["K"]) for req in requests], market=first.get("market", "USA"),
+            option_types=[req.get("option_type", "call") for req in requests],
+            lattice=first.get("lattice", "lr")
+        )
+        prices, deltas = chain.determine_price()
+
+        return [{"price": float(price), "delta": float(delta)} for price, delta in zip(prices, deltas)]
+
+    async def handle_lines(self, reader, write):
+        """
+        Reads JSON lines and writes every response as soon as it is ready.
+        """
+        pending = set()
+
+        async def respond(line):
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as error:
+                result = {"id": None, "error": f"invalid json: {error}"}
+            else:
+                if isinstance(request, dict):
+                    result = await self.submit(request)
+                else:
+                    result = {"id": None, "error": "invalid request: expected a JSON object"}
+            await write(json.dumps(result) + "\n")
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(respond(line))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def serve_stdio(self):
+        """
+        Serves JSON lines from stdin to stdout until stdin is closed.
+        """
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        try:
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+        # Regular files can not be watched by the event loop, so read them in a thread
+        except ValueError:
+            def feed():
+                for line in sys.stdin.buffer:
+                    loop.call_soon_threadsafe(reader.feed_data, line)
+                loop.call_soon_threadsafe(reader.feed_eof)
+
+            threading.Thread(target=feed, daemon=True).start()
+
+        async def write(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        await self.handle_lines(reader, write)
+
+    async def serve_unix(self, path):
+        """
+        Serves JSON lines over a Unix socket, one stream of requests per connection.
+        """
+        async def connection(reader, writer):
+            async def write(text):
+                writer.write(text.encode())
+                await writer.drain()
+
+            try:
+                await self.handle_lines(reader, write)
+            finally:
+                writer.close()
+
+        if os.path.exists(path):
+            os.remove(path)
+        server = await asyncio.start_unix_server(connection, path=path)
+        async with server:
+            await server.serve_forever()
+
+    async def run(self, socket_path=None):
+        """
+        Starts the batching loop and serves stdin/stdout or the Unix socket.
+        """
+        self.queue = asyncio.Queue()
+        batcher = asyncio.ensure_future(self.batch_loop())
+        try:
+            if socket_path:
+                await self.serve_unix(socket_path)
+            else:
+                await self.serve_stdio()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Micro-batching option pricing service over JSON lines.")
+    parser.add_argument("-socket", type=str, default=None, help="Unix socket path (default: stdin/stdout)")
+    parser.add_argument("-max_delay", type=float, default=0.5, help="Batching window in milliseconds (default: 0.5)")
+    parser.add_argument("-max_batch", type=int, default=4096, help="Maximum requests per batch (default: 4096)")
+    parser.add_argument("-workers", type=int, default=4, help="Number of warm worker threads (default: 4)")
+    parser.add_argument("-seed", type=int, default=None, help="Seed of the random number generators (default: random)")
+    args = parser.parse_args()
+
+    server = PricingServer(args.max_delay / 1000, args.max_batch, args.workers, args.seed)
+    asyncio.run(server.run(args.socket))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Append-only SQLite store of pricing results, such that past runs can be
+compared with queries instead of loading separate output files.
+"""
+
+import os
+import sqlite3
+import time
+import uuid
+
+DEFAULT_PATH = os.path.join("Data", "results.sqlite")
+
+COLUMNS = {
+    "run_id": "TEXT", "created": "REAL", "experiment": "TEXT",
+    "contract": "TEXT", "option_type": "TEXT", "market": "TEXT",
+    "S0": "REAL", "K": "REAL", "sigma": "REAL", "T": "REAL", "r": "REAL", "steps": "INTEGER",
+    "method": "TEXT", "sampler": "TEXT", "seed": "INTEGER", "paths": "INTEGER", "epsilon": "REAL",
+    "estimate": "REAL", "std_error": "REAL", "reference": "REAL", "error": "REAL", "time": "REAL",
+}
+INDEXES = [("run_id",), ("contract", "method"), ("K", "sigma", "T", "r"), ("paths",)]
+
+
+class ResultsStore:
+    """
+    Results table in a local SQLite file. Rows are only ever appended, every call to
+    append is one transaction and gets its own run id. The file uses write-ahead
+    logging, such that parallel workers can append while others read.
+
+    Attributes:
+        path (str): Location of the SQLite file.
+        connection (sqlite3.Connection): Open connection to the file.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, timeout=60.0):
+        """
+        Opens (and if necessary creates) the store.
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{name} {kind}" for name, kind in COLUMNS.items())
+        with self.connection:
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY, {columns})")
+            for index in INDEXES:
+                name = "idx_" + "_".join(index)
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON results ({', '.join(index)})")
+
+    def append(self, rows, run_id=None):
+        """
+        Writes rows in bulk. Columns missing from a row are stored as NULL.
+
+        Args:
+            rows (list): Rows as dicts of column names and values.
+            run_id (str): Identifier of the run (a new one if None).
+
+        Returns:
+            str: Run id of the rows.
+        """
+        run_id = run_id or uuid.uuid4().hex
+        created = time.time()
+        names = list(COLUMNS)
+
+        values = []
+        for row in rows:
+            unknown = set(row) - set(COLUMNS)
+            assert not unknown, f"Unknown result columns: {sorted(unknown)}"
+            row = {**row, "run_id": run_id, "created": created}
+            values.append([to_sql(row.get(name)) for name in names])
+
+        placeholders = ", ".join("?" for _ in names)
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO results ({', '.join(names)}) VALUES ({placeholders})", values
+            )
+
+        return run_id
+
+    def query(self, columns=None, order_by="id", **filters):
+        """
+        Reads the rows that match all filters. A filter is a single value (equality),
+        a list of values (membership) or a (low, high) tuple (inclusive range).
+
+        Args:
+            columns (list): Columns to read (all if None).
+            order_by (str): Column to sort the rows by.
+            **filters: Column names with the values to select.
+
+        Returns:
+            list: Matching rows as dicts.
+        """
+        columns = columns or ["id"] + list(COLUMNS)
+        for name in list(columns) + list(filters) + [order_by]:
+            assert name == "id" or name in COLUMNS, f"Unknown result column: {name}"
+
+        conditions, values = [], []
+        for name, value in filters.items():
+            if isinstance(value, tuple):
+                conditions.append(f"{name} BETWEEN ? AND ?")
+                values.extend(to_sql(v) for v in value)
+            elif isinstance(value, list):
+                conditions.append(f"{name} IN ({', '.join('?' for _ in value)})")
+                values.extend(to_sql(v) for v in value)
+            else:
+                conditions.append(f"{name} = ?")
+                values.append(to_sql(value))
+
+        sql = f"SELECT {', '.join(columns)} FROM results"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order_by}"
+
+        cursor = self.connection.execute(sql, values)
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def to_sql(value):
+    """
+    Converts NumPy scalars to Python values and NaN to NULL.
+    """
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
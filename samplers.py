@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Generators of standard normal draws with variance reduction
+(stratified, Latin hypercube, antithetic and randomized Sobol sampling) and the
+matching estimators.
+"""
+
+import math
+import warnings
+
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+
+class NormalSampler:
+    """
+    Draws standard normal numbers for the vectorized engines and estimates means
+    and standard errors consistently with the way the numbers were drawn.
+
+    Attributes:
+        method (str): random, stratified, latin_hypercube or sobol.
+        strata (int): Number of equiprobable strata of the terminal normal.
+        allocation (str): proportional or neyman allocation of the draws over the strata.
+        stds (np.array): Standard deviations of the payoff per stratum (neyman allocation).
+        antithetic (bool): Mirrors the first half of the draws into the second half.
+        randomizations (int): Number of independently scrambled Sobol sequences.
+        labels (np.array): Stratum of every draw of the last call to draw.
+        counts (np.array): Number of draws per stratum of the last call to draw.
+    """
+
+    def __init__(
+        self, method="random", strata=100, allocation="proportional", stds=None,
+        antithetic=False, randomizations=8
+    ):
+        """
+        Constructs all the necessary attributes for the NormalSampler object.
+        """
+        self.method = method.lower()
+        self.strata = strata
+        self.allocation = allocation.lower()
+        self.stds = stds
+        self.antithetic = antithetic
+        self.randomizations = randomizations
+        self.labels = None
+        self.counts = None
+        assert self.method in ["random", "stratified", "latin_hypercube", "sobol"], "Sampler not found."
+        assert self.allocation in ["proportional", "neyman"], "Non-existing allocation."
+        assert not (antithetic and self.method in ["stratified", "sobol"]), \
+            "Antithetic variates are not combined with stratified or Sobol sampling"
+
+    def draw(self, size):
+        """
+        Generates standard normal numbers.
+
+        Args:
+            size (int or tuple): Number of draws, or (paths, steps) for price paths.
+
+        Returns:
+            np.array: Standard normal numbers of the requested shape.
+        """
+        if self.method == "stratified":
+            return self.stratified(size)
+        elif self.antithetic:
+            return self.antithetic_draw(size)
+        elif self.method == "latin_hypercube":
+            return self.latin_hypercube(size)
+        elif self.method == "sobol":
+            return self.sobol(size)
+
+        return np.random.normal(size=size)
+
+    def antithetic_draw(self, size):
+        """
+        Antithetic variates, the second half of the draws mirrors the first half
+        in place such that draw i and draw i + n / 2 form a pair.
+        """
+        shape = (size,) if np.isscalar(size) else tuple(size)
+        n = shape[0]
+        assert n % 2 == 0, "Antithetic variates require an even number of draws"
+
+        self.labels, self.counts = None, None
+        numbers = np.empty(shape)
+        half_shape = (n // 2,) + shape[1:]
+        if self.method == "latin_hypercube":
+            numbers[:n // 2] = self.latin_hypercube(half_shape)
+        else:
+            numbers[:n // 2] = np.random.normal(size=half_shape)
+        np.negative(numbers[:n // 2], out=numbers[n // 2:])
+
+        return numbers
+
+    def allocate(self, n):
+        """
+        Number of draws per stratum, proportional to the stratum probability or
+        (Neyman) to the probability times the standard deviation of the payoff.
+        """
+        assert n >= self.strata, "Stratified sampling requires at least one draw per stratum"
+        base = 0
+        weights = np.ones(self.strata)
+
+        # Every stratum keeps at least one draw, otherwise its mean would be lost, and
+        # two draws if possible, such that its variance can be estimated
+        if self.allocation == "neyman" and self.stds is not None:
+            base = 2 if n >= 2 * self.strata else 1
+            weights = np.asarray(self.stds, dtype=float) + 1e-12
+
+        share = (n - base * self.strata) * weights / weights.sum()
+        counts = np.floor(share).astype(np.int64)
+        remainder = n - base * self.strata - counts.sum()
+        counts[np.argsort(counts - share)[:remainder]] += 1
+
+        return counts + base
+
+    def stratified(self, size):
+        """
+        Stratified sampling of the terminal normal. For paths the sum of the steps is
+        stratified and the individual steps are drawn conditionally on it.
+        """
+        shape = (size,) if np.isscalar(size) else tuple(size)
+        n = shape[0]
+
+        self.counts = self.allocate(n)
+        self.labels = np.repeat(np.arange(self.strata), self.counts)
+        uniforms = (self.labels + np.random.random_sample(n)) / self.strata
+        terminal = ndtri(uniforms)
+
+        if len(shape) == 1:
+            return terminal
+
+        # Steps minus their mean are independent of the mean, so replacing the
+        # mean by the stratified terminal normal keeps the joint distribution
+        steps = shape[1]
+        numbers = np.random.normal(size=shape)
+        numbers -= numbers.mean(axis=1, keepdims=True)
+        numbers += (terminal / math.sqrt(steps))[:, None]
+
+        return numbers
+
+    def latin_hypercube(self, size):
+        """
+        Latin hypercube sampling, every dimension is stratified into as many
+        strata as there are draws.
+        """
+        shape = (size,) if np.isscalar(size) else tuple(size)
+        n = shape[0]
+        dims = int(np.prod(shape[1:]))
+
+        self.labels, self.counts = None, None
+        permutations = np.argsort(np.random.random_sample((n, dims)), axis=0)
+        uniforms = (permutations + np.random.random_sample((n, dims))) / n
+
+        return ndtri(uniforms).reshape(shape)
+
+    def sobol(self, size):
+        """
+        Randomized quasi-Monte Carlo: the draws consist of independently scrambled
+        Sobol sequences (one dimension per step), such that their spread gives the
+        standard error. Powers of two per sequence give the best uniformity.
+        """
+        shape = (size,) if np.isscalar(size) else tuple(size)
+        n = shape[0]
+        dims = int(np.prod(shape[1:]))
+        assert n % self.randomizations == 0, "Number of draws must be a multiple of the randomizations"
+
+        self.labels, self.counts = None, None
+        block = n // self.randomizations
+        uniforms = np.empty((n, dims))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            for b in range(self.randomizations):
+                engine = qmc.Sobol(d=dims, scramble=True, seed=np.random.randint(2 ** 31))
+                uniforms[b * block:(b + 1) * block] = engine.random(block)
+
+        np.clip(uniforms, 1e-16, 1 - 1e-16, out=uniforms)
+        return ndtri(uniforms).reshape(shape)
+
+    def mean(self, values):
+        """
+        Estimates the mean of the values computed from the last draw.
+        """
+        if self.labels is None:
+            return values.mean(dtype=np.float64)
+
+        # Stratum means weighted with the stratum probabilities
+        sums = np.bincount(self.labels, weights=values, minlength=self.strata)
+        filled = self.counts > 0
+        return np.sum(sums[filled] / self.counts[filled]) / self.strata
+
+    def std_error(self, values):
+        """
+        Estimates the standard error of the mean of the values computed from the last draw.
+        For Latin hypercube samples the plain (conservative) estimate is returned. Stratified
+        draws require at least two draws per stratum, the variance of a stratum with a
+        single draw can not be estimated.
+        """
+        # Scrambled sequences are independent, the draws within a sequence are not
+        if self.method == "sobol":
+            block_means = values.reshape(self.randomizations, -1).mean(axis=1, dtype=np.float64)
+            return block_means.std(ddof=1) / math.sqrt(self.randomizations)
+
+        # Pairs are independent, the draws within a pair are not
+        if self.antithetic:
+            half = values.size // 2
+            pairs = 0.5 * (values[:half] + values[half:])
+            return pairs.std(dtype=np.float64) / math.sqrt(half)
+
+        if self.labels is None:
+            return values.std(dtype=np.float64) / math.sqrt(values.size)
+
+        # Unbiased (ddof=1) within-stratum variances
+        assert self.counts.min() >= 2, \
+            "The standard error of stratified sampling requires at least two draws per stratum"
+        sums = np.bincount(self.labels, weights=values, minlength=self.strata)
+        squares = np.bincount(self.labels, weights=np.square(values, dtype=np.float64), minlength=self.strata)
+        means = sums / self.counts
+        variances = np.maximum(squares / self.counts - means ** 2, 0) * self.counts / (self.counts - 1)
+
+        return math.sqrt(np.sum(variances / self.counts) / self.strata ** 2)
+
+    def calibrate(self, values):
+        """
+        Sets the standard deviations per stratum for the Neyman allocation from the
+        values of a (pilot) draw.
+        """
+        assert self.labels is not None, "Calibration requires a stratified draw"
+        sums = np.bincount(self.labels, weights=values, minlength=self.strata)
+        squares = np.bincount(self.labels, weights=values ** 2, minlength=self.strata)
+        counts = np.maximum(self.counts, 1)
+
+        # Unbiased (ddof=1) variances, strata with a single draw get a zero variance
+        variances = np.maximum(squares / counts - (sums / counts) ** 2, 0) * counts / np.maximum(counts - 1, 1)
+        self.stds = np.sqrt(variances)
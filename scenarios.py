@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Scenario and stress-test engine that reprices a book of options under a
+grid of spot and volatility shocks from a single set of simulated normal numbers.
+"""
+
+import argparse
+import csv
+import json
+import math
+
+import numpy as np
+import scipy.stats as st
+
+from binomial_tree import BlackScholes
+
+CONTRACTS = ["european", "digital", "asian"]
+VOL_METHODS = ["rescale", "likelihood_ratio"]
+DEFAULT_BOOK = [
+    {"contract": "european", "option_type": "call", "K": 100, "quantity": 1},
+    {"contract": "european", "option_type": "put", "K": 90, "quantity": -2},
+    {"contract": "digital", "option_type": "call", "K": 110, "quantity": 10},
+]
+
+
+class ScenarioEngine:
+    """
+    Reprices books of options under grids of spot and volatility shocks on one set of
+    normal numbers. Spot shocks rescale the simulated prices exactly (geometric Brownian
+    motion is linear in S0). Volatility shocks either rebuild the prices from the stored
+    normal numbers with the shocked volatility (rescale), or keep the paths of the base
+    volatility and reweight them with the likelihood ratio of the shocked volatility
+    (likelihood_ratio). All scenarios share the random numbers, such that differences
+    between scenarios are estimated with little noise.
+
+    Attributes:
+        T (float): Maturity of the book in years.
+        S0 (float): Spot price.
+        r (float): Risk-free interest rate.
+        sigma (float): Base volatility.
+        steps (int): Number of time steps (averaging dates of Asian options).
+        vol_method (str): rescale or likelihood_ratio.
+        normals (np.array): Standard normal numbers with shape (paths, steps).
+    """
+
+    def __init__(
+        self, T, S0, r, sigma, steps=1, paths=100000, chunk_size=100000,
+        seed=None, vol_method="rescale", dtype=np.float64
+    ):
+        """
+        Draws the normal numbers of all scenarios.
+        """
+        assert vol_method in VOL_METHODS, f"Volatility method {vol_method} not found"
+        self.T = T
+        self.S0 = S0
+        self.r = r
+        self.sigma = sigma
+        self.steps = steps
+        self.chunk_size = chunk_size
+        self.vol_method = vol_method
+        self.dt = T / steps
+
+        if seed is not None:
+            np.random.seed(seed)
+        self.normals = np.random.normal(size=(paths, steps)).astype(dtype, copy=False)
+
+    def unit_paths(self, normals, sigma):
+        """
+        Terminal and average prices for a spot price of one.
+
+        Args:
+            normals (np.array): Normal numbers of a chunk with shape (paths, steps).
+            sigma (float): Volatility of the paths.
+
+        Returns:
+            tuple: Terminal prices and averages over t_1, ..., t_steps with shape (paths,).
+        """
+        log_paths = np.cumsum(normals * float(sigma * math.sqrt(self.dt)), axis=1)
+        log_paths += float((self.r - 0.5 * sigma ** 2) * self.dt) * np.arange(1, self.steps + 1)
+        np.exp(log_paths, out=log_paths)
+        return log_paths[:, -1], log_paths.mean(axis=1, dtype=np.float64)
+
+    def likelihood_ratio(self, normals, sigma):
+        """
+        Likelihood ratio of paths simulated with the base volatility under a shocked
+        volatility: the product of the ratios of the densities of all log increments.
+
+        Args:
+            normals (np.array): Normal numbers of a chunk with shape (paths, steps).
+            sigma (float): Shocked volatility.
+
+        Returns:
+            np.array: Weight of every path with shape (paths,).
+        """
+        ratio = self.sigma / sigma
+        shift = ((sigma ** 2 - self.sigma ** 2) / 2) * math.sqrt(self.dt) / sigma
+        shocked = normals * float(ratio) + float(shift)
+        log_weights = self.steps * math.log(ratio) + 0.5 * np.sum(normals ** 2 - shocked ** 2, axis=1, dtype=np.float64)
+        return np.exp(log_weights)
+
+    def reprice(self, book, spot_shocks=[0.0], vol_shocks=[0.0]):
+        """
+        Values a book under every combination of spot and volatility shocks.
+
+        Args:
+            book (list): Positions as dicts with contract (european, digital or asian),
+                option_type (call or put), strike K and quantity.
+            spot_shocks (list): Relative shocks of the spot price (0.1 is +10%).
+            vol_shocks (list): Absolute shocks of the volatility (0.05 is +5 vol points).
+
+        Returns:
+            list: One row (dict) per scenario with the book value, its standard error,
+            the profit against the unshocked book and its standard error, the effective
+            sample size and the closed form (if the book has no Asian options).
+        """
+        for position in book:
+            assert position["contract"] in CONTRACTS, f"Contract {position['contract']} not found"
+            assert position["option_type"] in ["call", "put"], "Non-existing option type."
+
+        spots = self.S0 * (1 + np.asarray(spot_shocks, dtype=np.float64))
+        shape = (len(vol_shocks), len(spots))
+        sums = {name: np.zeros(shape) for name in ["value", "value2", "pnl", "pnl2", "weight", "weight2"]}
+
+        paths = self.normals.shape[0]
+        for start in range(0, paths, self.chunk_size):
+            normals = self.normals[start:start + self.chunk_size]
+            base_terminal, base_average = self.unit_paths(normals, self.sigma)
+            base = self.book_values(book, np.array([self.S0]), base_terminal, base_average)[0]
+
+            for i, shock in enumerate(vol_shocks):
+                sigma = self.sigma + shock
+                assert sigma > 0, "Shocked volatility must be positive"
+
+                # Paths under the shocked volatility, or the base paths reweighted
+                weights = np.ones(normals.shape[0])
+                if self.vol_method == "rescale":
+                    terminal, average = self.unit_paths(normals, sigma)
+                else:
+                    terminal, average = base_terminal, base_average
+                    weights = self.likelihood_ratio(normals, sigma)
+
+                values = self.book_values(book, spots, terminal, average) * weights
+                pnl = values - base
+                sums["value"][i] += values.sum(axis=1)
+                sums["value2"][i] += (values ** 2).sum(axis=1)
+                sums["pnl"][i] += pnl.sum(axis=1)
+                sums["pnl2"][i] += (pnl ** 2).sum(axis=1)
+                sums["weight"][i] += weights.sum()
+                sums["weight2"][i] += (weights ** 2).sum()
+
+        discount = math.exp(-self.r * self.T)
+        rows = []
+        for i, vol_shock in enumerate(vol_shocks):
+            for j, spot_shock in enumerate(spot_shocks):
+                value = sums["value"][i, j] / paths
+                pnl = sums["pnl"][i, j] / paths
+                rows.append({
+                    "spot_shock": spot_shock,
+                    "vol_shock": vol_shock,
+                    "value": discount * value,
+                    "std_error": discount * math.sqrt(max(sums["value2"][i, j] / paths - value ** 2, 0) / paths),
+                    "pnl": discount * pnl,
+                    "pnl_std_error": discount * math.sqrt(max(sums["pnl2"][i, j] / paths - pnl ** 2, 0) / paths),
+                    "effective_paths": sums["weight"][i, j] ** 2 / sums["weight2"][i, j],
+                    "reference": closed_form(book, self.T, spots[j], self.r, self.sigma + vol_shock),
+                })
+
+        return rows
+
+    def book_values(self, book, spots, terminal, average):
+        """
+        Undiscounted book value of every path for every spot price.
+
+        Args:
+            book (list): Positions of the book.
+            spots (np.array): Spot prices of the scenarios.
+            terminal (np.array): Terminal prices for a spot price of one.
+            average (np.array): Average prices for a spot price of one.
+
+        Returns:
+            np.array: Book values with shape (spots, paths).
+        """
+        values = np.zeros((spots.size, terminal.size))
+        for position in book:
+            underlying = average if position["contract"] == "asian" else terminal
+            prices = spots[:, None] * underlying[None, :]
+            sign = 1 if position["option_type"] == "call" else -1
+            if position["contract"] == "digital":
+                payoffs = sign * (prices - position["K"]) > 0
+            else:
+                payoffs = np.maximum(sign * (prices - position["K"]), 0)
+            values += position["quantity"] * payoffs
+
+        return values
+
+
+def closed_form(book, T, S0, r, sigma):
+    """
+    Black Scholes value of a book of European and digital options (NaN for books
+    with Asian options).
+    """
+    value = 0.0
+    for position in book:
+        K, sign = position["K"], 1 if position["option_type"] == "call" else -1
+        if position["contract"] == "asian":
+            return float("nan")
+        elif position["contract"] == "digital":
+            d2 = (math.log(S0 / K) + (r - 0.5 * sigma ** 2) * T) / (sigma * math.sqrt(T))
+            price = math.exp(-r * T) * st.norm.cdf(sign * d2)
+        else:
+            bs = BlackScholes(T, S0, K, r, sigma)
+            price = bs.call_price() if sign == 1 else bs.put_price()
+        value += position["quantity"] * price
+
+    return value
+
+
+def print_table(rows):
+    """
+    Prints the scenario table.
+    """
+    header = f"{'spot':>7} {'vol':>7} {'value':>11} {'std error':>10} {'pnl':>11} {'pnl error':>10} {'reference':>11}"
+    print(header)
+    print("=" * len(header))
+    for row in rows:
+        print(f"{row['spot_shock']:>7.2f} {row['vol_shock']:>7.2f} {row['value']:>11.4f} {row['std_error']:>10.2e} "
+              f"{row['pnl']:>11.4f} {row['pnl_std_error']:>10.2e} {row['reference']:>11.4f}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Reprice a book of options under spot and volatility shocks.")
+    parser.add_argument("-book", type=str, default=None, help="JSON file with the positions (default: example book)")
+    parser.add_argument("-spot_shocks", type=float, nargs="+", default=[-0.2, -0.1, 0.0, 0.1, 0.2], help="Relative spot shocks")
+    parser.add_argument("-vol_shocks", type=float, nargs="+", default=[-0.05, 0.0, 0.05], help="Absolute volatility shocks")
+    parser.add_argument("-vol_method", type=str, default="rescale", help="rescale or likelihood_ratio")
+    parser.add_argument("-paths", type=int, default=100000, help="Number of paths (default: 100000)")
+    parser.add_argument("-steps", type=int, default=1, help="Number of time steps (default: 1)")
+    parser.add_argument("-output", type=str, default=None, help="CSV output file (optional)")
+    args = parser.parse_args()
+
+    book = DEFAULT_BOOK
+    if args.book:
+        with open(args.book) as f:
+            book = json.load(f)
+
+    engine = ScenarioEngine(1, 100, 0.06, 0.2, args.steps, args.paths, seed=10, vol_method=args.vol_method)
+    rows = engine.reprice(book, args.spot_shocks, args.vol_shocks)
+    print_table(rows)
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Author: Salifyanji Namwila
+Math 96: Mathematical Finance II
+05.13.2024
+Final Project
+Description: Sweeps over grids of option and simulation parameters, declared in a
+JSON or YAML file and priced in parallel on a pool of workers.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import time
+
+import numpy as np
+
+from accumulators import RunningCovariance
+from binomial_tree import BinTreeChain, BlackScholes
+from memory_planner import chain_bytes, engine_bytes, memory_budget
+from monte_carlo import MonteCarlo, Workspace
+from results_store import ResultsStore
+from samplers import NormalSampler
+
+GRID_KEYS = ["S0", "K", "sigma", "T", "r", "samples", "method", "contract", "option_type", "market", "steps"]
+METHODS = ["black_scholes", "binomial", "monte_carlo", "antithetic", "control_variate"]
+DEFAULTS = {
+    "S0": 100, "K": 99, "sigma": 0.2, "T": 1, "r": 0.06, "samples": 10000, "method": "monte_carlo",
+    "contract": "european", "option_type": "call", "market": "EU", "steps": 50, "seed": 10,
+    "chunk_size": 100000,
+}
+
+
+def load_grid(path):
+    """
+    Reads a grid from a JSON or (if PyYAML is installed) YAML file. Every parameter is
+    either a single value or a list of values to sweep over.
+    :param path: location of the grid file
+    :return: dict of the grid
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading YAML grids requires PyYAML, use a JSON grid instead")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def expand_grid(grid):
+    """
+    Expands a grid into tasks. Cells that only differ in the strike form one task,
+    such that all strikes are priced on the same random numbers.
+    :param grid: dict of single values or lists of values
+    :return: list of tasks (dicts with a list of strikes under K)
+    """
+    grid = {**DEFAULTS, **grid}
+    unknown = set(grid) - set(DEFAULTS)
+    assert not unknown, f"Unknown grid parameters: {sorted(unknown)}"
+    assert grid["chunk_size"] >= 2, "Chunks require at least two samples (one antithetic pair)"
+
+    axes = {key: grid[key] if isinstance(grid[key], list) else [grid[key]] for key in GRID_KEYS}
+    strikes = [float(K) for K in axes.pop("K")]
+
+    tasks = []
+    for values in itertools.product(*axes.values()):
+        task = dict(zip(axes.keys(), values))
+        assert task["method"] in METHODS, f"Method {task['method']} not found"
+        assert task["contract"] in ["european", "asian"], "Non-existing contract."
+        assert task["contract"] == "european" or task["method"] not in ["black_scholes", "binomial"], \
+            f"Method {task['method']} only prices European contracts"
+        assert task["market"] == "EU" or task["method"] == "binomial", "American options require the binomial method"
+        assert task["method"] != "antithetic" or task["samples"] % 2 == 0, \
+            "Antithetic tasks require an even number of samples"
+        task.update({"K": strikes, "seed": grid["seed"], "chunk_size": grid["chunk_size"]})
+        tasks.append(task)
+
+    return tasks
+
+
+def task_cost(task):
+    """
+    Rough amount of work of a task, used to schedule the largest tasks first.
+    """
+    strikes = len(task["K"])
+    if task["method"] == "black_scholes":
+        return strikes
+    elif task["method"] == "binomial":
+        return strikes * task["steps"] ** 2
+    steps = task["steps"] if task["contract"] == "asian" else 1
+    return task["samples"] * (steps + strikes)
+
+
+def task_memory(task):
+    """
+    Estimated peak memory of a task in bytes (sweeps simulate in float64).
+    """
+    if task["method"] == "black_scholes":
+        return 0
+    elif task["method"] == "binomial":
+        N = task["steps"] + 1 - task["steps"] % 2
+        return chain_bytes(N, len(task["K"]), "lr", np.float64)
+
+    # The paths (or terminal prices) of a chunk and the payoff samples of one strike
+    paths = min(task["chunk_size"], task["samples"])
+    if task["contract"] == "asian":
+        return paths * engine_bytes("path", task["steps"], np.float64)
+    return paths * engine_bytes("streaming", 1, np.float64)
+
+
+def price_closed_form(task):
+    """
+    Black Scholes prices of all strikes of a task.
+    """
+    prices = []
+    for K in task["K"]:
+        bs = BlackScholes(task["T"], task["S0"], K, task["r"], task["sigma"])
+        prices.append(bs.call_price() if task["option_type"] == "call" else bs.put_price())
+    return prices, [0.0] * len(prices)
+
+
+def price_binomial(task):
+    """
+    Leisen-Reimer tree prices of all strikes of a task in one batched induction, the
+    number of tree steps is steps (rounded up to an odd number, for which Leisen-Reimer
+    converges smoothly).
+    """
+    N = task["steps"] + 1 - task["steps"] % 2
+    chain = BinTreeChain(
+        N, task["T"], task["S0"], task["sigma"], task["r"], task["K"],
+        task["market"], task["option_type"], lattice="lr"
+    )
+    prices = chain.determine_price()[0].tolist()
+    return prices, [0.0] * len(prices)
+
+
+def price_monte_carlo(task):
+    """
+    Monte Carlo prices of all strikes of a task on shared random numbers. Antithetic
+    pairs are averaged before accumulating, the control variate uses the geometric
+    average (Asian) or the terminal stock price (European) as control.
+    """
+    np.random.seed(task["seed"])
+    T, S0, r, sigma = task["T"], task["S0"], task["r"], task["sigma"]
+    sign = 1 if task["option_type"] == "call" else -1
+    asian = task["contract"] == "asian"
+    antithetic = task["method"] == "antithetic"
+    control = task["method"] == "control_variate"
+    steps = task["steps"] if asian else 1
+    discount = math.exp(-r * T)
+
+    mc = MonteCarlo(steps, T, S0, sigma, r, task["K"][0])
+    sampler = NormalSampler(antithetic=antithetic)
+    accumulators = [RunningCovariance(2 if control else 1) for _ in task["K"]]
+    workspace = Workspace()
+
+    chunk_size = task["chunk_size"] - task["chunk_size"] % 2
+    for start in range(0, task["samples"], chunk_size):
+        n = min(chunk_size, task["samples"] - start)
+        z = sampler.draw((n, steps))
+        if asian:
+            paths = mc.euler_path_vectorized(z)
+            underlying = paths.mean(axis=1)
+            controls = np.exp(np.log(paths).mean(axis=1)) if control else None
+        else:
+            underlying = mc.euler_method_vectorized(z[:, 0], math.sqrt(T), out=workspace.get("prices", n))
+            controls = discount * underlying if control else None
+
+        for K, acc in zip(task["K"], accumulators):
+            samples = np.empty((n, 2 if control else 1))
+            samples[:, 0] = discount * np.maximum(sign * (underlying - K), 0)
+            if control:
+                samples[:, 1] = discount * np.maximum(sign * (controls - K), 0) if asian else controls
+
+            # Antithetic pairs are independent, the draws within a pair are not
+            if antithetic:
+                samples = 0.5 * (samples[:n // 2] + samples[n // 2:])
+            acc.update(samples)
+
+    prices, std_errors = [], []
+    for K, acc in zip(task["K"], accumulators):
+        expectations = []
+        if control and asian:
+            bs = BlackScholes(T, S0, K, r, sigma, steps)
+            expectations = [bs.asian_call_price() if sign == 1 else bs.asian_put_price()]
+        elif control:
+            expectations = [S0]
+        price, std_error, _ = acc.control_variate(expectations)
+        prices.append(float(price))
+        std_errors.append(std_error)
+
+    return prices, std_errors
+
+
+def run_task(task):
+    """
+    Prices a task and returns one result row per strike.
+    """
+    start = time.perf_counter()
+    if task["method"] == "black_scholes":
+        prices, std_errors = price_closed_form(task)
+    elif task["method"] == "binomial":
+        prices, std_errors = price_binomial(task)
+    else:
+        prices, std_errors = price_monte_carlo(task)
+    elapsed = time.perf_counter() - start
+
+    rows = []
+    for K, price, std_error in zip(task["K"], prices, std_errors):
+        reference = float("nan")
+        if task["contract"] == "european" and task["market"] == "EU":
+            bs = BlackScholes(task["T"], task["S0"], K, task["r"], task["sigma"])
+            reference = bs.call_price() if task["option_type"] == "call" else bs.put_price()
+
+        row = {key: task[key] for key in GRID_KEYS}
+        row.update({
+            "K": K, "price": price, "std_error": std_error, "reference": reference,
+            "error": price - reference, "time": elapsed / len(task["K"]),
+        })
+        rows.append(row)
+
+    return rows
+
+
+def run_sweep(grid, workers=1, output=None, store=None):
+    """
+    Prices every cell of a grid. Tasks are scheduled on a pool of workers with the
+    largest tasks first, such that no worker is left with a large task at the end.
+    :param grid: dict of the grid, or the location of a JSON or YAML grid file
+    :param workers: number of worker processes
+    :param output: CSV file to write the results table to (optional)
+    :param store: results store (SQLite file) to append the results to (optional)
+    :return: list of result rows in grid order
+    """
+    if isinstance(grid, str):
+        grid = load_grid(grid)
+    tasks = expand_grid(grid)
+    order = sorted(range(len(tasks)), key=lambda i: task_cost(tasks[i]), reverse=True)
+
+    # Fewer workers if every worker running one of the largest tasks does not fit in memory
+    largest = max(task_memory(task) for task in tasks)
+    if largest:
+        workers = max(1, min(workers, memory_budget() // largest))
+
+    results = [None] * len(tasks)
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            for i, rows in zip(order, pool.imap(run_task, [tasks[i] for i in order], chunksize=1)):
+                results[i] = rows
+    else:
+        for i in order:
+            results[i] = run_task(tasks[i])
+
+    rows = [row for task_rows in results for row in task_rows]
+    if output:
+        with open(output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    if store:
+        with ResultsStore(store) as results_store:
+            results_store.append([store_row(row, grid) for row in rows])
+
+    return rows
+
+
+def store_row(row, grid):
+    """
+    Converts a result row of the sweep to the columns of the results store.
+    """
+    stored = {key: row[key] for key in ["S0", "K", "sigma", "T", "r", "steps", "method", "contract",
+                                        "option_type", "market", "std_error", "reference", "error", "time"]}
+    monte_carlo = row["method"] not in ["black_scholes", "binomial"]
+    stored.update({
+        "experiment": "sweep", "estimate": row["price"],
+        "paths": row["samples"] if monte_carlo else None,
+        "sampler": ("antithetic" if row["method"] == "antithetic" else "random") if monte_carlo else None,
+        "seed": grid.get("seed", DEFAULTS["seed"]) if monte_carlo else None,
+    })
+    return stored
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Price a JSON or YAML grid of options in parallel.")
+    parser.add_argument("grid", type=str, help="JSON or YAML file with the grid")
+    parser.add_argument("-workers", type=int, default=multiprocessing.cpu_count(), help="Number of worker processes")
+    parser.add_argument("-output", type=str, default="sweep.csv", help="CSV output file (default: sweep.csv)")
+    parser.add_argument("-store", type=str, default=None, help="Results store to append the results to (optional)")
+    args = parser.parse_args()
+
+    rows = run_sweep(args.grid, args.workers, args.output, args.store)
+    print(f"Priced {len(rows)} grid cells, results written to {args.output}")